@@ -0,0 +1,223 @@
+import heapq
+import itertools
+from collections import Counter
+import numpy as np
+import pandas as pd
+
+# Columns every track table carries (extra columns such as 'added_at' are kept)
+TRACK_COLUMNS = ['name', 'artist_name', 'artists', 'artist_id', 'popularity', 'album_name', 'album_image_url']
+ARTIST_COLUMNS = ['id', 'name', 'genres', 'followers', 'image_url']
+
+
+def build_track_table(records):
+    """
+    Builds the columnar track table from compact track records, or straight
+    from the columns of a record_store.TrackList (no per-record dicts).
+    """
+    if hasattr(records, 'columns'):
+        tracks = pd.DataFrame(records.columns())
+    else:
+        tracks = pd.DataFrame.from_records(list(records))
+    for column in TRACK_COLUMNS:
+        if column not in tracks.columns:
+            tracks[column] = None
+    tracks['popularity'] = tracks['popularity'].fillna(0).astype(np.int64)
+    return tracks
+
+
+def build_artist_table(artist_details_map):
+    """Builds the artist table (one row per artist ID) from get_artist_details() output."""
+    rows = [{'id': aid, **details} for aid, details in artist_details_map.items() if details]
+    artists = pd.DataFrame.from_records(rows, columns=ARTIST_COLUMNS)
+    artists['followers'] = artists['followers'].fillna(0).astype(np.int64)
+    return artists
+
+
+def top_k_indices(values, k, largest=True):
+    """
+    Returns the indices of the k largest (or smallest) values, ordered, using a
+    partial selection instead of a full sort. Ties keep their original order.
+    """
+    values = np.asarray(values)
+    n = len(values)
+    if n == 0 or k <= 0:
+        return np.empty(0, dtype=np.intp)
+    keys = -values if largest else values
+    if n > k:
+        # Strictly better than the k-th value, then the earliest ties to fill up to k
+        kth = np.partition(keys, k - 1)[k - 1]
+        better = np.flatnonzero(keys < kth)
+        ties = np.flatnonzero(keys == kth)[:k - len(better)]
+        candidates = np.concatenate([better, ties])
+    else:
+        candidates = np.arange(n)
+    order = np.lexsort((candidates, keys[candidates]))
+    return candidates[order]
+
+
+def _bottom_k_nonzero(values, k):
+    """Bottom-k indices, skipping zeros when at least k non-zero values exist."""
+    nonzero = np.flatnonzero(values > 0)
+    if len(nonzero) >= k:
+        return nonzero[top_k_indices(values[nonzero], k, largest=False)]
+    return top_k_indices(values, k, largest=False)
+
+
+def count_genres(artist_ids, track_counts, artists):
+    """
+    Counts genres weighted by tracks: each genre of an artist gets that artist's
+    track count. Genres are exploded once per unique artist into categorical
+    codes and summed with a weighted bincount.
+    Returns (genre_names, genre_counts).
+    """
+    genre_lists = artists.set_index('id')['genres'].reindex(artist_ids)
+    genre_lists = [g if isinstance(g, list) else [] for g in genre_lists]
+    lengths = np.fromiter((len(g) for g in genre_lists), dtype=np.intp, count=len(genre_lists))
+    if lengths.sum() == 0:
+        return np.empty(0, dtype=object), np.empty(0, dtype=np.int64)
+    pair_artist = np.repeat(np.arange(len(genre_lists)), lengths)
+    flat_genres = np.array(list(itertools.chain.from_iterable(genre_lists)), dtype=object)
+    genre_codes, genre_names = pd.factorize(flat_genres)
+    counts = np.bincount(genre_codes, weights=track_counts[pair_artist], minlength=len(genre_names))
+    return np.asarray(genre_names, dtype=object), counts.astype(np.int64)
+
+
+def compute_collection_stats(tracks, artists, top_n=10, k=5):
+    """
+    Computes the statistics shown for liked songs and playlists from a track
+    table and an artist table:
+    top artists/genres by track count, unique artist/genre counts, most/least
+    popular tracks, most/least followed artists and average popularity.
+    """
+    stats = {
+        'total_tracks': int(len(tracks)),
+        'unique_artists': 0,
+        'unique_genres': 0,
+        'top_artists': [],
+        'top_genres': [],
+        'top_popular_tracks': [],
+        'bottom_popular_tracks': [],
+        'top_followed_artists': [],
+        'bottom_followed_artists': [],
+        'avg_popularity': 0,
+    }
+    if tracks.empty:
+        return stats
+
+    # Top artists by number of tracks (by primary artist name)
+    name_codes, names = pd.factorize(tracks['artist_name'])
+    name_counts = np.bincount(name_codes[name_codes >= 0], minlength=len(names))
+    top_names = top_k_indices(name_counts, top_n)
+    stats['top_artists'] = [{'artist': names[i], 'count': int(name_counts[i])} for i in top_names]
+
+    # Unique artists and genres, weighted by each artist's track count
+    artist_codes, artist_ids = pd.factorize(tracks['artist_id'])
+    stats['unique_artists'] = int(len(artist_ids))
+    track_counts = np.bincount(artist_codes[artist_codes >= 0], minlength=len(artist_ids))
+    genre_names, genre_counts = count_genres(artist_ids, track_counts, artists)
+    stats['unique_genres'] = int(np.count_nonzero(genre_counts))
+    stats['top_genres'] = [{'genre': genre_names[i], 'count': int(genre_counts[i])}
+                           for i in top_k_indices(genre_counts, top_n)]
+
+    # Tracks by popularity
+    popularity = tracks['popularity'].to_numpy()
+    stats['avg_popularity'] = int(round(popularity.mean()))
+    stats['top_popular_tracks'] = tracks.iloc[top_k_indices(popularity, k)].to_dict(orient='records')
+    stats['bottom_popular_tracks'] = tracks.iloc[_bottom_k_nonzero(popularity, k)].to_dict(orient='records')
+
+    # Artists by followers (only artists appearing in this collection)
+    collection_artists = artists[artists['id'].isin(artist_ids)].reset_index(drop=True)
+    stats.update(rank_followed_artists(collection_artists, k))
+    return stats
+
+
+def rank_followed_artists(artists, k=5):
+    """Returns the k most and least followed artists of an artist table."""
+    followers = artists['followers'].to_numpy()
+    return {
+        'top_followed_artists': artists.iloc[top_k_indices(followers, k)].to_dict(orient='records'),
+        'bottom_followed_artists': artists.iloc[_bottom_k_nonzero(followers, k)].to_dict(orient='records'),
+    }
+
+
+class StreamingCollectionStats:
+    """
+    Incremental counterpart of compute_collection_stats() for collections too
+    large to hold in memory. Feed it track records chunk by chunk with add();
+    it keeps only running artist counts, an artist-ID set and top/bottom-k
+    popularity heaps, so memory scales with unique artists, not with tracks.
+    result() produces the same dict as compute_collection_stats().
+    """
+
+    def __init__(self, top_n=10, k=5):
+        self.top_n = top_n
+        self.k = k
+        self.total_tracks = 0
+        self.popularity_sum = 0
+        self.nonzero_tracks = 0
+        self.name_counts = Counter()   # primary artist name -> tracks
+        self.artist_counts = Counter() # primary artist ID -> tracks (its keys are the artist-ID set)
+        # Heap entries carry the stream position so ties break like the batch version
+        self._top = []            # (popularity, -position, record): min-heap of the k most popular
+        self._bottom = []         # (-popularity, -position, record): max-heap of the k least popular
+        self._bottom_nonzero = [] # Same, restricted to popularity > 0
+
+    def add(self, records):
+        """Folds a chunk (e.g. one API page) of track records into the running stats."""
+        k = self.k
+        for record in records:
+            position = self.total_tracks
+            self.total_tracks += 1
+            popularity = record.get('popularity') or 0
+            self.popularity_sum += popularity
+            self.name_counts[record.get('artist_name')] += 1
+            if record.get('artist_id'):
+                self.artist_counts[record['artist_id']] += 1
+
+            _push_bounded(self._top, (popularity, -position, record), k)
+            _push_bounded(self._bottom, (-popularity, -position, record), k)
+            if popularity > 0:
+                self.nonzero_tracks += 1
+                _push_bounded(self._bottom_nonzero, (-popularity, -position, record), k)
+
+    def artist_ids(self):
+        """Returns the unique primary artist IDs seen so far."""
+        return list(self.artist_counts)
+
+    def result(self, artists):
+        """Finishes the stats using the artist table for genres and followers."""
+        stats = {
+            'total_tracks': self.total_tracks,
+            'unique_artists': len(self.artist_counts),
+            'unique_genres': 0,
+            'top_artists': [],
+            'top_genres': [],
+            'top_popular_tracks': [entry[2] for entry in sorted(self._top, reverse=True)],
+            'avg_popularity': int(round(self.popularity_sum / self.total_tracks)) if self.total_tracks else 0,
+        }
+        bottom = self._bottom_nonzero if self.nonzero_tracks >= self.k else self._bottom
+        stats['bottom_popular_tracks'] = [entry[2] for entry in sorted(bottom, reverse=True)]
+
+        names = list(self.name_counts)
+        name_counts = np.fromiter(self.name_counts.values(), dtype=np.int64, count=len(names))
+        stats['top_artists'] = [{'artist': names[i], 'count': int(name_counts[i])}
+                                for i in top_k_indices(name_counts, self.top_n)]
+
+        artist_ids = pd.Index(list(self.artist_counts), dtype=object)
+        track_counts = np.fromiter(self.artist_counts.values(), dtype=np.int64, count=len(artist_ids))
+        genre_names, genre_counts = count_genres(artist_ids, track_counts, artists)
+        stats['unique_genres'] = int(np.count_nonzero(genre_counts))
+        stats['top_genres'] = [{'genre': genre_names[i], 'count': int(genre_counts[i])}
+                               for i in top_k_indices(genre_counts, self.top_n)]
+
+        collection_artists = artists[artists['id'].isin(artist_ids)].reset_index(drop=True)
+        stats.update(rank_followed_artists(collection_artists, self.k))
+        return stats
+
+
+def _push_bounded(heap, entry, k):
+    """Pushes entry onto a min-heap, keeping only the k largest entries."""
+    if len(heap) < k:
+        heapq.heappush(heap, entry)
+    elif entry[:2] > heap[0][:2]:
+        heapq.heapreplace(heap, entry)
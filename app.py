@@ -1,9 +1,12 @@
+import time
+IMPORT_STARTED = time.perf_counter() # Cold-start import time is reported at the end of this module
+import hashlib
+import importlib
 import os
 import re
-import time
-import pandas as pd
-import numpy as np
-from flask import Flask, request, redirect, session, url_for, render_template, jsonify
+import sys
+import threading
+from flask import Flask, Response, request, redirect, session, url_for, render_template, jsonify
 from flask_session import Session 
 import spotipy
 from spotipy.oauth2 import SpotifyOAuth, SpotifyClientCredentials
@@ -11,6 +14,25 @@ from dotenv import load_dotenv
 from datetime import datetime, timedelta, time as dt_time
 from collections import Counter
 import logging
+from itertools import islice
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from spotify_fetch import (fetch_playlist_tracks, fetch_user_playlists, playlist_track_to_record, top_artist_to_record,
+                           top_track_to_record, primary_artist_ids, PLAYLIST_METADATA_FIELDS)
+from cache import create_cache
+from library_store import LibraryStore, sync_library
+from jobs import JobManager
+from artist_catalog import ArtistCatalog
+from genre_index import build_genre_index
+from listening_history import PlayLog, poll_recently_played
+from signature_store import SignatureStore
+from record_store import RecordStore
+from token_refresh import TokenRefresher
+from responses import cached_page, content_hash, json_response
+from exports import EXPORT_FORMATS, export_row_chunks, export_stream, parquet_available
+import metrics
+import spotify_client
+import session_store
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -22,24 +44,127 @@ load_dotenv()
 app = Flask(__name__)
 app.config['SECRET_KEY'] = os.getenv('FLASK_SECRET_KEY')
 # Configure server-side session (safer than client-side for tokens)
-app.config['SESSION_TYPE'] = 'filesystem' # Or use redis, memcached, etc.
+app.config['SESSION_BACKEND'] = os.getenv('SESSION_BACKEND', 'sqlite') # 'sqlite', 'memory', 'redis' or 'filesystem' (Flask-Session)
+app.config['SESSION_SQLITE_PATH'] = os.getenv('SESSION_SQLITE_PATH', os.path.join(app.instance_path, 'sessions.sqlite3'))
+app.config['SESSION_REDIS_URL'] = os.getenv('SESSION_REDIS_URL', 'redis://localhost:6379/0')
+app.config['SESSION_IDLE_TIMEOUT'] = int(os.getenv('SESSION_IDLE_TIMEOUT', 7 * 24 * 3600)) # Unused sessions expire after this
+app.config['SESSION_SWEEP_INTERVAL'] = int(os.getenv('SESSION_SWEEP_INTERVAL', 300)) # Seconds between expired-session sweeps
+app.config['SESSION_TYPE'] = 'filesystem' # Only used by the 'filesystem' backend
 app.config['SESSION_PERMANENT'] = False # Session expires when browser closes
-Session(app)
+# Max concurrent page requests when paging through large Spotify collections
+app.config['SPOTIFY_FETCH_WORKERS'] = int(os.getenv('SPOTIFY_FETCH_WORKERS', 8))
+# Shared Spotify HTTP session: pooled keep-alive connections, request pacing and 429 retries
+app.config['SPOTIFY_RATE_LIMIT'] = float(os.getenv('SPOTIFY_RATE_LIMIT', 10)) # Requests/second for the whole process
+app.config['SPOTIFY_RATE_BURST'] = int(os.getenv('SPOTIFY_RATE_BURST', 20))
+app.config['SPOTIFY_HTTP_POOL_SIZE'] = int(os.getenv('SPOTIFY_HTTP_POOL_SIZE', 32))
+app.config['SPOTIFY_MAX_RETRIES'] = int(os.getenv('SPOTIFY_MAX_RETRIES', 4))
+app.config['SPOTIFY_MAX_RETRY_WAIT'] = int(os.getenv('SPOTIFY_MAX_RETRY_WAIT', 60)) # Longer Retry-After values fail fast
+# Points the Web API client elsewhere, e.g. benchmarks/fake_spotify.py (never set in production)
+app.config['SPOTIFY_API_PREFIX'] = os.getenv('SPOTIFY_API_PREFIX') or None
+# Cache backend: 'memory' (per worker) or 'sqlite' (shared by all workers on the host)
+app.config['CACHE_BACKEND'] = os.getenv('CACHE_BACKEND', 'memory')
+app.config['CACHE_SQLITE_PATH'] = os.getenv('CACHE_SQLITE_PATH', os.path.join(app.instance_path, 'cache.sqlite3'))
+app.config['ARTIST_CACHE_MAX_ENTRIES'] = int(os.getenv('ARTIST_CACHE_MAX_ENTRIES', 20000))
+app.config['ARTIST_CACHE_TTL'] = int(os.getenv('ARTIST_CACHE_TTL', 24 * 3600)) # Follower counts go stale
+app.config['ARTIST_CACHE_NEGATIVE_TTL'] = int(os.getenv('ARTIST_CACHE_NEGATIVE_TTL', 300)) # Failed/missing artists
+app.config['ARTIST_CATALOG_WARMING'] = os.getenv('ARTIST_CATALOG_WARMING', '1') == '1' # Resolve artists while pages load
+# Background analysis jobs and their finished results
+app.config['JOB_WORKERS'] = int(os.getenv('JOB_WORKERS', 4))
+app.config['ANALYSIS_CACHE_MAX_ENTRIES'] = int(os.getenv('ANALYSIS_CACHE_MAX_ENTRIES', 1000))
+app.config['ANALYSIS_RESULT_TTL'] = int(os.getenv('ANALYSIS_RESULT_TTL', 600)) # Finished liked-songs analyses
+app.config['DASHBOARD_CACHE_MAX_ENTRIES'] = int(os.getenv('DASHBOARD_CACHE_MAX_ENTRIES', 3000))
+app.config['DASHBOARD_CACHE_TTL'] = int(os.getenv('DASHBOARD_CACHE_TTL', 300)) # Top items per (user, time range)
+app.config['PLAYLIST_CACHE_MAX_ENTRIES'] = int(os.getenv('PLAYLIST_CACHE_MAX_ENTRIES', 500))
+app.config['PLAYLIST_CACHE_TTL'] = int(os.getenv('PLAYLIST_CACHE_TTL', 6 * 3600)) # Bounds staleness of follower counts
+app.config['PLAYLIST_BATCH_MAX'] = int(os.getenv('PLAYLIST_BATCH_MAX', 25)) # Playlists per comparison
+app.config['PLAYLIST_BATCH_WORKERS'] = int(os.getenv('PLAYLIST_BATCH_WORKERS', 4)) # Playlists fetched at once
+# MinHash signatures of playlist versions for near-duplicate search
+app.config['SIGNATURE_DB_PATH'] = os.getenv('SIGNATURE_DB_PATH', os.path.join(app.instance_path, 'signatures.sqlite3'))
+app.config['DUPLICATE_THRESHOLD'] = float(os.getenv('DUPLICATE_THRESHOLD', 0.7)) # Min estimated track Jaccard
+app.config['DUPLICATE_MAX_PLAYLISTS'] = int(os.getenv('DUPLICATE_MAX_PLAYLISTS', 2000)) # Playlists scanned per user
+# Persisted per-user liked-songs snapshots, synced incrementally by added_at
+app.config['LIBRARY_DB_PATH'] = os.getenv('LIBRARY_DB_PATH', os.path.join(app.instance_path, 'library.sqlite3'))
+app.config['GENRE_INDEX_MAX_USERS'] = int(os.getenv('GENRE_INDEX_MAX_USERS', 500)) # Genre indexes kept per worker
+app.config['TIMELINE_MAX_USERS'] = int(os.getenv('TIMELINE_MAX_USERS', 500)) # Saves timelines kept per worker
+app.config['EXPORT_CHUNK_ROWS'] = int(os.getenv('EXPORT_CHUNK_ROWS', 5000)) # Rows in memory per export (= Parquet row group)
+app.config['LIBRARY_FULL_RESYNC_INTERVAL'] = int(os.getenv('LIBRARY_FULL_RESYNC_INTERVAL', 7 * 24 * 3600)) # Refreshes popularity etc.
+# Append-only per-user play logs fed from recently played
+app.config['HISTORY_DB_PATH'] = os.getenv('HISTORY_DB_PATH', os.path.join(app.instance_path, 'history.sqlite3'))
+app.config['HISTORY_POLL_INTERVAL'] = int(os.getenv('HISTORY_POLL_INTERVAL', 300)) # Min seconds between polls per user
+# Finished pages, re-rendered only when the data they show changes
+app.config['PAGE_CACHE_MAX_ENTRIES'] = int(os.getenv('PAGE_CACHE_MAX_ENTRIES', 500)) # Rendered pages kept per worker
+app.config['PAGE_CACHE_TTL'] = int(os.getenv('PAGE_CACHE_TTL', 3600))
+app.config['PLAYLIST_METADATA_TTL'] = int(os.getenv('PLAYLIST_METADATA_TTL', 60)) # New playlist versions show up within this
+app.config['TOKEN_REFRESH_MARGIN'] = int(os.getenv('TOKEN_REFRESH_MARGIN', 60)) # Requests wait for a refresh below this
+app.config['TOKEN_PROACTIVE_REFRESH'] = int(os.getenv('TOKEN_PROACTIVE_REFRESH', 600)) # Background refresh below this
+# 1: pandas/numpy (analytics) are imported on first use, so workers boot fast and
+# routes like /login_page never pay for them. 0: create_app() imports them up
+# front, which lets a pre-forking server (gunicorn --preload) share them with workers
+app.config['LAZY_IMPORTS'] = os.getenv('LAZY_IMPORTS', '1') == '1'
+# Instrumentation: Prometheus-format /metrics (optionally bearer-protected) and a
+# per-request Server-Timing breakdown header when SERVER_TIMING=1
+app.config['METRICS_TOKEN'] = os.getenv('METRICS_TOKEN', '')
+app.config['SERVER_TIMING'] = os.getenv('SERVER_TIMING', '0') == '1'
+if app.config['SESSION_BACKEND'] == 'filesystem':
+    Session(app)
+else:
+    # Only the login state lives in the session; analyses live in the caches and stores
+    session_store.init_app(app, persist_keys=('token_info', 'user_profile'))
+metrics.init_app(app)
+spotify_client.configure(rate=app.config['SPOTIFY_RATE_LIMIT'],
+                         burst=app.config['SPOTIFY_RATE_BURST'],
+                         pool_size=app.config['SPOTIFY_HTTP_POOL_SIZE'],
+                         max_retries=app.config['SPOTIFY_MAX_RETRIES'],
+                         max_wait=app.config['SPOTIFY_MAX_RETRY_WAIT'],
+                         api_prefix=app.config['SPOTIFY_API_PREFIX'])
 
 # Spotify API Scopes (Permissions your app needs)
 # Adjust scopes based on the data you need
 SCOPES = 'user-read-recently-played user-library-read user-top-read'
 
-# --- Create App-Level Spotify Client (Client Credentials Flow) ---
-try:
-    client_credentials_manager = SpotifyClientCredentials(client_id=os.getenv('SPOTIPY_CLIENT_ID'),
-                                                          client_secret=os.getenv('SPOTIPY_CLIENT_SECRET'))
-    # This client authenticates the app itself, not a user
-    sp_app = spotipy.Spotify(client_credentials_manager=client_credentials_manager)
-    logging.info("Created app-level Spotify client (Client Credentials Flow).")
-except Exception as e:
-    sp_app = None # Set to None if creation fails
-    logging.error(f"Failed to create app-level Spotify client: {e}")
+# --- App-Level Spotify Client (Client Credentials Flow) ---
+sp_app = None
+sp_app_failed = False # Creation only fails on missing credentials, so it is not retried
+sp_app_lock = threading.Lock()
+
+def get_app_spotify_client():
+    """Returns the app-level client, creating it on first use; None if that fails."""
+    global sp_app, sp_app_failed
+    if sp_app is None and not sp_app_failed:
+        with sp_app_lock:
+            if sp_app is None and not sp_app_failed:
+                try:
+                    client_credentials_manager = SpotifyClientCredentials(client_id=os.getenv('SPOTIPY_CLIENT_ID'),
+                                                                          client_secret=os.getenv('SPOTIPY_CLIENT_SECRET'))
+                    # This client authenticates the app itself, not a user
+                    sp_app = spotify_client.make_client(client_credentials_manager=client_credentials_manager)
+                    logging.info("Created app-level Spotify client (Client Credentials Flow).")
+                except Exception as e:
+                    sp_app_failed = True
+                    logging.error(f"Failed to create app-level Spotify client: {e}")
+    return sp_app
+
+def import_deferred(module_name):
+    """Returns a module that needs pandas/numpy, importing it on first use."""
+    if module_name not in sys.modules:
+        start = time.perf_counter()
+        importlib.import_module(module_name)
+        seconds = time.perf_counter() - start
+        metrics.record_startup(f'import_{module_name}', seconds)
+        logging.info(f"Imported {module_name} in {seconds * 1000:.0f} ms.")
+    return sys.modules[module_name]
+
+def import_analytics():
+    return import_deferred('analytics')
+
+def import_timeline():
+    return import_deferred('timeline')
+
+def import_playlist_compare():
+    return import_deferred('playlist_compare')
+
+def import_similarity():
+    return import_deferred('similarity')
 
 # --- Authentication Routes ---
 
@@ -62,6 +187,17 @@ def set_token_info(token_info):
     session['token_info'] = token_info
     session.modified = True # Ensure session is saved
 
+# One refresh per grant at a time; refreshed tokens are shared through the cache
+token_cache = create_cache('refreshed_tokens',
+                           backend=app.config['CACHE_BACKEND'],
+                           path=app.config['CACHE_SQLITE_PATH'],
+                           max_entries=10000,
+                           ttl=3600)
+token_refresher = TokenRefresher(lambda refresh_token: get_spotify_oauth().refresh_access_token(refresh_token),
+                                 token_cache,
+                                 margin=app.config['TOKEN_REFRESH_MARGIN'],
+                                 proactive_margin=app.config['TOKEN_PROACTIVE_REFRESH'])
+
 def create_spotify_client():
     """Creates a Spotipy client with the current user's token."""
     token_info = get_token_info()
@@ -69,24 +205,35 @@ def create_spotify_client():
         logging.warning("No token info found in session.")
         return None # Or raise an exception/redirect to login
 
-    # Check if token is expired and refresh if needed
-    now = int(time.time())
-    is_expired = token_info.get('expires_at', 0) - now < 60 # Refresh if expires in < 60 secs
-
-    if is_expired:
-        logging.info("Token expired, attempting refresh.")
-        sp_oauth = get_spotify_oauth()
-        try:
-            token_info = sp_oauth.refresh_access_token(token_info.get('refresh_token'))
-            set_token_info(token_info)
-            logging.info("Token refreshed successfully.")
-        except Exception as e:
-            logging.error(f"Error refreshing token: {e}")
-            # Clear potentially invalid token and force re-login
-            session.pop('token_info', None)
-            return None
+    # Refreshes synchronously only when the token is about to expire; earlier,
+    # a background refresh runs and later requests pick up its result here
+    try:
+        fresh_token_info = token_refresher.get_valid_token(token_info)
+    except Exception as e:
+        logging.error(f"Error refreshing token: {e}")
+        # Clear potentially invalid token and force re-login
+        session.pop('token_info', None)
+        return None
+    if fresh_token_info is not token_info:
+        token_info = fresh_token_info
+        set_token_info(token_info)
+
+    # Cheap to create: every client shares the pooled, rate-limited session
+    return spotify_client.make_client(auth=token_info.get('access_token'))
+
+def remember_user_profile(user_info):
+    """Keeps the parts of the user's profile the pages need in the session."""
+    profile = {'id': user_info['id'], 'display_name': user_info.get('display_name') or 'User'}
+    session['user_profile'] = profile
+    session.modified = True
+    return profile
 
-    return spotipy.Spotify(auth=token_info.get('access_token'))
+def get_user_profile(sp):
+    """Returns the current user's {'id', 'display_name'}, calling the API only once per session."""
+    profile = session.get('user_profile')
+    if profile is None:
+        profile = remember_user_profile(sp.current_user())
+    return profile
 
 @app.route('/')
 def home():
@@ -148,6 +295,158 @@ def logout():
     # <<< Redirect to the login page with a confirmation message >>>
     return redirect(url_for('login_page', message="You have been successfully logged out."))
 
+# --- Shared Records ---
+# Tracks, artists and albums held by cached playlists and top-item lists are interned
+# here once per process, however many users' caches refer to them (see record_store.py)
+record_store = RecordStore()
+metrics.register_collector(lambda: [('record_store_records', {'kind': kind}, count)
+                                    for kind, count in record_store.stats().items()])
+
+# --- Rendered Pages ---
+# Finished dashboard, liked-songs and playlist pages per user. Each is stored with
+# a version hashed from the content hashes of the data it shows, so a reload of
+# unchanged data skips rendering (or gets a 304), and refreshed data re-renders
+rendered_pages = create_cache('rendered_pages',
+                              backend='memory',
+                              max_entries=app.config['PAGE_CACHE_MAX_ENTRIES'],
+                              ttl=app.config['PAGE_CACHE_TTL'])
+
+# --- Dashboard data ---
+TIME_RANGES = ['short_term', 'medium_term', 'long_term']
+TOP_ITEMS_LIMIT = 50 # How many top items to fetch (adjust as needed)
+
+# Top artists/tracks (projected to the fields we show) per (user, time range); short TTL
+dashboard_cache = create_cache('dashboard_top_items',
+                               backend=app.config['CACHE_BACKEND'],
+                               path=app.config['CACHE_SQLITE_PATH'],
+                               max_entries=app.config['DASHBOARD_CACHE_MAX_ENTRIES'],
+                               ttl=app.config['DASHBOARD_CACHE_TTL'])
+
+def fetch_top_items(sp, time_range, executor):
+    """Starts the top artists and top tracks requests on executor; returns both futures."""
+    return (executor.submit(sp.current_user_top_artists, time_range=time_range, limit=TOP_ITEMS_LIMIT),
+            executor.submit(sp.current_user_top_tracks, time_range=time_range, limit=TOP_ITEMS_LIMIT))
+
+def top_items_from_results(artists_results, tracks_results):
+    """
+    Projects the raw top artists/tracks responses onto compact records. The
+    full top-artist objects go into the artist catalog, and the artists of the
+    top tracks are queued for warming.
+    """
+    artist_catalog.add(artists_results.get('items', []))
+    warm_artists(0, tracks_results.get('items', []))
+    top_items = {'artists': record_store.add_artists(top_artist_to_record(a) for a in artists_results.get('items', []) if a),
+                 'tracks': record_store.add_tracks(top_track_to_record(t) for t in tracks_results.get('items', []) if t)}
+    top_items['content_hash'] = content_hash(top_items) # Versions the rendered dashboard
+    return top_items
+
+def prefetch_top_items(job, sp, user_id, time_range):
+    """Background job: warms the dashboard cache for a time range the user has not opened yet."""
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        artists_future, tracks_future = fetch_top_items(sp, time_range, executor)
+        top_items = top_items_from_results(artists_future.result(), tracks_future.result())
+    dashboard_cache.set(f"{user_id}:{time_range}", top_items)
+
+def get_top_items(sp, time_range):
+    """
+    Returns (profile, top_items) for the current user and time range, from the
+    dashboard cache when possible. On a miss the profile (first visit only), top
+    artists and top tracks are requested concurrently, and the other time ranges
+    are prefetched in the background.
+    """
+    profile = session.get('user_profile')
+    top_items = dashboard_cache.get(f"{profile['id']}:{time_range}", None) if profile else None
+    if top_items is not None:
+        return profile, top_items
+
+    # Latency is that of the slowest call rather than the sum
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        profile_future = executor.submit(sp.current_user) if profile is None else None
+        artists_future, tracks_future = fetch_top_items(sp, time_range, executor)
+        if profile_future:
+            profile = remember_user_profile(profile_future.result())
+        top_items = top_items_from_results(artists_future.result(), tracks_future.result())
+    dashboard_cache.set(f"{profile['id']}:{time_range}", top_items)
+
+    # Warm the other time ranges so switching tabs is instant
+    other_ranges = [other for other in TIME_RANGES if other != time_range]
+    cached = dashboard_cache.get_many(f"{profile['id']}:{other}" for other in other_ranges)
+    for other in other_ranges:
+        key = f"{profile['id']}:{other}"
+        if key not in cached:
+            job_manager.submit(f"dashboard:{key}", prefetch_top_items, sp, profile['id'], other)
+    return profile, top_items
+
+def build_dashboard_viz_data(top_items):
+    """Derives the dashboard charts and tables from the user's top artists and tracks."""
+    top_artists = top_items['artists']
+    top_tracks = top_items['tracks']
+
+    # --- Calculate Artist Counts from Top Tracks ---
+    artist_track_counts = Counter()
+    for track in top_tracks:
+        # Count based on the primary artist of the track
+        primary_artist_id = track.get('artist_id')
+        if primary_artist_id:
+            artist_track_counts[primary_artist_id] += 1
+
+    # --- Prepare Top Artists data for Chart ---
+    # Use artists from the top_artists list, but add their count from top_tracks
+    top_artists_for_chart = []
+    displayed_artist_ids = set() # Avoid duplicates if limit > 50 somehow allows it
+    for artist in top_artists:
+        if artist['id'] and artist['id'] not in displayed_artist_ids:
+            artist_id = artist['id']
+            top_artists_for_chart.append({
+                'id': artist_id,
+                'name': artist['name'],
+                'track_count': artist_track_counts.get(artist_id, 0),
+                'image_url': artist['image_url'],
+                'genres': artist['genres']
+            })
+            displayed_artist_ids.add(artist_id)
+
+    # Sort artists for chart by track_count (descending) and take top 10
+    top_artists_for_chart.sort(key=lambda x: x['track_count'], reverse=True)
+    top_artists_for_chart = top_artists_for_chart[:10] # <<< LIMIT TO 10 HERE
+
+    # --- Prepare Top Tracks data for List (Limit to Top 10) ---
+    top_tracks_for_list = [{
+        'id': track['id'],
+        'name': track['name'],
+        'artists': list(track['artists']), # List of artist names
+        'album': track['album_name'],
+        'image_url': track['image_url']
+    } for track in top_tracks[:10]] # <<< LIMIT TO 10 HERE
+
+    # --- Derive Top Genres from Top Artists ---
+    genre_counts = Counter()
+    for artist in top_artists:
+        for genre in artist['genres']:
+            if genre:
+                genre_counts[genre] += 1
+
+    # Get the top N genres (e.g., top 10)
+    top_genres = genre_counts.most_common(10)
+
+    return {
+        "artists_chart": top_artists_for_chart, # Data specifically for artist chart
+        "tracks_chart": top_tracks_for_list,    # Data specifically for track list
+        "genres_chart": top_genres,             # Data for genre chart
+        "artists_raw": top_artists,             # Compact artist list for table
+        "tracks_raw": top_tracks                # Compact track list for table
+    }
+
+def render_dashboard(username, top_items, time_range):
+    with metrics.span('dashboard_data'):
+        viz_data = build_dashboard_viz_data(top_items)
+
+    # Charts load their (compact) data from the JSON API; the tables are rendered here
+    return render_template('dashboard.html',
+                           username=username,
+                           viz_data=viz_data,
+                           selected_time_range=time_range) # Pass range back to template
+
 # --- UPDATED Dashboard Route ---
 @app.route('/dashboard')
 def dashboard():
@@ -158,98 +457,20 @@ def dashboard():
     # Get selected time range from query param, default to medium_term
     time_range = request.args.get('time_range', 'medium_term')
     # Validate time_range
-    if time_range not in ['short_term', 'medium_term', 'long_term']:
+    if time_range not in TIME_RANGES:
         time_range = 'medium_term' # Default to medium if invalid value passed
 
+    profile = session.get('user_profile')
+    username = profile['display_name'] if profile else 'User'
     try:
-        user_info = sp.current_user()
-        username = user_info.get('display_name', 'User')
-
-        # --- Fetch Top Data from Spotify ---
-        limit = 50 # How many top items to fetch (adjust as needed)
-
-        # Fetch Top Artists
-        top_artists_results = sp.current_user_top_artists(time_range=time_range, limit=limit)
-        top_artists_raw = top_artists_results.get('items', [])
-
-        # Fetch Top Tracks
-        top_tracks_results = sp.current_user_top_tracks(time_range=time_range, limit=limit)
-        top_tracks_raw = top_tracks_results.get('items', [])
-
-                # --- Calculate Artist Counts from Top Tracks ---
-        artist_track_counts = Counter()
-        if top_tracks_raw:
-            for track in top_tracks_raw:
-                if track and track.get('artists'):
-                    # Count based on the primary artist of the track
-                    primary_artist_id = track['artists'][0]['id']
-                    if primary_artist_id:
-                        artist_track_counts[primary_artist_id] += 1
-
-        # --- Prepare Top Artists data for Chart ---
-        # Use artists from the top_artists list, but add their count from top_tracks
-        top_artists_for_chart = []
-        displayed_artist_ids = set() # Avoid duplicates if limit > 50 somehow allows it
-        if top_artists_raw:
-            for artist in top_artists_raw:
-                if artist and artist.get('id') and artist['id'] not in displayed_artist_ids:
-                    artist_id = artist['id']
-                    top_artists_for_chart.append({
-                        'id': artist_id,
-                        'name': artist.get('name', 'N/A'),
-                        'track_count': artist_track_counts.get(artist_id, 0),
-                        'image_url': artist['images'][0]['url'] if artist.get('images') else None,
-                        'genres': artist.get('genres', [])
-                    })
-                    displayed_artist_ids.add(artist_id)
-
-        # Sort artists for chart by track_count (descending) and take top 10
-        top_artists_for_chart.sort(key=lambda x: x['track_count'], reverse=True)
-        top_artists_for_chart = top_artists_for_chart[:10] # <<< LIMIT TO 10 HERE
-
-        # --- Prepare Top Tracks data for List (Limit to Top 10) ---
-        top_tracks_for_list = [] # Renamed variable for clarity
-        if top_tracks_raw:
-            for i, track in enumerate(top_tracks_raw[:10]): # <<< LIMIT TO 10 HERE
-                if track:
-                    primary_artist_names = [a.get('name', 'N/A') for a in track.get('artists', [])]
-                    album_images = track.get('album', {}).get('images', [])
-                    image_url = album_images[0]['url'] if album_images else None # Get largest image URL
-
-                    top_tracks_for_list.append({ # Renamed variable
-                        'id': track.get('id'),
-                        'name': track.get('name', 'N/A'),
-                        'artists': primary_artist_names, # List of artist names
-                        'album': track.get('album', {}).get('name', 'N/A'),
-                        'image_url': image_url # <<< Ensure image URL is included
-                    })
-
-        # --- Derive Top Genres from Top Artists ---
-        genre_counts = Counter()
-        if top_artists_raw:
-            for artist in top_artists_raw:
-                genres = artist.get('genres', [])
-                if genres:
-                    for genre in genres:
-                        if genre:
-                            genre_counts[genre] += 1
-
-        # Get the top N genres (e.g., top 10)
-        top_genres = genre_counts.most_common(10)
-
-        # --- Final Data for Template ---
-        viz_data = {
-            "artists_chart": top_artists_for_chart, # Data specifically for artist chart
-            "tracks_chart": top_tracks_for_list,    # Data specifically for track list
-            "genres_chart": top_genres,             # Data for genre chart
-            "artists_raw": top_artists_raw,         # Full raw artist list for table
-            "tracks_raw": top_tracks_raw            # Full raw track list for table
-        }
-
-        return render_template('dashboard.html',
-                               username=username,
-                               viz_data=viz_data,
-                               selected_time_range=time_range) # Pass range back to template
+        with metrics.span('top_items'):
+            profile, top_items = get_top_items(sp, time_range)
+        username = profile['display_name']
+        schedule_history_poll(sp, profile['id'])
+        # Re-rendered only when the top items (or the name shown) changed
+        return cached_page(rendered_pages, f"{profile['id']}:dashboard:{time_range}",
+                           [top_items.get('content_hash'), username],
+                           partial(render_dashboard, username, top_items, time_range))
 
     except spotipy.SpotifyException as e:
         logging.error(f"Spotify API Error on /dashboard: {e}")
@@ -264,197 +485,257 @@ def dashboard():
         return render_template('dashboard.html', username=username, error="An unexpected error occurred.", selected_time_range=time_range)
     
 # --- Helper function to get artist details ---
-# Simple in-memory cache for artist details
-memoized_artist_details = {}
-
-def get_artist_details(sp_client, artist_ids):
+# Shared artist-details cache: LRU-capped, with a short TTL for failed/missing
+# artists so they are retried, and optionally backed by SQLite for all workers.
+artist_cache = create_cache('artist_details',
+                            backend=app.config['CACHE_BACKEND'],
+                            path=app.config['CACHE_SQLITE_PATH'],
+                            max_entries=app.config['ARTIST_CACHE_MAX_ENTRIES'],
+                            ttl=app.config['ARTIST_CACHE_TTL'])
+
+# Shared by all users; lookups use the app-level client instead of the user's token
+artist_catalog = ArtistCatalog(artist_cache, get_app_spotify_client,
+                               negative_ttl=app.config['ARTIST_CACHE_NEGATIVE_TTL'])
+metrics.register_collector(lambda: [('artist_catalog_pending', {}, artist_catalog.pending())])
+
+def warm_artists(offset, items):
+    """Page callback: queues the primary artists of saved-track or playlist items for the catalog."""
+    if app.config['ARTIST_CATALOG_WARMING']:
+        artist_catalog.warm(primary_artist_ids(items))
+
+def get_artist_details(sp_client, artist_ids, progress=None):
     """
     Fetches name, genres, followers, and image URL for a list of artist IDs.
-    Uses a simple cache. Returns a dictionary mapping ID to details.
-    """
-    details_map = {}
-    # Ensure IDs are unique and not None before checking cache/fetching
-    unique_ids = list(filter(None, set(artist_ids)))
-    ids_to_fetch = [aid for aid in unique_ids if aid not in memoized_artist_details]
-    logging.info(f"Need to fetch details for {len(ids_to_fetch)} artists.")
-
-    # Fetch in batches of 50 (API limit)
-    for i in range(0, len(ids_to_fetch), 50):
-        batch_ids = ids_to_fetch[i:i+50]
-        logging.info(f"Fetching batch {i//50 + 1}: {batch_ids}")
-        try:
-            artists_info = sp_client.artists(batch_ids)
-            for artist_data in artists_info['artists']:
-                if artist_data: # Check if artist info was found
-                    artist_id = artist_data['id']
-                    memoized_artist_details[artist_id] = {
-                        'name': artist_data.get('name', 'N/A'),
-                        'genres': artist_data.get('genres', []),
-                        'followers': artist_data.get('followers', {}).get('total', 0),
-                        'image_url': artist_data['images'][0]['url'] if artist_data.get('images') else None
-                    }
-                # Optional: Handle case where API returns None for a requested ID within the batch
-                # You might store a specific marker for 'not found' IDs in the cache
-        except spotipy.SpotifyException as e:
-            logging.error(f"Spotify API error fetching artist batch {batch_ids}: {e}")
-            # Cache failure for these IDs to avoid constant retries in this request
-            for aid in batch_ids:
-                 memoized_artist_details[aid] = None # Mark as failed/unavailable
-        except Exception as e:
-             logging.error(f"Non-Spotify error fetching artist batch {batch_ids}: {e}")
-             for aid in batch_ids:
-                 memoized_artist_details[aid] = None # Mark as failed/unavailable
-        # time.sleep(0.1) # Optional delay between batches
+    Uses the shared artist catalog; sp_client is only used if the app-level
+    client cannot be. Returns a dictionary mapping ID to details.
+    progress (a jobs.Job) gets 'artists_total'/'artists_resolved' updates.
+    """
+    known = artist_catalog.resolve(artist_ids, fallback_client=sp_client, progress=progress)
 
     # Populate the final map from cache or fetched details
     default_details = {'name': 'N/A', 'genres': [], 'followers': 0, 'image_url': None}
-    for artist_id in unique_ids:
-         # Use cached detail if valid, otherwise use default
-         details_map[artist_id] = memoized_artist_details.get(artist_id) or default_details
+    details_map = {artist_id: details or default_details for artist_id, details in known.items()}
 
+    logging.info(f"Artist cache stats: {artist_cache.stats()}")
     return details_map
 
-# --- Route and Logic for Liked Songs Page ---
-@app.route('/liked_songs')
-def liked_songs_page():
-    sp = create_spotify_client()
-    if not sp:
-        return redirect(url_for('login'))
-    try:
-        user_info = sp.current_user()
-        username = user_info.get('display_name', 'User')
-
-        # Fetch ALL liked songs (handles pagination)
-        all_tracks_items = []
-        limit = 50
-        offset = 0
-        logging.info("Starting fetch for all liked songs...")
-        while True:
-            try:
-                results = sp.current_user_saved_tracks(limit=limit, offset=offset)
-                items = results.get('items', [])
-                if not items:
-                    logging.info("No more liked songs found.")
-                    break # No more tracks
-                all_tracks_items.extend(items)
-                logging.info(f"Fetched {len(items)} liked songs, total so far: {len(all_tracks_items)}")
-                offset += len(items)
-                if len(items) < limit: # Optimization: break if last page fetched
-                    break
-                # Optional: Add a small delay to avoid hitting rate limits too hard on many pages
-                # time.sleep(0.1)
-            except spotipy.SpotifyException as e:
-                 logging.error(f"Spotify API Error fetching saved tracks (offset {offset}): {e}")
-                 # Decide how to handle partial failure - maybe return partial data or an error
-                 return render_template('liked_songs.html', username=username, error=f"Failed to fetch all liked songs: {e.msg}")
-            except Exception as e:
-                 logging.error(f"Non-Spotify Error fetching saved tracks (offset {offset}): {e}")
-                 return render_template('liked_songs.html', username=username, error="An unexpected error occurred while fetching liked songs.")
-
-        logging.info(f"Total liked songs fetched: {len(all_tracks_items)}")
-        num_liked_tracks = len(all_tracks_items)
-
-        if not all_tracks_items:
-             return render_template('liked_songs.html', username=username, message="No liked songs found.")        
-
-        # --- Process Liked Songs Data ---
-        data = []
-        liked_artist_ids = set()
-        for item in all_tracks_items:
-            track = item.get('track')
-            added_at_str = item.get('added_at')
-            if not track or not track.get('id'): continue # Skip if track data or ID is missing
-
-            primary_artist = track['artists'][0] if track.get('artists') else None
-            artist_id = primary_artist['id'] if primary_artist and primary_artist.get('id') else None
-            artist_name = primary_artist['name'] if primary_artist else 'N/A'
-
-            if artist_id: # Only collect valid artist IDs
-                liked_artist_ids.add(artist_id)
-
-            data.append({
-                # 'added_at': datetime.fromisoformat(added_at_str.replace('Z', '+00:00')) if added_at_str else None, # Parsing date if needed
-                'name': track.get('name', 'N/A'),
-                'track_id': track.get('id'),
-                'artist_name': artist_name,
-                'artists': [a.get('name', 'N/A') for a in track.get('artists', [])],
-                'artist_id': artist_id, # Store ID for genre fetching
-                'popularity': track.get('popularity', 0), # <<< Extract popularity
-                'album_name': track.get('album', {}).get('name', 'N/A'),
-                'album_image_url': track.get('album', {}).get('images', [{}])[0].get('url') if track.get('album', {}).get('images') else None
-            })
-
-        num_unique_artists = len(liked_artist_ids)
-
-        df_liked = pd.DataFrame(data)
-        # --- Calculate Top 10 Artists by Liked Songs ---
-        top_artists_liked = df_liked['artist_name'].value_counts().head(10).reset_index()
-        top_artists_liked.columns = ['artist', 'count']
-        # Get image for top artists (requires matching back to original data or another call - simplified here)
+# --- Background Jobs ---
+# Long analyses run on this pool; pages poll /jobs/<id> and render from analysis_cache
+job_manager = JobManager(max_workers=app.config['JOB_WORKERS'])
+analysis_cache = create_cache('analysis_results',
+                              backend=app.config['CACHE_BACKEND'],
+                              path=app.config['CACHE_SQLITE_PATH'],
+                              max_entries=app.config['ANALYSIS_CACHE_MAX_ENTRIES'],
+                              ttl=app.config['ANALYSIS_RESULT_TTL'])
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    if not get_token_info():
+        return jsonify({'error': 'Not logged in.'}), 401
+    job = job_manager.get(job_id)
+    if job is None:
+        # Unknown here (expired, or started by another worker): the page just reloads
+        return jsonify({'id': job_id, 'status': 'unknown'}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus scrape endpoint (values are per worker process)."""
+    token = app.config['METRICS_TOKEN']
+    if token and request.headers.get('Authorization') != f"Bearer {token}":
+        return Response("Unauthorized\n", status=401, mimetype='text/plain')
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
 
+# --- Route and Logic for Liked Songs Page ---
+library_store = LibraryStore(app.config['LIBRARY_DB_PATH'])
+# Per-user genre -> artists -> tracks indexes of the stored library (objects, so always in memory)
+genre_indexes = create_cache('genre_index',
+                             backend='memory',
+                             max_entries=app.config['GENRE_INDEX_MAX_USERS'],
+                             ttl=app.config['LIBRARY_FULL_RESYNC_INTERVAL'])
+
+def genre_index_artists(fallback_client=None):
+    """Returns a lookup_artists for build_genre_index that resolves missing artists through the artist catalog."""
+    return lambda artist_ids: artist_catalog.resolve(artist_ids, fallback_client=fallback_client)
+
+def store_genre_index(user_id, index):
+    # Artists without details (failed or not found) are indexed without genres, so such an
+    # index is only kept until they may have been fetched, then rebuilt
+    genre_indexes.set(user_id, index, ttl=app.config['ARTIST_CACHE_NEGATIVE_TTL'] if index.missing_details else None)
+
+def get_genre_index(user_id):
+    """
+    Returns the user's genre index for the current stored library, building
+    it from the library and the artist catalog if this worker has none or an
+    outdated one. Returns None if the library was never synced.
+    """
+    meta = library_store.get_meta(user_id)
+    if meta is None:
+        return None
+    index = genre_indexes.get(user_id, None)
+    if index is None or index.version != meta['version']:
+        with metrics.span('genre_index_build'):
+            index = build_genre_index(library_store.iter_record_chunks(user_id), genre_index_artists(), meta['version'])
+        store_genre_index(user_id, index)
+    return index
+
+def library_delta(user_id, sync, version):
+    """
+    Returns what an index of the library built at version is missing after
+    sync: [] if it is current, the new records of an incremental sync from
+    version, or None if it must be rebuilt.
+    """
+    if version == sync.version:
+        return []
+    if sync.mode == 'incremental' and version == sync.version - 1:
+        # prepend() bumps the version once and puts the new tracks first
+        return list(islice(library_store.iter_records(user_id, chunk_size=max(1, sync.added)), sync.added))
+    return None
+
+def update_genre_index(user_id, sync, sp):
+    """
+    Brings the genre index up to date after a library sync: an incremental sync
+    adds its new tracks in place, a full sync rebuilds the index. Artists come
+    from the artist catalog (just resolved by the analysis, so mostly cached).
+    """
+    lookup_artists = genre_index_artists(fallback_client=sp)
+    index = genre_indexes.get(user_id, None)
+    new_records = library_delta(user_id, sync, index.version) if index is not None else None
+    if new_records is not None:
+        index.add_records(new_records, lookup_artists({r['artist_id'] for r in new_records if r.get('artist_id')}))
+        index.version = sync.version
+    else:
+        index = build_genre_index(library_store.iter_record_chunks(user_id), lookup_artists, sync.version)
+    store_genre_index(user_id, index)
+
+# Per-user saves-per-period buckets of the stored library (see timeline.py)
+timelines = create_cache('saves_timeline',
+                         backend='memory',
+                         max_entries=app.config['TIMELINE_MAX_USERS'],
+                         ttl=app.config['LIBRARY_FULL_RESYNC_INTERVAL'])
+
+def current_timeline(user_id, sync):
+    """
+    Returns the user's timeline brought up to date with sync's new saves, or
+    None if it has to be rebuilt from the whole library. Re-saved tracks would
+    be counted twice, so a timeline that does not add up to the stored records
+    is rebuilt too (the API total also counts local and unavailable items,
+    which are not stored).
+    """
+    timeline = timelines.get(user_id, None)
+    if timeline is None:
+        return None
+    new_records = library_delta(user_id, sync, timeline.version)
+    if new_records is None or timeline.total + len(new_records) != library_store.count(user_id):
+        return None
+    timeline.add(new_records)
+    timeline.version = sync.version
+    return timeline
+
+def analyze_liked_songs(job, sp, user_id):
+    """
+    Background job: syncs the user's liked songs, resolves their artists and
+    stores the finished viz_data in the analysis cache for the page to render.
+    """
+    # Sync the stored library snapshot: only new saves are fetched after the first visit
+    logging.info(f"Syncing liked songs library for user {user_id}...")
+    with job.stage('sync'):
+        sync = sync_library(sp, library_store, user_id,
+                            max_workers=app.config['SPOTIFY_FETCH_WORKERS'],
+                            full_resync_interval=app.config['LIBRARY_FULL_RESYNC_INTERVAL'],
+                            progress=job, on_page=warm_artists)
+
+    warning = None
+    if sync.failed_offsets:
+        # Partial failure: analyze what we have and tell the user it is incomplete
+        logging.warning(f"Failed to fetch liked-songs pages at offsets {sync.failed_offsets}")
+        warning = f"Some liked songs could not be fetched ({len(sync.failed_offsets)} page(s) failed), so these results may be incomplete."
+
+    # --- Process Liked Songs Data ---
+    # Stream the stored records chunk by chunk into running aggregates, so peak
+    # memory scales with unique artists rather than with library size. The
+    # saves timeline only takes the new saves, unless it has to be rebuilt.
+    with job.stage('aggregate'):
+        analytics = import_analytics()
+        aggregator = analytics.StreamingCollectionStats()
+        timeline = current_timeline(user_id, sync)
+        rebuilt_timeline = import_timeline().SavesTimeline(sync.version) if timeline is None else None
+        for chunk in library_store.iter_record_chunks(user_id):
+            aggregator.add(chunk)
+            if rebuilt_timeline:
+                rebuilt_timeline.add(chunk)
+        if rebuilt_timeline:
+            timeline = rebuilt_timeline
+            timelines.set(user_id, timeline)
+    num_liked_tracks = aggregator.total_tracks
+    job.set('tracks', num_liked_tracks)
+    logging.info(f"Total liked songs: {num_liked_tracks} (sync: {sync.mode}, {sync.api_calls} API call(s))")
+
+    result = {'viz_data': None, 'warning': warning, 'message': None, 'version': sync.version, 'timeline': None}
+    if not num_liked_tracks:
+        result['message'] = "No liked songs found."
+    else:
         # Fetch Artist Details (Followers, Genres)
-        logging.info(f"Fetching details for {num_unique_artists} unique artists in liked songs...")
-        artist_details_map = get_artist_details(sp, list(liked_artist_ids))
+        liked_artist_ids = aggregator.artist_ids()
+        logging.info(f"Fetching details for {len(liked_artist_ids)} unique artists in liked songs...")
+        with job.stage('artists'):
+            artist_details_map = get_artist_details(sp, liked_artist_ids, progress=job)
         logging.info("Artist detail fetching complete.")
 
-        # Calculate Stats & Top/Bottom Lists
-        # Tracks by Popularity
-        # Filter out tracks with pop 0 unless they are the only ones? Optional.
-        valid_popularity_tracks = [t for t in data if t['popularity'] is not None]
-        valid_popularity_tracks.sort(key=lambda x: x['popularity'], reverse=True)
-        top_5_popular_tracks = valid_popularity_tracks[:5]
-        # Avoid sorting tracks with 0 popularity as "least popular" if possible
-        non_zero_pop_tracks = [t for t in valid_popularity_tracks if t['popularity'] > 0]
-        if len(non_zero_pop_tracks) >= 5:
-             bottom_5_popular_tracks = sorted(non_zero_pop_tracks, key=lambda x: x['popularity'])[:5]
-        else:
-             # Fallback if fewer than 5 tracks have > 0 popularity
-             bottom_5_popular_tracks = sorted(valid_popularity_tracks, key=lambda x: x['popularity'])[:5]
-
-
-        # Artists by Followers
-        # Create list of {'id': ..., 'name': ..., 'followers': ...} from fetched details
-        artist_follower_list = [{'id': aid, **details} for aid, details in artist_details_map.items() if details] # Filter out None details
-        artist_follower_list.sort(key=lambda x: x['followers'], reverse=True)
-        top_5_followed_artists = artist_follower_list[:5]
-        # Filter out artists with 0 followers if possible for "least followed"
-        non_zero_follower_artists = [a for a in artist_follower_list if a['followers'] > 0]
-        if len(non_zero_follower_artists) >= 5:
-            bottom_5_followed_artists = sorted(non_zero_follower_artists, key=lambda x: x['followers'])[:5]
-        else:
-             # Fallback if fewer than 5 artists have > 0 followers
-            bottom_5_followed_artists = sorted(artist_follower_list, key=lambda x: x['followers'])[:5]
-
-        # Genres (Unique Count & Top 10) - requires mapping genres back to tracks
-        all_genres = []
-        for track_info in data:
-            artist_id = track_info.get('artist_id')
-            if artist_id and artist_id in artist_details_map and artist_details_map[artist_id]:
-                all_genres.extend(artist_details_map[artist_id]['genres'])
-
-        num_unique_genres = len(set(all_genres))
-        top_genres_liked = []
-        if all_genres:
-            genre_counts_liked = Counter(all_genres)
-            top_genres_liked = [{'genre': g, 'count': c} for g, c in genre_counts_liked.most_common(10)]
+        # Calculate Stats & Top/Bottom Lists (same results as the playlist analysis engine)
+        with job.stage('analytics'):
+            artist_table = analytics.build_artist_table(artist_details_map)
+            stats = aggregator.result(artist_table)
+        with job.stage('timeline'):
+            result['timeline'] = timeline.result(artist_table)
+        with job.stage('genre_index'):
+            update_genre_index(user_id, sync, sp)
 
         # --- Prepare Data for Template ---
-        viz_data = {
-            # Convert to dict records for easy JSON serialization
-            "top_artists": top_artists_liked.to_dict(orient='records'),
-            "top_genres": top_genres_liked,
+        result['viz_data'] = {
+            "top_artists": stats['top_artists'],
+            "top_genres": stats['top_genres'],
             "total_liked_tracks": num_liked_tracks,
-            "unique_liked_artists": num_unique_artists,
-            "unique_liked_genres": num_unique_genres,
-            "top_popular_tracks": top_5_popular_tracks,
-            "bottom_popular_tracks": bottom_5_popular_tracks,
-            "top_followed_artists": top_5_followed_artists,
-            "bottom_followed_artists": bottom_5_followed_artists
+            "unique_liked_artists": stats['unique_artists'],
+            "unique_liked_genres": stats['unique_genres'],
+            "top_popular_tracks": stats['top_popular_tracks'],
+            "bottom_popular_tracks": stats['bottom_popular_tracks'],
+            "top_followed_artists": stats['top_followed_artists'],
+            "bottom_followed_artists": stats['bottom_followed_artists']
         }
 
+    # Versions the rendered page: a re-analysis with the same results keeps it
+    result['content_hash'] = content_hash([result['viz_data'], result['message'], result['warning']])
+    analysis_cache.set(f"liked:{user_id}", result)
+
+@app.route('/liked_songs')
+def liked_songs_page():
+    sp = create_spotify_client()
+    if not sp:
+        return redirect(url_for('login'))
+    username = 'User'
+    try:
+        profile = get_user_profile(sp)
+        username = profile['display_name']
+        user_id = profile['id']
+
+        # Render a finished analysis if we have one
+        result = analysis_cache.get(f"liked:{user_id}", None)
+        if result:
+            return cached_page(rendered_pages, f"{user_id}:liked_songs", [result.get('content_hash'), username],
+                               partial(render_template, 'liked_songs.html',
+                                       username=username,
+                                       viz_data=result['viz_data'],
+                                       message=result['message'],
+                                       warning=result['warning'],
+                                       parquet_export=parquet_available()))
+
+        # Otherwise analyze in the background; the page polls the job and reloads when done
+        job = job_manager.submit(f"liked:{user_id}", analyze_liked_songs, sp, user_id)
         return render_template('liked_songs.html',
                                username=username,
-                               viz_data=viz_data)
+                               job=job.to_dict(),
+                               job_done_url=url_for('liked_songs_page'))
 
     except spotipy.SpotifyException as e:
         logging.error(f"Spotify API Error on /liked_songs: {e}")
@@ -466,6 +747,61 @@ def liked_songs_page():
         logging.exception("Unexpected error on /liked_songs:")
         return render_template('liked_songs.html', username=username, error="An unexpected error occurred on the liked songs page.")
 
+# --- Listening History ---
+# Plays are polled from recently played (which only keeps the last 50) whenever
+# the user opens the dashboard or history page, at most every HISTORY_POLL_INTERVAL
+play_log = PlayLog(app.config['HISTORY_DB_PATH'])
+
+def poll_listening_history(job, sp, user_id):
+    """Background job: appends the user's plays since the last poll to the play log."""
+    with job.stage('poll'):
+        poll = poll_recently_played(sp, play_log, user_id)
+    job.set('new_plays', poll.new_plays)
+    metrics.inc('history_plays_total', poll.new_plays)
+
+def schedule_history_poll(sp, user_id):
+    """Starts a background poll unless the user's log was polled recently. Returns the job or None."""
+    stats = play_log.get_stats(user_id)
+    if stats is not None and time.time() - stats['polled_at'] < app.config['HISTORY_POLL_INTERVAL']:
+        return None
+    return job_manager.submit(f"history:{user_id}", poll_listening_history, sp, user_id)
+
+@app.route('/history')
+def history_page():
+    sp = create_spotify_client()
+    if not sp:
+        return redirect(url_for('login'))
+    username = 'User'
+    try:
+        profile = get_user_profile(sp)
+        username = profile['display_name']
+        user_id = profile['id']
+        job = schedule_history_poll(sp, user_id)
+
+        # The page reads the aggregates kept with the log; new plays show up on the next visit
+        summary = play_log.summary(user_id)
+        if summary is None:
+            return render_template('history.html',
+                                   username=username,
+                                   job=job.to_dict(),
+                                   job_done_url=url_for('history_page'))
+        return render_template('history.html',
+                               username=username,
+                               summary=summary,
+                               top_tracks=play_log.top_tracks(user_id),
+                               top_artists=play_log.top_artists(user_id),
+                               recent_plays=play_log.recent_plays(user_id))
+
+    except spotipy.SpotifyException as e:
+        logging.error(f"Spotify API Error on /history: {e}")
+        if e.http_status == 401:
+            session.pop('token_info', None)
+            return redirect(url_for('login', error='Session expired. Please login again.'))
+        return render_template('history.html', username=username, error=f"Could not fetch data from Spotify: {e.msg}")
+    except Exception as e:
+        logging.exception("Unexpected error on /history:")
+        return render_template('history.html', username=username, error="An unexpected error occurred on the listening history page.")
+
 # --- Helper function to extract Playlist ID from URL/ID ---
 def extract_playlist_id(playlist_input):
     """Extracts Spotify Playlist ID from URL or potentially just ID string."""
@@ -480,6 +816,136 @@ def extract_playlist_id(playlist_input):
 
 
 # --- Route for Playlist Analysis ---
+# Finished analyses keyed by (playlist_id, snapshot_id); playlists are shared, so is the cache
+playlist_cache = create_cache('playlist_analysis',
+                              backend=app.config['CACHE_BACKEND'],
+                              path=app.config['CACHE_SQLITE_PATH'],
+                              max_entries=app.config['PLAYLIST_CACHE_MAX_ENTRIES'],
+                              ttl=app.config['PLAYLIST_CACHE_TTL'])
+# Playlist metadata per (user, playlist) for a short while, so reloading an analysis
+# skips the metadata call; a new snapshot_id is noticed once the entry expires
+playlist_metadata_cache = create_cache('playlist_metadata',
+                                       backend=app.config['CACHE_BACKEND'],
+                                       path=app.config['CACHE_SQLITE_PATH'],
+                                       max_entries=app.config['PAGE_CACHE_MAX_ENTRIES'],
+                                       ttl=app.config['PLAYLIST_METADATA_TTL'])
+# MinHash signatures of every fully fetched playlist version, for near-duplicate search
+signature_store = SignatureStore(app.config['SIGNATURE_DB_PATH'])
+
+def fetch_playlist_records(sp, playlist_id, progress=None):
+    """
+    Fetches all tracks of a playlist as analysis records (first page gives
+    'total', the rest are fetched concurrently). Returns (track_records,
+    warning); warning is set if some pages failed. Raises RuntimeError if the
+    playlist cannot be read.
+    """
+    try:
+        playlist_tracks = fetch_playlist_tracks(sp, playlist_id, max_workers=app.config['SPOTIFY_FETCH_WORKERS'],
+                                                progress=progress, on_page=warm_artists)
+    except spotipy.SpotifyException as e:
+        logging.error(f"Spotify API Error fetching playlist items: {e}")
+        # Handle potential 404 (not found) or 403 (forbidden) for the playlist itself here too
+        if e.http_status in [403, 404]:
+            raise RuntimeError(f"Cannot access playlist (ID: {playlist_id}). It might be private or does not exist.")
+        raise RuntimeError(f"Failed to fetch all playlist tracks: {e.msg}")
+
+    logging.info(f"Fetched {len(playlist_tracks.items)} valid tracks of {playlist_tracks.total} items.")
+    warning = None
+    if playlist_tracks.failed_offsets:
+        logging.warning(f"Failed to fetch playlist pages at offsets {playlist_tracks.failed_offsets}")
+        warning = f"Some playlist tracks could not be fetched ({len(playlist_tracks.failed_offsets)} page(s) failed), so these results may be incomplete."
+    return record_store.add_tracks(playlist_track_to_record(t) for t in playlist_tracks.items), warning
+
+def playlist_result(track_records, stats, warning):
+    """Returns the cached form of a playlist analysis from its records and collection stats."""
+    result = {'tracks': [], 'viz_data': None, 'warning': warning, 'message': None}
+    if not track_records:
+        result['message'] = "No valid/accessible tracks found in this playlist."
+    else:
+        result['tracks'] = track_records
+        result['viz_data'] = {
+            "top_artists": stats['top_artists'],
+            "top_genres": stats['top_genres'],
+            "total_tracks": stats['total_tracks'],
+            "unique_artists": stats['unique_artists'],
+            "unique_genres": stats['unique_genres'],
+            "top_popular_tracks": stats['top_popular_tracks'],
+            "bottom_popular_tracks": stats['bottom_popular_tracks'],
+            "top_followed_artists": stats['top_followed_artists'],
+            "bottom_followed_artists": stats['bottom_followed_artists'],
+            "avg_stats": {'avg_popularity': stats['avg_popularity']},
+        }
+    # Versions the rendered page (the track list is not shown, so it is left out)
+    result['content_hash'] = content_hash([result['viz_data'], result['message'], warning])
+    return result
+
+def playlist_info_from_metadata(playlist_data):
+    """Converts playlist metadata (PLAYLIST_METADATA_FIELDS) into the header fields the pages show."""
+    return {
+        'name': playlist_data.get('name', 'N/A'),
+        'owner': playlist_data.get('owner', {}).get('display_name', 'N/A'),
+        'description': playlist_data.get('description', ''),
+        'image_url': playlist_data['images'][0]['url'] if playlist_data.get('images') else None,
+        'external_url': playlist_data.get('external_urls', {}).get('spotify')
+    }
+
+def get_playlist_metadata(sp, user_id, playlist_id):
+    """Returns the playlist's metadata (PLAYLIST_METADATA_FIELDS), from the metadata cache when possible."""
+    key = f"{user_id}:{playlist_id}"
+    playlist_data = playlist_metadata_cache.get(key, None)
+    if playlist_data is None:
+        logging.info("Fetching playlist metadata...")
+        with metrics.span('playlist_metadata'):
+            playlist_data = sp.playlist(playlist_id, fields=PLAYLIST_METADATA_FIELDS)
+        playlist_metadata_cache.set(key, playlist_data)
+    return playlist_data
+
+def cache_playlist_result(playlist_id, snapshot_id, result):
+    # Complete analyses are cached for this exact playlist version (shared by all users);
+    # partial or unversioned ones only long enough for the waiting page to pick them up
+    playlist_cache.set(f"{playlist_id}:{snapshot_id}", result,
+                       ttl=60 if result['warning'] or not snapshot_id else None)
+
+def store_playlist_signatures(playlist_id, snapshot_id, track_records):
+    """Keeps MinHash signatures of a fully fetched playlist version's tracks and primary artists."""
+    similarity = import_similarity()
+    track_ids = {t['id'] for t in track_records}
+    artist_ids = {t['artist_id'] for t in track_records if t['artist_id']}
+    signature_store.put(playlist_id, snapshot_id, similarity.SCHEME, len(track_ids), len(artist_ids),
+                        similarity.to_bytes(similarity.minhash(track_ids)),
+                        similarity.to_bytes(similarity.minhash(artist_ids)))
+
+def analyze_playlist(job, sp, playlist_id, snapshot_id):
+    """
+    Background job: fetches all tracks of a playlist, resolves their artists and
+    stores the finished viz_data in the playlist cache for this snapshot.
+    """
+    logging.info("Starting fetch for all playlist tracks...")
+    with job.stage('fetch'):
+        track_records, warning = fetch_playlist_records(sp, playlist_id, progress=job)
+    job.set('tracks', len(track_records))
+    if snapshot_id and not warning:
+        store_playlist_signatures(playlist_id, snapshot_id, track_records)
+
+    stats = None
+    if track_records:
+        playlist_artist_ids = {t['artist_id'] for t in track_records if t['artist_id']}
+
+        # Fetch Artist Details
+        logging.info(f"Fetching details for {len(playlist_artist_ids)} unique artists in playlist...")
+        with job.stage('artists'):
+            artist_details_map = get_artist_details(sp, list(playlist_artist_ids), progress=job)
+        logging.info("Artist detail fetching complete.")
+
+        # Calculate Stats & Top/Bottom Lists (shared with liked songs)
+        with job.stage('analytics'):
+            analytics = import_analytics()
+            stats = analytics.compute_collection_stats(analytics.build_track_table(track_records),
+                                                       analytics.build_artist_table(artist_details_map))
+        logging.info(f"Calculated Avg Popularity: {stats['avg_popularity']}")
+
+    cache_playlist_result(playlist_id, snapshot_id, playlist_result(track_records, stats, warning))
+
 @app.route('/playlist_analysis', methods=['GET', 'POST'])
 def playlist_analysis():
     sp = create_spotify_client()
@@ -491,7 +957,14 @@ def playlist_analysis():
     viz_data = None
     error_message = None
     message = None
-    # avg_stats = None # Removed as audio features are removed
+    warning = None
+    job_info = None
+    job_done_url = None
+    charts_url = None
+    export_urls = None
+    page_dependencies = None
+    profile = get_user_profile(sp) # Cached in the session after the first call
+    username = profile['display_name']
 
     if request.method == 'POST':
         playlist_id_input = request.form.get('playlist_id_input')
@@ -509,162 +982,30 @@ def playlist_analysis():
             logging.info(f"Attempting to analyze playlist ID: {playlist_id}")
             try:
                 # Get Playlist Metadata
-                logging.info("Fetching playlist metadata...")
-                playlist_data = sp.playlist(playlist_id)
-                playlist_info = {
-                    'name': playlist_data.get('name', 'N/A'),
-                    'owner': playlist_data.get('owner', {}).get('display_name', 'N/A'),
-                    'description': playlist_data.get('description', ''),
-                    'image_url': playlist_data['images'][0]['url'] if playlist_data.get('images') else None,
-                    'external_url': playlist_data.get('external_urls', {}).get('spotify')
-                }
+                playlist_data = get_playlist_metadata(sp, profile['id'], playlist_id)
+                playlist_info = playlist_info_from_metadata(playlist_data)
                 logging.info(f"Playlist Name: {playlist_info['name']}")
 
-                # Fetch All Playlist Tracks (handles pagination)
-                all_playlist_tracks = []
-                limit = 100 # Max limit for playlist items is 100
-                offset = 0
-                logging.info("Starting fetch for all playlist tracks...")
-                while True:
-                    try:
-                        results = sp.playlist_items(playlist_id, limit=limit, offset=offset,
-                                                     fields='items(track(id, name, popularity, artists(id, name), album(name, images))), total, next') # Specify fields to fetch
-                        items = results.get('items', [])
-                        if not items: break
-
-                        # Filter out None tracks or tracks without ID (can happen with local files)
-                        valid_items = [item['track'] for item in items if item.get('track') and item['track'].get('id')]
-                        all_playlist_tracks.extend(valid_items)
-
-                        logging.info(f"Fetched {len(valid_items)} valid tracks, total so far: {len(all_playlist_tracks)}")
-                        if results.get('next') is None: break # Check if 'next' URL is null
-                        offset += len(items) # Increment offset by number of items processed
-                        # time.sleep(0.1) # Optional delay
-                    except spotipy.SpotifyException as e:
-                         logging.error(f"Spotify API Error fetching playlist items (offset {offset}): {e}")
-                         # Handle potential 404 (not found) or 403 (forbidden) for the playlist itself here too
-                         if e.http_status in [403, 404]:
-                              error_message = f"Cannot access playlist (ID: {playlist_id}). It might be private or does not exist."
-                         else:
-                             error_message = f"Failed to fetch all playlist tracks: {e.msg}"
-                         break # Stop fetching on error
-                    except Exception as e:
-                         logging.error(f"Non-Spotify Error fetching playlist items (offset {offset}): {e}")
-                         error_message = "An unexpected error occurred while fetching playlist tracks."
-                         break # Stop fetching on error
-
-                if error_message: # If error occurred during fetching, stop processing
-                    pass
-                elif not all_playlist_tracks:
-                    message = "No valid/accessible tracks found in this playlist."
+                # Analyses are cached per playlist version: snapshot_id changes only when the contents do
+                snapshot_id = playlist_data.get('snapshot_id')
+                cache_key = f"{playlist_id}:{snapshot_id}"
+                cached = playlist_cache.get(cache_key, None)
+                if cached:
+                    logging.info(f"Serving analysis of playlist {playlist_id} (snapshot {snapshot_id}) from cache.")
+                    viz_data = cached['viz_data']
+                    message = cached['message']
+                    warning = cached['warning']
+                    charts_url = url_for('api_playlist', playlist_id=playlist_id, snapshot_id=snapshot_id)
+                    export_urls = {fmt: url_for('export_playlist', playlist_id=playlist_id, snapshot_id=snapshot_id,
+                                                export_format=fmt) for fmt in EXPORT_FORMATS}
+                    # The finished page only changes with the analysis, the header or the form input
+                    page_dependencies = [cached.get('content_hash'), snapshot_id, playlist_info, username,
+                                         playlist_id_input, request.method]
                 else:
-                    num_playlist_tracks = len(all_playlist_tracks) # Count based on valid tracks found
-
-                    # Create DataFrame from track list
-                    df_tracks = pd.DataFrame([{
-                        'id': t['id'],
-                        'name': t.get('name', 'N/A'),
-                        'artist_name': t['artists'][0]['name'] if t.get('artists') else 'N/A', # Simplified primary artist
-                        'artists': [a.get('name', 'N/A') for a in t.get('artists', [])],
-                        'artist_id': t['artists'][0]['id'] if t.get('artists') and t['artists'][0].get('id') else None,
-                        'album_name': t.get('album', {}).get('name', 'N/A'),
-                        'album_image_url': t.get('album', {}).get('images', [{}])[-1].get('url'), # Smallest image
-                        'popularity': t.get('popularity', 0)
-                    } for t in all_playlist_tracks if t and t.get('id')])
-
-
-                    # Calculate Average Popularity (Example of a remaining stat)
-                    avg_popularity = round(df_tracks['popularity'].mean()) if 'popularity' in df_tracks and not df_tracks.empty else 0
-                    avg_stats = {
-                        'avg_popularity': avg_popularity
-                    }
-                    logging.info(f"Calculated Avg Stats: {avg_stats}")
-
-
-                    playlist_artist_ids = set(df_tracks['artist_id'].dropna())
-                    num_unique_artists = len(playlist_artist_ids)
-
-                    # Calculate Top 10 Artists
-                    # Ensure 'artists' column contains single primary artist name or a comparable value for value_counts
-                    # If 'artists' column has lists of artists, this needs adjustment. Assuming 'artist_name' is primary.
-                    top_artists_playlist = df_tracks['artist_name'].value_counts().head(10).reset_index()
-                    top_artists_playlist.columns = ['artist', 'count']
-
-                   # Fetch Artist Details
-                    logging.info(f"Fetching details for {num_unique_artists} unique artists in playlist...")
-                    artist_details_map = get_artist_details(sp, list(playlist_artist_ids))
-                    logging.info("Artist detail fetching complete.")
-
-                    # Calculate Stats & Top/Bottom Lists (Similar logic as liked songs)
-                    # Tracks by Popularity
-                    top_5_popular_tracks = []
-                    bottom_5_popular_tracks = []
-
-                    if not df_tracks.empty and 'popularity' in df_tracks.columns:
-                        try:
-                            top_5_popular_tracks_df = df_tracks.nlargest(5, 'popularity')
-                            top_5_popular_tracks = top_5_popular_tracks_df.to_dict(orient='records')
-
-                            non_zero_pop_df = df_tracks[df_tracks['popularity'] > 0]
-                            if not non_zero_pop_df.empty:
-                                bottom_5_popular_tracks_df = non_zero_pop_df.nsmallest(5, 'popularity')
-                            else:
-                                bottom_5_popular_tracks_df = df_tracks.nsmallest(5, 'popularity')
-                            bottom_5_popular_tracks = bottom_5_popular_tracks_df.to_dict(orient='records')
-                        except Exception as e:
-                            logging.error(f"Error processing track popularity for tables: {e}")
-
-                    # Artists by Followers
-                    artist_follower_list = [{'id': aid, **details} for aid, details in artist_details_map.items() if details]
-                    artist_follower_list.sort(key=lambda x: x['followers'], reverse=True)
-                    top_5_followed_artists = artist_follower_list[:5]
-
-                    non_zero_follower_artists = [a for a in artist_follower_list if a['followers'] > 0]
-                    if len(non_zero_follower_artists) >= 5:
-                        bottom_5_followed_artists = sorted(non_zero_follower_artists, key=lambda x: x['followers'])[:5]
-                    else:
-                         bottom_5_followed_artists = sorted(artist_follower_list, key=lambda x: x['followers'])[:5]
-
-                    # Genres (Unique Count & Top 10)
-                    all_genres_pl = []
-                    if 'artist_id' in df_tracks.columns and artist_details_map is not None:
-                        for track_row in df_tracks.itertuples(index=False, name='Track'):
-                            try:
-                                artist_id = track_row.artist_id
-                                if pd.notna(artist_id) and artist_id in artist_details_map and artist_details_map[artist_id]:
-                                    genres = artist_details_map[artist_id].get('genres', [])
-                                    if genres:
-                                        all_genres_pl.extend(genres)
-                            except AttributeError:
-                                logging.warning(f"Skipping row due to missing attribute during genre processing: {track_row}")
-                                continue
-                    else:
-                        if 'artist_id' not in df_tracks.columns: logging.warning("'artist_id' column not found for genre processing.")
-                        if artist_details_map is None: logging.warning("'artist_details_map' is None for genre processing.")
-
-                    num_unique_genres = len(set(all_genres_pl))
-                    top_genres_playlist = []
-                    if all_genres_pl:
-                        try:
-                            genre_counts_pl = Counter(all_genres_pl)
-                            top_genres_playlist = [{'genre': g, 'count': c} for g, c in genre_counts_pl.most_common(10)]
-                        except Exception as e:
-                            logging.error(f"Error calculating top genres with Counter: {e}")
-
-                    # Prepare viz_data
-                    viz_data = {
-                        "top_artists": top_artists_playlist.to_dict(orient='records'),
-                        "top_genres": top_genres_playlist,
-                        "total_tracks": num_playlist_tracks,
-                        "unique_artists": num_unique_artists,
-                        "unique_genres": num_unique_genres,
-                        "top_popular_tracks": top_5_popular_tracks,
-                        "bottom_popular_tracks": bottom_5_popular_tracks,
-                        "top_followed_artists": top_5_followed_artists,
-                        "bottom_followed_artists": bottom_5_followed_artists,
-                        "avg_stats": avg_stats,
-                        # "scatter_plot_data": None # Removed scatter plot data
-                    }
+                    # Analyze in the background; the page polls the job and reloads when done
+                    job = job_manager.submit(f"playlist:{cache_key}", analyze_playlist, sp, playlist_id, snapshot_id)
+                    job_info = job.to_dict()
+                    job_done_url = url_for('playlist_analysis', id=playlist_id)
 
             except spotipy.SpotifyException as e:
                 logging.error(f"Spotify API Error accessing playlist (ID: {playlist_id}): {e}")
@@ -678,14 +1019,605 @@ def playlist_analysis():
                 playlist_info = None
 
     # Render the template, passing any data, info, or errors
-    return render_template('playlist_analysis.html',
-                           username=sp.current_user().get('display_name', 'User') if sp.current_user() else 'User',
-                           playlist_info=playlist_info,
-                           viz_data=viz_data,
+    render = partial(render_template, 'playlist_analysis.html',
+                     username=username,
+                     playlist_info=playlist_info,
+                     viz_data=viz_data,
+                     error=error_message,
+                     message=message,
+                     warning=warning,
+                     job=job_info,
+                     job_done_url=job_done_url,
+                     charts_url=charts_url,
+                     export_urls=export_urls,
+                     parquet_export=parquet_available(),
+                     playlist_id_input=playlist_id_input or '')
+    if page_dependencies:
+        return cached_page(rendered_pages, f"{profile['id']}:playlist:{playlist_id}", page_dependencies, render)
+    return render()
+
+
+# --- Playlist Comparison ---
+# Many playlists analyzed in one job: fetched concurrently, their artists resolved in one
+# deduplicated pass, and compared pairwise (see playlist_compare.py)
+
+def parse_playlist_inputs(text):
+    """
+    Splits pasted playlist URLs/IDs (separated by whitespace or commas) into
+    (playlist_ids, invalid_inputs); repeated playlists are kept once, in order.
+    """
+    playlist_ids, invalid_inputs = [], []
+    for value in re.split(r'[\s,]+', text or ''):
+        if not value:
+            continue
+        playlist_id = extract_playlist_id(value)
+        if not playlist_id:
+            invalid_inputs.append(value)
+        elif playlist_id not in playlist_ids:
+            playlist_ids.append(playlist_id)
+    return playlist_ids, invalid_inputs
+
+def fetch_playlists_metadata(sp, playlist_ids):
+    """
+    Fetches the metadata of several playlists concurrently. Returns (playlists,
+    errors): playlists are the readable ones in input order, as dicts with
+    'id', 'snapshot_id' and 'info'; errors maps each other ID to a message.
+    """
+    playlists, errors = [], {}
+    with metrics.span('playlist_metadata'), ThreadPoolExecutor(max_workers=app.config['PLAYLIST_BATCH_WORKERS']) as executor:
+        futures = [(playlist_id, executor.submit(sp.playlist, playlist_id, fields=PLAYLIST_METADATA_FIELDS))
+                   for playlist_id in playlist_ids]
+        for playlist_id, future in futures:
+            try:
+                playlist_data = future.result()
+            except spotipy.SpotifyException as e:
+                logging.error(f"Spotify API Error accessing playlist (ID: {playlist_id}): {e}")
+                if e.http_status == 404: errors[playlist_id] = "Playlist not found."
+                elif e.http_status == 403: errors[playlist_id] = "Access denied. Is it private?"
+                else: errors[playlist_id] = f"Spotify error accessing playlist: {e.msg}"
+                continue
+            playlists.append({'id': playlist_id, 'snapshot_id': playlist_data.get('snapshot_id'),
+                              'info': playlist_info_from_metadata(playlist_data)})
+    return playlists, errors
+
+def playlist_batch_id(playlists):
+    """Identifies a comparison by the exact playlist versions it covers (in order)."""
+    versions = '|'.join(f"{p['id']}:{p['snapshot_id']}" for p in playlists)
+    return hashlib.sha1(versions.encode()).hexdigest()[:16]
+
+def analyze_playlist_batch(job, sp, playlists, batch_id):
+    """
+    Background job: analyzes several playlists and compares them. Playlists
+    with a complete cached analysis reuse its tracks, the others are fetched
+    concurrently; the union of their artists is resolved in one pass. Each
+    playlist's analysis is cached like a single one, and the comparison (per
+    playlist stats plus track/artist/genre overlap) under 'batch:<batch_id>'.
+    """
+    records, warnings, errors = {}, {}, {}
+    to_fetch = []
+    for p in playlists:
+        cached = playlist_cache.get(f"{p['id']}:{p['snapshot_id']}", None)
+        if cached and not cached['warning']:
+            records[p['id']] = cached['tracks']
+        else:
+            to_fetch.append(p)
+    job.set('playlists_total', len(playlists))
+    job.set('playlists_fetched', len(records))
+
+    logging.info(f"Fetching {len(to_fetch)} of {len(playlists)} playlists to compare...")
+    with job.stage('fetch'), ThreadPoolExecutor(max_workers=app.config['PLAYLIST_BATCH_WORKERS']) as executor:
+        futures = {executor.submit(fetch_playlist_records, sp, p['id']): p['id'] for p in to_fetch}
+        for future in as_completed(futures):
+            playlist_id = futures[future]
+            try:
+                records[playlist_id], warnings[playlist_id] = future.result()
+            except RuntimeError as e:
+                errors[playlist_id] = str(e)
+            job.incr('playlists_fetched')
+    for p in to_fetch:
+        if p['id'] in records and p['snapshot_id'] and not warnings[p['id']]:
+            store_playlist_signatures(p['id'], p['snapshot_id'], records[p['id']])
+    compared = [p for p in playlists if p['id'] in records]
+    if len(compared) < 2:
+        raise RuntimeError("Fewer than two of these playlists could be fetched: " + ' '.join(errors.values()))
+
+    # One artist lookup for all playlists: shared artists are resolved once
+    artist_ids = {t['artist_id'] for p in compared for t in records[p['id']] if t['artist_id']}
+    logging.info(f"Fetching details for {len(artist_ids)} unique artists across {len(compared)} playlists...")
+    with job.stage('artists'):
+        artist_details_map = get_artist_details(sp, list(artist_ids), progress=job)
+
+    with job.stage('analytics'):
+        analytics = import_analytics()
+        artist_table = analytics.build_artist_table(artist_details_map)
+        summaries = []
+        for p in compared:
+            track_records = records[p['id']]
+            stats = analytics.compute_collection_stats(analytics.build_track_table(track_records), artist_table) \
+                if track_records else None
+            if p in to_fetch:
+                cache_playlist_result(p['id'], p['snapshot_id'], playlist_result(track_records, stats, warnings[p['id']]))
+            summaries.append({
+                'id': p['id'],
+                'snapshot_id': p['snapshot_id'],
+                'name': p['info']['name'],
+                'owner': p['info']['owner'],
+                'total_tracks': stats['total_tracks'] if stats else 0,
+                'unique_artists': stats['unique_artists'] if stats else 0,
+                'unique_genres': stats['unique_genres'] if stats else 0,
+                'avg_popularity': stats['avg_popularity'] if stats else None,
+                'top_artist': stats['top_artists'][0]['artist'] if stats and stats['top_artists'] else None,
+                'top_genre': stats['top_genres'][0]['genre'] if stats and stats['top_genres'] else None,
+                'warning': warnings.get(p['id']),
+            })
+
+    with job.stage('overlap'):
+        playlist_compare = import_playlist_compare()
+        track_sets = [{t['id'] for t in records[p['id']]} for p in compared]
+        artist_sets = [{t['artist_id'] for t in records[p['id']] if t['artist_id']} for p in compared]
+        genre_sets = [{genre for artist_id in artists for genre in artist_details_map[artist_id]['genres']}
+                      for artists in artist_sets]
+        overlap = {
+            'tracks': playlist_compare.overlap_matrix(track_sets),
+            'artists': playlist_compare.overlap_matrix(artist_sets),
+            'genres': playlist_compare.overlap_matrix(genre_sets),
+        }
+        shared_artists = [{'artist': artist_details_map[artist_id]['name'], 'playlists': count}
+                          for artist_id, count in playlist_compare.most_shared(artist_sets)]
+        shared_genres = [{'genre': genre, 'playlists': count}
+                         for genre, count in playlist_compare.most_shared(genre_sets)]
+
+    result = {
+        'playlists': summaries,
+        'errors': [{'id': playlist_id, 'error': errors[playlist_id]} for playlist_id in errors],
+        'overlap': overlap,
+        'shared_artists': shared_artists,
+        'shared_genres': shared_genres,
+    }
+    # Like single analyses, incomplete comparisons are only kept for the waiting page
+    incomplete = errors or any(warnings.values()) or not all(p['snapshot_id'] for p in playlists)
+    playlist_cache.set(f"batch:{batch_id}", result, ttl=60 if incomplete else None)
+
+@app.route('/playlist_compare', methods=['GET', 'POST'])
+def playlist_compare():
+    sp = create_spotify_client()
+    if not sp:
+        return redirect(url_for('login'))
+
+    playlist_ids_input = None
+    comparison = None
+    error_message = None
+    job_info = None
+    job_done_url = None
+    charts_url = None
+    metadata_errors = []
+    username = get_user_profile(sp)['display_name']
+
+    if request.method == 'POST':
+        playlist_ids_input = request.form.get('playlist_ids_input')
+    elif request.method == 'GET':
+        # IDs via query param as well, e.g. /playlist_compare?ids=<id>,<id>
+        playlist_ids_input = request.args.get('ids')
+
+    if playlist_ids_input:
+        playlist_ids, invalid_inputs = parse_playlist_inputs(playlist_ids_input)
+        if invalid_inputs:
+            error_message = f"Invalid Spotify Playlist URL or ID provided: {', '.join(invalid_inputs[:5])}"
+        elif len(playlist_ids) < 2:
+            error_message = "Enter at least two different playlists to compare."
+        elif len(playlist_ids) > app.config['PLAYLIST_BATCH_MAX']:
+            error_message = f"Compare at most {app.config['PLAYLIST_BATCH_MAX']} playlists at a time."
+        else:
+            logging.info(f"Attempting to compare {len(playlist_ids)} playlists...")
+            try:
+                playlists, errors = fetch_playlists_metadata(sp, playlist_ids)
+                metadata_errors = [{'id': playlist_id, 'error': errors[playlist_id]} for playlist_id in errors]
+                if len(playlists) < 2:
+                    error_message = "Fewer than two of these playlists could be read."
+                else:
+                    batch_id = playlist_batch_id(playlists)
+                    comparison = playlist_cache.get(f"batch:{batch_id}", None)
+                    if comparison:
+                        logging.info(f"Serving comparison {batch_id} from cache.")
+                        charts_url = url_for('api_playlist_batch', batch_id=batch_id)
+                    else:
+                        # Compare in the background; the page polls the job and reloads when done
+                        job = job_manager.submit(f"playlist_batch:{batch_id}", analyze_playlist_batch, sp, playlists,
+                                                 batch_id)
+                        job_info = job.to_dict()
+                        job_done_url = url_for('playlist_compare', ids=','.join(playlist_ids))
+            except Exception as e:
+                logging.exception("Unexpected error comparing playlists:")
+                error_message = "An unexpected error occurred during playlist comparison."
+
+    return render_template('playlist_compare.html',
+                           username=username,
+                           comparison=comparison,
+                           metadata_errors=metadata_errors,
                            error=error_message,
-                           message=message,
-                           playlist_id_input=playlist_id_input or '')
+                           job=job_info,
+                           job_done_url=job_done_url,
+                           charts_url=charts_url,
+                           playlist_ids_input=playlist_ids_input or '')
+
+
+# --- Near-Duplicate Playlists ---
+# Candidate pairs come from an LSH index over the stored MinHash signatures (see
+# similarity.py), so playlists are neither compared all-pairs nor refetched unchanged
+
+def playlist_summary(playlist):
+    """The fields of a simplified playlist object shown in near-duplicate pairs."""
+    return {
+        'id': playlist['id'],
+        'name': playlist.get('name') or 'N/A',
+        'owner': (playlist.get('owner') or {}).get('display_name') or 'N/A',
+        'total_tracks': (playlist.get('tracks') or {}).get('total', 0),
+    }
+
+def find_duplicate_playlists(job, sp, user_id):
+    """
+    Background job: finds near-duplicate pairs among the user's playlists.
+    Playlist versions without stored signatures are fetched concurrently and
+    signed; pairs sharing an LSH bucket are kept if their estimated track
+    Jaccard similarity reaches DUPLICATE_THRESHOLD.
+    """
+    with job.stage('playlists'):
+        listing = fetch_user_playlists(sp, max_workers=app.config['SPOTIFY_FETCH_WORKERS'])
+    playlists = [p for p in listing.items if p and p.get('id') and p.get('snapshot_id')]
+    playlists = list({p['id']: p for p in playlists}.values())[:app.config['DUPLICATE_MAX_PLAYLISTS']]
+    versions = [(p['id'], p['snapshot_id']) for p in playlists]
+
+    similarity = import_similarity()
+    stored = signature_store.get_many(versions, similarity.SCHEME)
+    missing = [p for p in playlists if (p['id'], p['snapshot_id']) not in stored]
+    job.set('playlists_total', len(playlists))
+    job.set('playlists_fetched', len(playlists) - len(missing))
+    logging.info(f"Signing {len(missing)} of {len(playlists)} playlists for near-duplicate search...")
+
+    skipped = []
+    with job.stage('fetch'), ThreadPoolExecutor(max_workers=app.config['PLAYLIST_BATCH_WORKERS']) as executor:
+        futures = {executor.submit(fetch_playlist_records, sp, p['id']): p for p in missing}
+        for future in as_completed(futures):
+            playlist = futures[future]
+            try:
+                track_records, warning = future.result()
+            except RuntimeError as e:
+                skipped.append(dict(playlist_summary(playlist), error=str(e)))
+            else:
+                if warning:
+                    skipped.append(dict(playlist_summary(playlist), error=warning))
+                else:
+                    store_playlist_signatures(playlist['id'], playlist['snapshot_id'], track_records)
+            job.incr('playlists_fetched')
+    if missing:
+        stored = signature_store.get_many(versions, similarity.SCHEME)
+
+    with job.stage('similarity'):
+        index = similarity.LSHIndex()
+        signatures = {}
+        for p in playlists:
+            row = stored.get((p['id'], p['snapshot_id']))
+            if row and row['tracks']: # Empty playlists are not near-duplicates of anything
+                signatures[p['id']] = row
+                index.add(p['id'], similarity.from_bytes(row['track_signature']))
+        pairs = index.near_duplicates(app.config['DUPLICATE_THRESHOLD'])
+
+    summaries = {p['id']: playlist_summary(p) for p in playlists}
+    result = {
+        'playlists': len(playlists),
+        'indexed': len(index),
+        'threshold': app.config['DUPLICATE_THRESHOLD'],
+        'pairs': [{
+            'a': summaries[a],
+            'b': summaries[b],
+            'track_similarity': round(track_similarity, 2),
+            'artist_similarity': round(similarity.estimate_jaccard(
+                similarity.from_bytes(signatures[a]['artist_signature']),
+                similarity.from_bytes(signatures[b]['artist_signature'])), 2),
+        } for (a, b), track_similarity in pairs],
+        'skipped': skipped,
+    }
+    logging.info(f"Found {len(pairs)} near-duplicate pairs among {len(index)} playlists.")
+    analysis_cache.set(f"duplicates:{user_id}", result)
+
+@app.route('/playlist_duplicates')
+def playlist_duplicates():
+    sp = create_spotify_client()
+    if not sp:
+        return redirect(url_for('login'))
+    username = 'User'
+    try:
+        profile = get_user_profile(sp)
+        username = profile['display_name']
+        user_id = profile['id']
+
+        # Render a finished search if we have one
+        result = analysis_cache.get(f"duplicates:{user_id}", None)
+        if result:
+            return render_template('playlist_duplicates.html', username=username, result=result)
+
+        # Otherwise search in the background; the page polls the job and reloads when done
+        job = job_manager.submit(f"duplicates:{user_id}", find_duplicate_playlists, sp, user_id)
+        return render_template('playlist_duplicates.html',
+                               username=username,
+                               job=job.to_dict(),
+                               job_done_url=url_for('playlist_duplicates'))
+
+    except spotipy.SpotifyException as e:
+        logging.error(f"Spotify API Error on /playlist_duplicates: {e}")
+        if e.http_status == 401:
+            session.pop('token_info', None)
+            return redirect(url_for('login', error='Session expired. Please login again.'))
+        return render_template('playlist_duplicates.html', username=username, error=f"Could not fetch data from Spotify: {e.msg}")
+    except Exception as e:
+        logging.exception("Unexpected error on /playlist_duplicates:")
+        return render_template('playlist_duplicates.html', username=username, error="An unexpected error occurred while searching for duplicate playlists.")
+
+
+# --- JSON API (v1) ---
+# Compact chart data for the page scripts; json_response() adds gzip and ETag/304
+
+def collection_chart_data(viz_data):
+    """Projects liked-songs/playlist viz_data onto the fields the chart scripts use."""
+    def followed(artists):
+        return [{'name': a['name'], 'followers': a['followers']} for a in artists]
+    return {
+        'top_artists': viz_data['top_artists'],
+        'top_genres': viz_data['top_genres'],
+        'top_followed_artists': followed(viz_data['top_followed_artists']),
+        'bottom_followed_artists': followed(viz_data['bottom_followed_artists']),
+    }
+
+def api_error(message, status):
+    return json_response({'error': message}, status=status)
+
+def playlist_access_error(sp, playlist_id):
+    """
+    Returns None if the current user can read the playlist, else an error
+    response. Cached analyses are shared by all users, so API routes check
+    access with the caller's client before serving them (the metadata lookup
+    is cached per user, see get_playlist_metadata).
+    """
+    try:
+        get_playlist_metadata(sp, get_user_profile(sp)['id'], playlist_id)
+    except spotipy.SpotifyException as e:
+        if e.http_status in (403, 404):
+            return api_error("Playlist not found or not accessible.", 404)
+        logging.error(f"Spotify API Error checking access to playlist {playlist_id}: {e}")
+        return api_error(f"Could not fetch data from Spotify: {e.msg}", 502)
+    return None
+
+@app.route('/api/v1/dashboard/<time_range>')
+def api_dashboard(time_range):
+    sp = create_spotify_client()
+    if not sp:
+        return api_error("Not logged in.", 401)
+    if time_range not in TIME_RANGES:
+        return api_error(f"Unknown time range '{time_range}'.", 404)
+    try:
+        _, top_items = get_top_items(sp, time_range)
+    except spotipy.SpotifyException as e:
+        logging.error(f"Spotify API Error on /api/v1/dashboard: {e}")
+        return api_error(f"Could not fetch data from Spotify: {e.msg}", 502)
+    viz_data = build_dashboard_viz_data(top_items)
+    return json_response({'time_range': time_range, 'genres_chart': viz_data['genres_chart']})
+
+@app.route('/api/v1/liked_songs')
+def api_liked_songs():
+    sp = create_spotify_client()
+    if not sp:
+        return api_error("Not logged in.", 401)
+    try:
+        profile = get_user_profile(sp)
+    except spotipy.SpotifyException as e:
+        logging.error(f"Spotify API Error on /api/v1/liked_songs: {e}")
+        return api_error(f"Could not fetch data from Spotify: {e.msg}", 502)
+    result = analysis_cache.get(f"liked:{profile['id']}", None)
+    if not result or not result['viz_data']:
+        return api_error("No finished analysis of your liked songs.", 404)
+    return json_response(collection_chart_data(result['viz_data']))
+
+@app.route('/api/v1/playlists/<playlist_id>')
+def api_playlist(playlist_id):
+    sp = create_spotify_client()
+    if not sp:
+        return api_error("Not logged in.", 401)
+    error = playlist_access_error(sp, playlist_id)
+    if error:
+        return error
+    # Analyses are per playlist version, so the caller names the snapshot it rendered
+    snapshot_id = request.args.get('snapshot_id')
+    cached = playlist_cache.get(f"{playlist_id}:{snapshot_id}", None)
+    if not cached or not cached['viz_data']:
+        return api_error("No finished analysis of this playlist version.", 404)
+    return json_response(collection_chart_data(cached['viz_data']))
+
+@app.route('/api/v1/playlist_batches/<batch_id>')
+def api_playlist_batch(batch_id):
+    sp = create_spotify_client()
+    if not sp:
+        return api_error("Not logged in.", 401)
+    # Comparisons are keyed by the playlist versions they cover, see playlist_batch_id()
+    comparison = playlist_cache.get(f"batch:{batch_id}", None)
+    if not comparison:
+        return api_error("No finished comparison with this ID.", 404)
+    # Shared by all users: only served to those who can read every playlist in it
+    for playlist in comparison['playlists']:
+        error = playlist_access_error(sp, playlist['id'])
+        if error:
+            return error
+    return json_response(comparison)
+
+
+# Genre drill-down over the stored liked-songs library (see genre_index.py)
+
+def api_profile():
+    """Returns (profile, None) for the logged-in user, or (None, error response)."""
+    sp = create_spotify_client()
+    if not sp:
+        return None, api_error("Not logged in.", 401)
+    try:
+        return get_user_profile(sp), None
+    except spotipy.SpotifyException as e:
+        logging.error(f"Spotify API Error fetching the user profile: {e}")
+        return None, api_error(f"Could not fetch data from Spotify: {e.msg}", 502)
+
+@app.route('/api/v1/liked_songs/genres')
+def api_liked_genres():
+    profile, error = api_profile()
+    if error:
+        return error
+    index = get_genre_index(profile['id'])
+    if index is None:
+        return api_error("No stored library yet. Open Liked Songs first.", 404)
+    return json_response({'version': index.version, 'genres': index.genres()})
+
+@app.route('/api/v1/liked_songs/genres/tracks')
+def api_liked_genre_tracks():
+    profile, error = api_profile()
+    if error:
+        return error
+    genre = request.args.get('genre', '')
+    if not genre:
+        return api_error("Pass a 'genre'.", 400)
+    offset = max(0, request.args.get('offset', 0, type=int))
+    limit = min(max(1, request.args.get('limit', 50, type=int)), 500)
+    index = get_genre_index(profile['id'])
+    if index is None:
+        return api_error("No stored library yet. Open Liked Songs first.", 404)
+    total, track_ids = index.tracks_in_genre(genre, offset, limit)
+    tracks = [{'id': r['track_id'], 'name': r['name'], 'artist_name': r['artist_name'],
+               'album_name': r['album_name'], 'popularity': r['popularity'], 'added_at': r['added_at']}
+              for r in library_store.get_records(profile['id'], track_ids)]
+    return json_response({'genre': genre, 'total': total, 'offset': offset, 'tracks': tracks})
+
+@app.route('/api/v1/liked_songs/genres/artists')
+def api_liked_genre_artists():
+    profile, error = api_profile()
+    if error:
+        return error
+    genres = request.args.getlist('genre')
+    if not genres:
+        return api_error("Pass at least one 'genre'.", 400)
+    index = get_genre_index(profile['id'])
+    if index is None:
+        return api_error("No stored library yet. Open Liked Songs first.", 404)
+    matches = index.artists_in_genres(genres)
+    details = artist_catalog.resolve(artist_id for artist_id, _ in matches)
+    artists = [{'id': artist_id, 'name': (details.get(artist_id) or {}).get('name', 'N/A'), 'tracks': count}
+               for artist_id, count in matches]
+    return json_response({'genres': genres, 'artists': artists})
+
+# Saves over time (see timeline.py), computed with the liked-songs analysis
+
+@app.route('/api/v1/liked_songs/timeline')
+def api_liked_timeline():
+    profile, error = api_profile()
+    if error:
+        return error
+    result = analysis_cache.get(f"liked:{profile['id']}", None)
+    if not result or not result.get('timeline'):
+        return api_error("No finished analysis of your liked songs.", 404)
+    return json_response(result['timeline'])
+
+# Listening history, read from the aggregates kept with the play log
+
+@app.route('/api/v1/history')
+def api_history():
+    profile, error = api_profile()
+    if error:
+        return error
+    summary = play_log.summary(profile['id'])
+    if summary is None:
+        return api_error("No listening history yet. Open Listening History first.", 404)
+    days = min(max(1, request.args.get('days', 90, type=int)), 366)
+    return json_response({'summary': summary, 'daily': play_log.daily(profile['id'], days=days)})
+
+
+# Near-duplicate playlists, found by the background search of the Duplicate Playlists page
+
+@app.route('/api/v1/playlist_duplicates')
+def api_playlist_duplicates():
+    profile, error = api_profile()
+    if error:
+        return error
+    result = analysis_cache.get(f"duplicates:{profile['id']}", None)
+    if not result:
+        return api_error("No finished near-duplicate search. Open Duplicate Playlists first.", 404)
+    return json_response(result)
+
+
+# --- Exports ---
+# Streamed chunk by chunk (constant memory), joined with cached artist details only
+
+def export_response(export_format, record_chunks, filename):
+    """Streams record_chunks as an NDJSON, CSV or Parquet download."""
+    if export_format not in EXPORT_FORMATS:
+        return api_error(f"Unknown export format '{export_format}'.", 404)
+    if export_format == 'parquet' and not parquet_available():
+        return api_error("Parquet exports need the pyarrow package.", 501)
+
+    def counted(row_chunks):
+        for rows in row_chunks:
+            metrics.inc('export_rows_total', len(rows), format=export_format)
+            yield rows
+
+    row_chunks = counted(export_row_chunks(record_chunks, artist_cache.get_many))
+    return Response(export_stream(export_format, row_chunks), content_type=EXPORT_FORMATS[export_format],
+                    headers={'Content-Disposition': f'attachment; filename="{filename}.{export_format}"'})
+
+@app.route('/api/v1/liked_songs/export.<export_format>')
+def export_liked_songs(export_format):
+    sp = create_spotify_client()
+    if not sp:
+        return api_error("Not logged in.", 401)
+    try:
+        profile = get_user_profile(sp)
+    except spotipy.SpotifyException as e:
+        logging.error(f"Spotify API Error on liked songs export: {e}")
+        return api_error(f"Could not fetch data from Spotify: {e.msg}", 502)
+    # Exports the stored snapshot; it exists once the liked songs were analyzed
+    if not library_store.count(profile['id']):
+        return api_error("No stored library yet. Open Liked Songs first.", 404)
+    record_chunks = library_store.iter_record_chunks(profile['id'], chunk_size=app.config['EXPORT_CHUNK_ROWS'])
+    return export_response(export_format, record_chunks, 'liked_songs')
+
+@app.route('/api/v1/playlists/<playlist_id>/export.<export_format>')
+def export_playlist(playlist_id, export_format):
+    sp = create_spotify_client()
+    if not sp:
+        return api_error("Not logged in.", 401)
+    error = playlist_access_error(sp, playlist_id)
+    if error:
+        return error
+    snapshot_id = request.args.get('snapshot_id')
+    cached = playlist_cache.get(f"{playlist_id}:{snapshot_id}", None)
+    if not cached or not cached['tracks']:
+        return api_error("No finished analysis of this playlist version.", 404)
+    tracks = cached['tracks']
+    chunk_rows = app.config['EXPORT_CHUNK_ROWS']
+    record_chunks = (tracks[i:i + chunk_rows] for i in range(0, len(tracks), chunk_rows))
+    return export_response(export_format, record_chunks, f"playlist_{playlist_id}")
+
+
+# --- App Entry Point ---
+def create_app():
+    """
+    Returns the configured app, e.g. for gunicorn 'app:create_app()'. Everything
+    created at import is fork-safe (per-process connections, pools and threads
+    start on first use), so the app can be loaded once in a pre-forking master.
+    """
+    if not app.config['LAZY_IMPORTS']:
+        import_analytics()
+        import_timeline()
+        import_playlist_compare()
+        import_similarity()
+    return app
+
+import_seconds = time.perf_counter() - IMPORT_STARTED
+metrics.record_startup('import_app', import_seconds)
+logging.info(f"Imported app in {import_seconds * 1000:.0f} ms (lazy imports {'on' if app.config['LAZY_IMPORTS'] else 'off'}).")
 
 
 if __name__ == '__main__':
-    app.run(debug=True, port=5000)
\ No newline at end of file
+    create_app().run(debug=True, port=5000)
\ No newline at end of file
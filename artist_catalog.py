@@ -0,0 +1,166 @@
+import logging
+import os
+import threading
+from collections import OrderedDict
+import metrics
+
+# Spotify's limit for GET /artists
+ARTISTS_PER_REQUEST = 50
+# Queued artists taken per warming round; already cached ones are skipped, so
+# taking several requests' worth keeps the batches full
+WARM_CHUNK = ARTISTS_PER_REQUEST * 10
+
+
+def artist_to_details(artist):
+    """Converts a full artist object into the details the analyses use."""
+    return {
+        'name': artist.get('name', 'N/A'),
+        'genres': artist.get('genres', []),
+        'followers': (artist.get('followers') or {}).get('total', 0),
+        'image_url': artist['images'][0]['url'] if artist.get('images') else None
+    }
+
+
+class ArtistCatalog:
+    """
+    Artist details shared by all users, stored in cache (None marks an artist
+    that could not be resolved, kept for negative_ttl seconds).
+
+    Missing artists are fetched with the app-level client from get_app_client()
+    (Client Credentials Flow), so lookups do not spend a user's token; the
+    caller's client is only used if the app client is unavailable or fails.
+    Concurrent lookups of the same artist share one request, and warm() queues
+    artists for a background thread so they are resolved before an analysis
+    asks for them.
+    """
+
+    def __init__(self, cache, get_app_client, negative_ttl=300, max_pending=50000):
+        self.cache = cache
+        self.get_app_client = get_app_client
+        self.negative_ttl = negative_ttl
+        self.max_pending = max_pending
+        self._inflight = {} # artist_id -> Event set once its batch is stored
+        self._pending = OrderedDict() # artist ids queued by warm(), oldest first
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._warmer_pid = None
+
+    def add(self, artists):
+        """Stores full artist objects fetched elsewhere (e.g. top artists), saving a lookup later."""
+        details = {a['id']: artist_to_details(a) for a in artists if a and a.get('id') and 'followers' in a}
+        if details:
+            self.cache.set_many(details)
+
+    def resolve(self, artist_ids, fallback_client=None, progress=None):
+        """
+        Returns {artist_id: details or None} for the unique, non-empty artist_ids.
+        progress (a jobs.Job) gets 'artists_total'/'artists_resolved' updates.
+        """
+        unique_ids = list(filter(None, set(artist_ids)))
+        known = self.cache.get_many(unique_ids) # Includes negative (None) entries
+        missing = [aid for aid in unique_ids if aid not in known]
+        metrics.inc('artist_catalog_artists_total', len(known), source='cache')
+        if progress:
+            progress.set('artists_total', len(unique_ids))
+            progress.set('artists_resolved', len(known))
+        if not missing:
+            return known
+
+        # Claim the artists nobody is fetching yet; wait for the others
+        with self._lock:
+            waiting = {aid: self._inflight[aid] for aid in missing if aid in self._inflight}
+            claimed = [aid for aid in missing if aid not in waiting]
+            batches = [claimed[i:i + ARTISTS_PER_REQUEST] for i in range(0, len(claimed), ARTISTS_PER_REQUEST)]
+            events = [threading.Event() for _ in batches]
+            for batch_ids, event in zip(batches, events):
+                for aid in batch_ids:
+                    self._inflight[aid] = event
+        logging.info(f"Need to fetch details for {len(claimed)} artists ({len(waiting)} already being fetched).")
+
+        for batch_ids, event in zip(batches, events):
+            try:
+                known.update(self._fetch_batch(batch_ids, fallback_client))
+            finally:
+                with self._lock:
+                    for aid in batch_ids:
+                        self._inflight.pop(aid, None)
+                event.set()
+            if progress:
+                progress.incr('artists_resolved', len(batch_ids))
+        metrics.inc('artist_catalog_artists_total', len(claimed), source='fetched')
+
+        if waiting:
+            for event in set(waiting.values()):
+                event.wait(timeout=30)
+            known.update(self.cache.get_many(waiting))
+            for aid in waiting:
+                known.setdefault(aid, None) # The other lookup timed out
+            metrics.inc('artist_catalog_artists_total', len(waiting), source='shared')
+            if progress:
+                progress.incr('artists_resolved', len(waiting))
+        return known
+
+    def _fetch_batch(self, batch_ids, fallback_client):
+        """Fetches one batch (app client first) and stores it. Returns {artist_id: details or None}."""
+        clients = [('app', self.get_app_client()), ('user', fallback_client)]
+        for name, client in clients:
+            if client is None:
+                continue
+            try:
+                with metrics.span('artist_batch'):
+                    artists_info = client.artists(batch_ids)
+            except Exception as e:
+                logging.error(f"Error fetching artist batch {batch_ids} with the {name} client: {e}")
+                continue
+            fetched = {a['id']: artist_to_details(a) for a in artists_info['artists'] if a}
+            # IDs the API returned no artist for are cached as negative entries
+            not_found = {aid: None for aid in batch_ids if aid not in fetched}
+            self.cache.set_many(fetched)
+            self.cache.set_many(not_found, ttl=self.negative_ttl)
+            metrics.inc('artist_catalog_requests_total', client=name)
+            return {**fetched, **not_found}
+
+        # Negative-cache the batch briefly to avoid hammering the API with retries
+        failed = {aid: None for aid in batch_ids}
+        self.cache.set_many(failed, ttl=self.negative_ttl)
+        return failed
+
+    # --- Background warming ---
+
+    def warm(self, artist_ids):
+        """Queues artists to be resolved in the background with the app client; returns immediately."""
+        if self.get_app_client() is None:
+            return # Warming must not spend a user's token
+        self._ensure_warmer()
+        with self._lock:
+            for aid in artist_ids:
+                if aid and aid not in self._pending and len(self._pending) < self.max_pending:
+                    self._pending[aid] = True
+            if self._pending:
+                self._wakeup.notify()
+
+    def _ensure_warmer(self):
+        # Started lazily, and again in each forked worker
+        if self._warmer_pid == os.getpid():
+            return
+        with self._lock:
+            if self._warmer_pid == os.getpid():
+                return
+            self._warmer_pid = os.getpid()
+            self._pending.clear()
+            threading.Thread(target=self._warm_forever, name='artist-catalog-warmer', daemon=True).start()
+
+    def _warm_forever(self):
+        while True:
+            with self._lock:
+                while not self._pending:
+                    self._wakeup.wait()
+                chunk = [self._pending.popitem(last=False)[0] for _ in range(min(WARM_CHUNK, len(self._pending)))]
+            try:
+                self.resolve(chunk)
+            except Exception as e:
+                logging.warning(f"Artist catalog warming failed: {e}")
+
+    def pending(self):
+        with self._lock:
+            return len(self._pending)
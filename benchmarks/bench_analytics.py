@@ -0,0 +1,111 @@
+"""
+Benchmarks analytics.compute_collection_stats() and the saves timeline on synthetic libraries.
+
+    python benchmarks/bench_analytics.py [--sizes 1000 10000 100000] [--repeat 3]
+
+Prints the best-of-N time for building the tables and computing the stats,
+next to the list-sort/Counter approach the routes used before, and for
+building the saves timeline (1000-record chunks, as the analysis reads them)
+and folding 50 new saves into it.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from analytics import build_track_table, build_artist_table, compute_collection_stats
+from timeline import SavesTimeline
+
+# Newest save of the synthetic libraries; older saves are spread over about ten years
+NEWEST_ADDED_AT = 1_700_000_000
+
+
+def make_library(n_tracks, seed=0):
+    """Returns (track records, artist details map) with roughly 1 artist per 5 tracks."""
+    rng = random.Random(seed)
+    n_artists = max(1, n_tracks // 5)
+    genres = [f'genre {i}' for i in range(max(10, n_artists // 20))]
+    details = {
+        f'artist{i}': {
+            'name': f'Artist {i}',
+            'genres': rng.sample(genres, rng.randint(0, 4)),
+            'followers': rng.choice([0, rng.randint(1, 10_000_000)]),
+            'image_url': None,
+        }
+        for i in range(n_artists)
+    }
+    records = []
+    for i in range(n_tracks):
+        a = int(rng.paretovariate(1.2)) % n_artists # A few artists dominate, like real libraries
+        records.append({
+            'track_id': f'track{i}',
+            'name': f'Track {i}',
+            'artist_name': f'Artist {a}',
+            'artists': [f'Artist {a}'],
+            'artist_id': f'artist{a}',
+            'popularity': rng.randint(0, 100),
+            'album_name': f'Album {i // 12}',
+            'album_image_url': None,
+            'added_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(NEWEST_ADDED_AT - i * 6000)),
+        })
+    return records, details
+
+
+def legacy_stats(data, artist_details_map):
+    """The previous per-route implementation (full sorts, Counter over an extended list)."""
+    top_artists = Counter(t['artist_name'] for t in data).most_common(10)
+    tracks = sorted(data, key=lambda x: x['popularity'], reverse=True)
+    top_tracks = tracks[:5]
+    non_zero = [t for t in tracks if t['popularity'] > 0]
+    bottom_tracks = sorted(non_zero if len(non_zero) >= 5 else tracks, key=lambda x: x['popularity'])[:5]
+    artists = sorted(({'id': aid, **d} for aid, d in artist_details_map.items()), key=lambda x: x['followers'], reverse=True)
+    all_genres = []
+    for t in data:
+        all_genres.extend(artist_details_map[t['artist_id']]['genres'])
+    return top_artists, top_tracks, bottom_tracks, artists[:5], Counter(all_genres).most_common(10)
+
+
+def build_timeline(records, chunk_size=1000):
+    timeline = SavesTimeline()
+    for i in range(0, len(records), chunk_size):
+        timeline.add(records[i:i + chunk_size])
+    return timeline
+
+
+def best_of(repeat, fn):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1_000, 10_000, 100_000])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'tracks':>8} {'artists':>8} {'tables ms':>10} {'stats ms':>9} {'legacy ms':>10} "
+          f"{'timeline ms':>12} {'+50 saves ms':>13}")
+    for n in args.sizes:
+        records, details = make_library(n)
+        tracks = build_track_table(records)
+        artists = build_artist_table(details)
+        t_tables = best_of(args.repeat, lambda: (build_track_table(records), build_artist_table(details)))
+        t_stats = best_of(args.repeat, lambda: compute_collection_stats(tracks, artists))
+        t_legacy = best_of(args.repeat, lambda: legacy_stats(records, details))
+        t_timeline = best_of(args.repeat, lambda: build_timeline(records).result(artists))
+        timeline = build_timeline(records)
+        t_incremental = best_of(args.repeat, lambda: (timeline.add(records[:50]), timeline.result(artists)))
+        print(f"{n:>8} {len(details):>8} {t_tables * 1000:>10.1f} {t_stats * 1000:>9.1f} {t_legacy * 1000:>10.1f} "
+              f"{t_timeline * 1000:>12.1f} {t_incremental * 1000:>13.1f}")
+
+
+if __name__ == '__main__':
+    main()
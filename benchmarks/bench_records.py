@@ -0,0 +1,74 @@
+"""
+Benchmarks the memory held by cached track lists as plain dicts and as shared records (record_store.py).
+
+    python benchmarks/bench_records.py [--users 100] [--playlists 5] [--tracks 300] [--catalog 50000]
+
+Simulates --users users with --playlists cached playlists of --tracks tracks
+each, drawn from a --catalog track catalog with a Pareto distribution so
+popular tracks recur across users, like real playlists. Each playlist's
+records are built fresh from synthetic API objects, as a fetch would. Prints
+the memory retained (tracemalloc) by the lists kept either as the record
+dicts or interned through a RecordStore, and the time spent interning.
+"""
+import argparse
+import gc
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_spotify import FakeSpotifyAPI
+from record_store import RecordStore
+from spotify_fetch import playlist_track_to_record
+
+
+def make_playlists(n_lists, n_tracks, catalog, seed=0):
+    """Returns n_lists lists of catalog track indexes."""
+    rng = random.Random(seed)
+    return [[int(rng.paretovariate(0.3)) % catalog for _ in range(n_tracks)] for _ in range(n_lists)]
+
+
+def retain(api, playlists, store):
+    """Builds every playlist's records; returns (kept lists, seconds spent in the store)."""
+    kept = []
+    seconds = 0.0
+    for indexes in playlists:
+        records = [playlist_track_to_record(api.track(i, markets=False)) for i in indexes]
+        if store is not None:
+            start = time.perf_counter()
+            records = store.add_tracks(records)
+            seconds += time.perf_counter() - start
+        kept.append(records)
+    return kept, seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--playlists', type=int, default=5, help='cached playlists per user')
+    parser.add_argument('--tracks', type=int, default=300, help='tracks per playlist')
+    parser.add_argument('--catalog', type=int, default=50_000)
+    args = parser.parse_args()
+
+    api = FakeSpotifyAPI(n_tracks=args.catalog)
+    playlists = make_playlists(args.users * args.playlists, args.tracks, args.catalog)
+    print(f"{args.users} users x {args.playlists} playlists x {args.tracks} tracks "
+          f"({len({i for p in playlists for i in p})} distinct tracks)")
+    print(f"{'records':>8} {'retained MB':>12} {'intern ms':>10}  store")
+    for mode in ('dicts', 'shared'):
+        store = None if mode == 'dicts' else RecordStore()
+        gc.collect()
+        tracemalloc.start()
+        kept, seconds = retain(api, playlists, store)
+        gc.collect()
+        retained, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"{mode:>8} {retained / 1e6:>12.1f} {seconds * 1000:>10.0f}  {store.stats() if store else '-'}")
+        del kept, store
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,205 @@
+"""
+End-to-end benchmark of the app's routes against benchmarks/fake_spotify.py.
+
+    python benchmarks/bench_routes.py [--sizes 1000 10000 100000] [--latency-ms 20]
+                                      [--rate-limit-prob 0.0] [--save results.json]
+                                      [--compare baseline.json] [--tolerance 0.25]
+
+For every library size a fresh fake API is started in this process and the
+app runs in a child process (so its peak RSS is measured alone) with empty
+caches and stores. Each scenario is timed from the first request until the
+page renders with data, following background jobs; the number of Spotify API
+requests it caused is read from the fake API. With --compare, the run exits
+with status 1 if a scenario got slower than the baseline by more than
+--tolerance, or needs more API requests.
+"""
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from fake_spotify import FakeSpotifyAPI, start_in_thread
+
+PLAYLIST_ID = '37i9dQZF1DXcBWIGoYBM5M'
+# Absolute slack on top of --tolerance, so tiny scenarios do not flap on timer noise
+MIN_REGRESSION_SECONDS = 0.05
+
+
+# --- Child process: drives the app with Flask's test client ---
+
+def fake_api_stats(prefix):
+    with urllib.request.urlopen(prefix.replace('/v1/', '/_stats')) as response:
+        return json.load(response)
+
+
+def api_requests(before, after):
+    return sum(after.get(k, 0) - before.get(k, 0) for k in after if k != 'rate_limited')
+
+
+def run_scenarios(prefix):
+    import app as appmod
+
+    client = appmod.app.test_client()
+    with client.session_transaction() as session:
+        session['token_info'] = {'access_token': 'bench', 'refresh_token': 'bench',
+                                 'expires_at': int(time.time()) + 24 * 3600}
+
+    def wait_for_jobs():
+        while any(not job.finished for job in list(appmod.job_manager._jobs.values())):
+            time.sleep(0.01)
+
+    def follow(response, method, path, **kwargs):
+        # Poll the background job shown on the page, then load the finished page
+        match = re.search(r'data-status-url="([^"]+)"', response.get_data(as_text=True))
+        if not match:
+            return response
+        while client.get(match.group(1)).get_json().get('status') not in ('done', 'failed', 'unknown'):
+            time.sleep(0.01)
+        return client.open(path, method=method, **kwargs)
+
+    def scenario(name, method, path, expect=200, **kwargs):
+        wait_for_jobs()
+        before = fake_api_stats(prefix)
+        start = time.perf_counter()
+        response = follow(client.open(path, method=method, **kwargs), method, path, **kwargs)
+        seconds = time.perf_counter() - start
+        assert response.status_code == expect, f"{name}: HTTP {response.status_code}"
+        assert b'class="error-message"' not in response.data, f"{name}: the page shows an error"
+        wait_for_jobs() # Background prefetches count towards this scenario's API requests
+        after = fake_api_stats(prefix)
+        return {'scenario': name, 'seconds': seconds, 'api_requests': api_requests(before, after),
+                'rate_limited': after.get('rate_limited', 0) - before.get('rate_limited', 0)}
+
+    def revalidate(name, path):
+        # A browser reload: sends back the ETag of the page it has
+        etag = client.get(path).headers['ETag']
+        return scenario(name, 'GET', path, expect=304, headers={'If-None-Match': etag})
+
+    results = [
+        scenario('dashboard cold', 'GET', '/dashboard'),
+        scenario('dashboard other range', 'GET', '/dashboard?time_range=short_term'),
+        scenario('dashboard reload', 'GET', '/dashboard'),
+        revalidate('dashboard revalidate', '/dashboard'),
+        scenario('liked_songs cold', 'GET', '/liked_songs'),
+        scenario('liked_songs cached', 'GET', '/liked_songs'),
+        revalidate('liked_songs revalidate', '/liked_songs'),
+    ]
+    appmod.analysis_cache.clear() # Forces a re-analysis on top of the stored library
+    results.append(scenario('liked_songs resync', 'GET', '/liked_songs'))
+    results.append(scenario('playlist cold', 'POST', '/playlist_analysis', data={'playlist_id_input': PLAYLIST_ID}))
+    results.append(scenario('playlist cached', 'GET', f'/playlist_analysis?id={PLAYLIST_ID}'))
+    results.append(revalidate('playlist revalidate', f'/playlist_analysis?id={PLAYLIST_ID}'))
+    results.append(scenario('api liked_songs', 'GET', '/api/v1/liked_songs'))
+    return results
+
+
+def child_main(prefix):
+    import resource
+    results = run_scenarios(prefix)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak_mb = peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024 # bytes on macOS, KiB on Linux
+    print(json.dumps({'results': results, 'peak_rss_mb': round(peak_mb, 1)}))
+
+
+# --- Parent process: one fake API and one app process per size ---
+
+def run_size(n_tracks, args):
+    api = FakeSpotifyAPI(n_tracks, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                         rate_limit_prob=args.rate_limit_prob, retry_after=args.retry_after)
+    server, prefix = start_in_thread(api)
+    try:
+        with tempfile.TemporaryDirectory(prefix='bench-routes-') as workdir:
+            env = dict(os.environ,
+                       FLASK_SECRET_KEY='bench',
+                       SPOTIFY_API_PREFIX=prefix,
+                       SPOTIFY_RATE_LIMIT=str(args.spotify_rate_limit),
+                       SPOTIFY_RATE_BURST=str(args.spotify_rate_limit),
+                       LIBRARY_DB_PATH=os.path.join(workdir, 'library.sqlite3'),
+                       CACHE_SQLITE_PATH=os.path.join(workdir, 'cache.sqlite3'),
+                       SESSION_SQLITE_PATH=os.path.join(workdir, 'sessions.sqlite3'),
+                       HISTORY_DB_PATH=os.path.join(workdir, 'history.sqlite3'),
+                       SIGNATURE_DB_PATH=os.path.join(workdir, 'signatures.sqlite3'),
+                       PYTHONPATH=REPO_DIR)
+            completed = subprocess.run([sys.executable, os.path.abspath(__file__), '--child', prefix],
+                                       cwd=workdir, env=env, capture_output=True, text=True)
+        if completed.returncode != 0:
+            sys.stderr.write(completed.stderr)
+            raise SystemExit(f"Benchmark child failed for {n_tracks} tracks.")
+        return json.loads(completed.stdout.strip().splitlines()[-1])
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def compare(report, baseline, tolerance):
+    """Returns a list of regressions of report against baseline."""
+    regressions = []
+    for size, run in report.items():
+        base_run = baseline.get(size)
+        if not base_run:
+            continue
+        base = {r['scenario']: r for r in base_run['results']}
+        for result in run['results']:
+            old = base.get(result['scenario'])
+            if not old:
+                continue
+            limit = old['seconds'] * (1 + tolerance) + MIN_REGRESSION_SECONDS
+            if result['seconds'] > limit:
+                regressions.append(f"{size} tracks, {result['scenario']}: {result['seconds']:.3f}s "
+                                   f"(baseline {old['seconds']:.3f}s)")
+            if result['api_requests'] > old['api_requests']:
+                regressions.append(f"{size} tracks, {result['scenario']}: {result['api_requests']} API requests "
+                                   f"(baseline {old['api_requests']})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1_000, 10_000, 100_000])
+    parser.add_argument('--latency-ms', type=float, default=20)
+    parser.add_argument('--jitter-ms', type=float, default=10)
+    parser.add_argument('--rate-limit-prob', type=float, default=0.0)
+    parser.add_argument('--retry-after', type=int, default=1)
+    parser.add_argument('--spotify-rate-limit', type=float, default=1000,
+                        help="SPOTIFY_RATE_LIMIT for the app (the default production limit would dominate)")
+    parser.add_argument('--save', help="Write the results as JSON (e.g. to use as a baseline)")
+    parser.add_argument('--compare', help="Baseline JSON from an earlier --save")
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        return child_main(args.child)
+
+    report = {}
+    print(f"{'tracks':>8} {'scenario':<24} {'seconds':>8} {'API reqs':>9} {'429s':>5}")
+    for n in args.sizes:
+        run = report[str(n)] = run_size(n, args)
+        for r in run['results']:
+            print(f"{n:>8} {r['scenario']:<24} {r['seconds']:>8.3f} {r['api_requests']:>9} {r['rate_limited']:>5}")
+        print(f"{n:>8} {'peak RSS (MB)':<24} {run['peak_rss_mb']:>8.1f}")
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+        print("No regressions against the baseline.")
+
+
+if __name__ == '__main__':
+    main()
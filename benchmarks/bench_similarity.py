@@ -0,0 +1,90 @@
+"""
+Benchmarks MinHash/LSH near-duplicate search (similarity.py) on synthetic playlists.
+
+    python benchmarks/bench_similarity.py [--sizes 1000 5000] [--threshold 0.7] [--exact-max 2000]
+
+Each synthetic set has --sizes playlists of 20-300 tracks drawn from a shared
+pool, one in ten of them an edited copy of another (some tracks swapped,
+some added). Prints the time to sign every playlist, to build the LSH index
+and to list the near-duplicate pairs, and the same search done exactly over
+all pairs of track sets (only up to --exact-max playlists, as it is
+quadratic), with the recall of the LSH search against it.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from itertools import combinations
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from similarity import LSHIndex, minhash
+
+
+def make_playlists(n_playlists, pool_size=200_000, seed=0):
+    """Returns n_playlists lists of track IDs; every tenth playlist is an edited copy of an earlier one."""
+    rng = random.Random(seed)
+    playlists = []
+    for i in range(n_playlists):
+        if i % 10 == 9:
+            original = rng.choice(playlists)
+            kept = rng.sample(original, int(len(original) * rng.uniform(0.8, 1.0)))
+            added = [f'track{rng.randrange(pool_size)}' for _ in range(int(len(original) * rng.uniform(0, 0.15)))]
+            playlists.append(kept + added)
+        else:
+            playlists.append([f'track{rng.randrange(pool_size)}' for _ in range(rng.randint(20, 300))])
+    return playlists
+
+
+def exact_pairs(playlists, threshold):
+    """Every pair whose track sets have a Jaccard similarity of at least threshold, by brute force."""
+    sets = [set(p) for p in playlists]
+    pairs = set()
+    for a, b in combinations(range(len(sets)), 2):
+        shared = len(sets[a] & sets[b])
+        if shared and shared / (len(sets[a]) + len(sets[b]) - shared) >= threshold:
+            pairs.add((a, b))
+    return pairs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1_000, 5_000])
+    parser.add_argument('--threshold', type=float, default=0.7)
+    parser.add_argument('--exact-max', type=int, default=2_000)
+    args = parser.parse_args()
+
+    print(f"{'playlists':>9} {'sign ms':>9} {'index ms':>9} {'search ms':>10} {'candidates':>11} {'pairs':>6} "
+          f"{'exact ms':>9} {'recall':>7}")
+    for n in args.sizes:
+        playlists = make_playlists(n)
+
+        start = time.perf_counter()
+        signatures = [minhash(p) for p in playlists]
+        t_sign = time.perf_counter() - start
+
+        start = time.perf_counter()
+        index = LSHIndex()
+        for i, signature in enumerate(signatures):
+            index.add(i, signature)
+        t_index = time.perf_counter() - start
+
+        start = time.perf_counter()
+        found = index.near_duplicates(args.threshold)
+        t_search = time.perf_counter() - start
+        candidates = len(index.candidate_pairs())
+
+        exact_ms, recall = '-', '-'
+        if n <= args.exact_max:
+            start = time.perf_counter()
+            expected = exact_pairs(playlists, args.threshold)
+            exact_ms = f"{(time.perf_counter() - start) * 1000:.1f}"
+            hits = expected & {pair for pair, _ in found}
+            recall = f"{len(hits) / len(expected):.3f}" if expected else '-'
+        print(f"{n:>9} {t_sign * 1000:>9.1f} {t_index * 1000:>9.1f} {t_search * 1000:>10.1f} {candidates:>11} "
+              f"{len(found):>6} {exact_ms:>9} {recall:>7}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""
+Cold-start benchmark: how long a fresh worker takes to import the app and
+serve its first request, with lazy imports on and off.
+
+    python benchmarks/bench_startup.py [--runs 5] [--save startup.json]
+                                       [--compare baseline.json] [--tolerance 0.25]
+
+Each run is a new interpreter (nothing cached in-process) with empty stores in
+a temporary directory. Reported per mode, as the median over --runs:
+importing the app, create_app(), the first /login_page request, and the
+deferred analytics import. With --compare, the run exits with status 1 if a
+phase got slower than the baseline by more than --tolerance.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+MODES = {'lazy': '1', 'eager': '0'}
+# Absolute slack on top of --tolerance, so fast phases do not flap on timer noise
+MIN_REGRESSION_SECONDS = 0.02
+
+CHILD = """
+import json, sys, time
+start = time.perf_counter()
+import app as appmod
+imported = time.perf_counter()
+application = appmod.create_app()
+created = time.perf_counter()
+assert application.test_client().get('/login_page').status_code == 200
+served = time.perf_counter()
+pandas_loaded = 'pandas' in sys.modules
+appmod.import_analytics()
+analytics = time.perf_counter()
+print(json.dumps({'import': imported - start, 'create_app': created - imported,
+                  'first_request': served - created, 'analytics': analytics - served,
+                  'pandas_before_request': pandas_loaded}))
+"""
+
+
+def run_once(lazy):
+    with tempfile.TemporaryDirectory(prefix='bench-startup-') as workdir:
+        env = dict(os.environ,
+                   FLASK_SECRET_KEY='bench',
+                   LAZY_IMPORTS=lazy,
+                   LIBRARY_DB_PATH=os.path.join(workdir, 'library.sqlite3'),
+                   CACHE_SQLITE_PATH=os.path.join(workdir, 'cache.sqlite3'),
+                   SESSION_SQLITE_PATH=os.path.join(workdir, 'sessions.sqlite3'),
+                   HISTORY_DB_PATH=os.path.join(workdir, 'history.sqlite3'),
+                   SIGNATURE_DB_PATH=os.path.join(workdir, 'signatures.sqlite3'),
+                   PYTHONPATH=REPO_DIR)
+        completed = subprocess.run([sys.executable, '-c', CHILD], cwd=workdir, env=env,
+                                   capture_output=True, text=True)
+    if completed.returncode != 0:
+        sys.stderr.write(completed.stderr)
+        raise SystemExit("Benchmark child failed.")
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def compare(report, baseline, tolerance):
+    """Returns a list of regressions of report against baseline."""
+    regressions = []
+    for mode, phases in report.items():
+        for phase, seconds in phases.items():
+            old = baseline.get(mode, {}).get(phase)
+            if old is not None and seconds > old * (1 + tolerance) + MIN_REGRESSION_SECONDS:
+                regressions.append(f"{mode}, {phase}: {seconds:.3f}s (baseline {old:.3f}s)")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--save', help="Write the results as JSON (e.g. to use as a baseline)")
+    parser.add_argument('--compare', help="Baseline JSON from an earlier --save")
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    args = parser.parse_args()
+
+    report = {}
+    print(f"{'mode':<6} {'phase':<14} {'median s':>9} {'min s':>7}")
+    for mode, lazy in MODES.items():
+        runs = [run_once(lazy) for _ in range(args.runs)]
+        report[mode] = {}
+        for phase in ('import', 'create_app', 'first_request', 'analytics'):
+            values = [r[phase] for r in runs]
+            report[mode][phase] = statistics.median(values)
+            print(f"{mode:<6} {phase:<14} {statistics.median(values):>9.3f} {min(values):>7.3f}")
+        print(f"{mode:<6} pandas loaded before the first request: {runs[0]['pandas_before_request']}")
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+        print("No regressions against the baseline.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,268 @@
+"""
+Local stand-in for the Spotify Web API, serving a synthetic library.
+
+    python benchmarks/fake_spotify.py [--tracks 10000] [--playlists 5] [--port 8900] [--latency-ms 50]
+                                      [--rate-limit-prob 0.01] [--retry-after 1]
+
+Then start the app against it:
+
+    SPOTIFY_API_PREFIX=http://127.0.0.1:8900/v1/ python app.py
+
+Implements the endpoints the app uses (profile, saved tracks, top items,
+artists, the user's --playlists playlists and their items, recently played)
+over a deterministic library of --tracks saved tracks; every playlist has the
+same tracks. Each request sleeps --latency-ms (plus up to --jitter-ms), and a
+fraction --rate-limit-prob of requests is answered with 429 and Retry-After.
+A 'fields' projection is approximated by dropping the market lists (which
+every projection the app uses leaves out). GET /_stats returns
+request counts per endpoint, POST /_reset clears them.
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+# Every real track/album carries one of these lists, which dominates its payload size
+MARKETS = [f'{chr(65 + i // 26)}{chr(65 + i % 26)}' for i in range(180)]
+BASE_ADDED_AT = 1_700_000_000 # Newest saved track; older ones are an hour apart
+SNAPSHOT_ID = 'snapshot-1'
+PLAY_INTERVAL = 240 # Seconds between the synthetic recently-played plays
+
+
+class FakeSpotifyAPI:
+    """
+    Deterministic synthetic library: track i is by one of roughly n/5 artists,
+    picked with a Pareto distribution so a few artists dominate, like real
+    libraries. Objects are generated on request, so 100k tracks cost little memory.
+    """
+
+    def __init__(self, n_tracks=10_000, latency_ms=0, jitter_ms=0, rate_limit_prob=0.0, retry_after=1, seed=0,
+                 n_playlists=5):
+        self.n_tracks = n_tracks
+        self.n_playlists = n_playlists
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.rate_limit_prob = rate_limit_prob
+        self.retry_after = retry_after
+        self.n_artists = max(1, n_tracks // 5)
+        rng = random.Random(seed)
+        self._track_artist = [int(rng.paretovariate(1.2)) % self.n_artists for _ in range(n_tracks)]
+        self._track_popularity = [rng.randint(0, 100) for _ in range(n_tracks)]
+        genres = [f'genre {i}' for i in range(max(10, self.n_artists // 20))]
+        self._artist_genres = [rng.sample(genres, rng.randint(0, 4)) for _ in range(self.n_artists)]
+        self._artist_followers = [rng.choice([0, rng.randint(1, 10_000_000)]) for _ in range(self.n_artists)]
+        self._rng = random.Random(seed + 1)
+        self._lock = threading.Lock()
+        self.stats = Counter()
+
+    # --- Objects ---
+
+    def artist_id(self, j):
+        return f'artist{j:07d}'
+
+    def simple_artist(self, j):
+        return {'id': self.artist_id(j), 'name': f'Artist {j}', 'type': 'artist',
+                'uri': f'spotify:artist:{self.artist_id(j)}'}
+
+    def full_artist(self, j):
+        return {**self.simple_artist(j),
+                'genres': self._artist_genres[j],
+                'followers': {'href': None, 'total': self._artist_followers[j]},
+                'popularity': 20 + j % 80,
+                'images': _images(f'artist{j}')}
+
+    def simple_playlist(self, playlist_id):
+        return {'id': playlist_id, 'name': f'Benchmark playlist {playlist_id}', 'type': 'playlist',
+                'owner': {'display_name': 'Benchmark User'}, 'snapshot_id': SNAPSHOT_ID,
+                'tracks': {'href': None, 'total': self.n_tracks}}
+
+    def track(self, i, markets=True):
+        j = self._track_artist[i]
+        album = i // 12
+        track = {
+            'id': f'track{i:07d}',
+            'name': f'Track {i}',
+            'popularity': self._track_popularity[i],
+            'duration_ms': 180_000 + i % 120_000,
+            'explicit': i % 7 == 0,
+            'artists': [self.simple_artist(j)],
+            'album': {'id': f'album{album:07d}', 'name': f'Album {album}', 'album_type': 'album',
+                      'release_date': f'{1970 + album % 55}-01-01', 'images': _images(f'album{album}'),
+                      'artists': [self.simple_artist(j)], 'available_markets': MARKETS},
+            'available_markets': MARKETS,
+            'uri': f'spotify:track:track{i:07d}',
+        }
+        if not markets:
+            del track['available_markets'], track['album']['available_markets']
+        return track
+
+    def added_at(self, i):
+        return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(BASE_ADDED_AT - i * 3600))
+
+    # --- Endpoints ---
+
+    def route(self, path, query):
+        """Returns (endpoint name, status, body) for a GET request."""
+        path = path.rstrip('/') # Spotipy requests e.g. 'me/'
+        limit = int(query.get('limit', ['20'])[0])
+        offset = int(query.get('offset', ['0'])[0])
+        if path == '/v1/me':
+            return 'me', 200, {'id': 'bench-user', 'display_name': 'Benchmark User', 'type': 'user'}
+        if path == '/v1/me/tracks':
+            items = [{'added_at': self.added_at(i), 'track': self.track(i)}
+                     for i in range(offset, min(offset + limit, self.n_tracks))]
+            return 'me/tracks', 200, self._page(items, limit, offset)
+        if path == '/v1/me/playlists':
+            items = [self.simple_playlist(f'benchplaylist{j:09d}')
+                     for j in range(offset, min(offset + limit, self.n_playlists))]
+            return 'me/playlists', 200, self._page(items, limit, offset, total=self.n_playlists)
+        if path == '/v1/me/top/artists':
+            seen = list(dict.fromkeys(self._track_artist[:limit * 10]))[:limit]
+            return 'me/top/artists', 200, self._page([self.full_artist(j) for j in seen], limit, 0)
+        if path == '/v1/me/top/tracks':
+            return 'me/top/tracks', 200, self._page([self.track(i) for i in range(min(limit, self.n_tracks))], limit, 0)
+        if path == '/v1/me/player/recently-played':
+            # A play every PLAY_INTERVAL seconds up to now; 'after' (ms) pages forward from a cursor
+            latest = int(time.time()) // PLAY_INTERVAL
+            limit = min(limit, 50)
+            if 'after' in query:
+                first = int(query['after'][0]) // 1000 // PLAY_INTERVAL + 1
+                slots = list(range(min(latest, first + limit - 1), first - 1, -1))
+            else:
+                slots = list(range(latest, latest - limit, -1))
+            items = [{'played_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(slot * PLAY_INTERVAL)),
+                      'track': self.track(slot % self.n_tracks)} for slot in slots]
+            newest = slots[0] * PLAY_INTERVAL * 1000 if slots else None
+            more = 'after' in query and slots and slots[0] < latest
+            return 'me/player/recently-played', 200, {
+                'items': items, 'limit': limit,
+                'next': f'?after={newest}&limit={limit}' if more else None,
+                'cursors': {'after': str(newest), 'before': str(slots[-1] * PLAY_INTERVAL * 1000)} if slots else None}
+        if path == '/v1/artists':
+            ids = [i for i in query.get('ids', [''])[0].split(',') if i]
+            return 'artists', 200, {'artists': [self._artist_by_id(i) for i in ids]}
+        match = re.match(r'^/v1/playlists/([^/]+)(/tracks)?$', path)
+        if match:
+            if match.group(2):
+                markets = 'fields' not in query
+                items = [{'added_at': self.added_at(i), 'track': self.track(i, markets)}
+                         for i in range(offset, min(offset + limit, self.n_tracks))]
+                return 'playlists/tracks', 200, self._page(items, limit, offset)
+            return 'playlists', 200, {'id': match.group(1), 'name': f'Benchmark playlist {match.group(1)}',
+                                      'owner': {'display_name': 'Benchmark User'}, 'description': '',
+                                      'images': _images(match.group(1)), 'snapshot_id': SNAPSHOT_ID,
+                                      'external_urls': {'spotify': f'https://open.spotify.com/playlist/{match.group(1)}'}}
+        return 'unknown', 404, {'error': {'status': 404, 'message': 'Not found'}}
+
+    def _artist_by_id(self, artist_id):
+        match = re.match(r'^artist(\d+)$', artist_id)
+        if not match or int(match.group(1)) >= self.n_artists:
+            return None
+        return self.full_artist(int(match.group(1)))
+
+    def _page(self, items, limit, offset, total=None):
+        total = self.n_tracks if total is None else total
+        next_offset = offset + limit
+        return {'items': items, 'total': total, 'limit': limit, 'offset': offset,
+                'next': f'?offset={next_offset}&limit={limit}' if next_offset < total else None}
+
+    def should_rate_limit(self):
+        with self._lock:
+            return self.rate_limit_prob > 0 and self._rng.random() < self.rate_limit_prob
+
+    def count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    def reset(self):
+        with self._lock:
+            self.stats.clear()
+
+
+def _images(key):
+    return [{'url': f'https://i.scdn.co/image/{key}-{size}', 'height': size, 'width': size} for size in (640, 300, 64)]
+
+
+class FakeSpotifyHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1' # Keep-alive, like the real API
+    api = None # Set by make_server()
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == '/_stats':
+            return self._send(200, dict(self.api.stats))
+        api = self.api
+        if api.latency_ms or api.jitter_ms:
+            time.sleep((api.latency_ms + random.uniform(0, api.jitter_ms)) / 1000)
+        if api.should_rate_limit():
+            api.count('rate_limited')
+            return self._send(429, {'error': {'status': 429, 'message': 'API rate limit exceeded'}},
+                              {'Retry-After': str(api.retry_after)})
+        name, status, body = api.route(url.path, parse_qs(url.query))
+        api.count(name)
+        self._send(status, body)
+
+    def do_POST(self):
+        if urlparse(self.path).path == '/_reset':
+            self.api.reset()
+            return self._send(200, {})
+        self._send(404, {'error': {'status': 404, 'message': 'Not found'}})
+
+    def _send(self, status, body, headers=None):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass # Thousands of requests per run; keep the output readable
+
+
+def make_server(api, host='127.0.0.1', port=0):
+    """Creates (but does not start) a threaded HTTP server for api; port 0 picks a free port."""
+    handler = type('BoundFakeSpotifyHandler', (FakeSpotifyHandler,), {'api': api})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def start_in_thread(api, host='127.0.0.1', port=0):
+    """Starts a server for api on a daemon thread. Returns (server, API prefix URL)."""
+    server = make_server(api, host, port)
+    threading.Thread(target=server.serve_forever, name='fake-spotify', daemon=True).start()
+    return server, f'http://{host}:{server.server_port}/v1/'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--tracks', type=int, default=10_000)
+    parser.add_argument('--playlists', type=int, default=5)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8900)
+    parser.add_argument('--latency-ms', type=float, default=0)
+    parser.add_argument('--jitter-ms', type=float, default=0)
+    parser.add_argument('--rate-limit-prob', type=float, default=0.0)
+    parser.add_argument('--retry-after', type=int, default=1)
+    args = parser.parse_args()
+
+    api = FakeSpotifyAPI(args.tracks, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                         rate_limit_prob=args.rate_limit_prob, retry_after=args.retry_after, n_playlists=args.playlists)
+    server = make_server(api, args.host, args.port)
+    print(f"Fake Spotify API with {args.tracks} tracks at http://{args.host}:{server.server_port}/v1/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,244 @@
+import json
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from db import ThreadLocalSQLite
+
+# Returned by get() when a key is absent or expired (None is a valid cached value,
+# used for negative entries such as "artist not found").
+MISSING = object()
+
+# Every cache created through create_cache(), so stats can be reported in one place
+_registry = {}
+
+
+class TTLCache:
+    """
+    In-memory LRU cache with per-entry expiry. Thread-safe, private to the process.
+    """
+    backend = 'memory'
+
+    def __init__(self, name, max_entries=10000, ttl=3600):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data = OrderedDict() # key -> (expires_at, value), oldest access first
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def _get_locked(self, key, now):
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return MISSING
+        expires_at, value = entry
+        if expires_at <= now:
+            del self._data[key]
+            self.expirations += 1
+            self.misses += 1
+            return MISSING
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def get(self, key, default=MISSING):
+        """Returns the cached value for key, or default if absent/expired."""
+        with self._lock:
+            value = self._get_locked(key, time.time())
+        return default if value is MISSING else value
+
+    def get_many(self, keys):
+        """Returns a dict of the keys that are present (values may be None)."""
+        found = {}
+        now = time.time()
+        with self._lock:
+            for key in keys:
+                value = self._get_locked(key, now)
+                if value is not MISSING:
+                    found[key] = value
+        return found
+
+    def set(self, key, value, ttl=None):
+        self.set_many({key: value}, ttl=ttl)
+
+    def set_many(self, mapping, ttl=None):
+        """Stores every key/value in mapping with the given (or default) TTL."""
+        if not mapping:
+            return
+        expires_at = time.time() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            for key, value in mapping.items():
+                self._data[key] = (expires_at, value)
+                self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False) # Drop least recently used
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        """Returns hit/miss/eviction counters and the current size."""
+        return {
+            'name': self.name,
+            'backend': self.backend,
+            'size': len(self),
+            'max_entries': self.max_entries,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+        }
+
+
+def json_default(value):
+    """json.dumps() default: serializes objects with a to_json() method (such as interned records)."""
+    to_json = getattr(value, 'to_json', None)
+    if to_json is None:
+        raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+    return to_json()
+
+
+class SQLiteCache(TTLCache):
+    """
+    On-disk cache in a SQLite file, shared by every worker process on the host.
+    Values must be JSON-serializable; objects with a to_json() method (such as
+    interned records) are stored as its result and read back as plain data.
+    Size is capped by evicting least recently used rows. Counters are per
+    process.
+    """
+    backend = 'sqlite'
+
+    # Only rewrite accessed_at on a hit if it is older than this (avoids a write per read)
+    TOUCH_INTERVAL = 60
+
+    def __init__(self, name, path, max_entries=100000, ttl=3600):
+        super().__init__(name, max_entries=max_entries, ttl=ttl)
+        self.path = path
+        self.table = 'cache_' + re.sub(r'\W', '_', name)
+        self._db = ThreadLocalSQLite(path)
+        conn = self._conn()
+        with conn:
+            conn.execute(f"CREATE TABLE IF NOT EXISTS {self.table} ("
+                         "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                         "expires_at REAL NOT NULL, accessed_at REAL NOT NULL)")
+            conn.execute(f"CREATE INDEX IF NOT EXISTS {self.table}_accessed ON {self.table} (accessed_at)")
+
+    def _conn(self):
+        return self._db.connection()
+
+    def get(self, key, default=MISSING):
+        return self.get_many([key]).get(key, default)
+
+    def get_many(self, keys):
+        keys = list(keys)
+        found = {}
+        if not keys:
+            return found
+        now = time.time()
+        conn = self._conn()
+        expired = []
+        touch = []
+        rows = {}
+        # SQLite limits bound parameters per statement, so query in chunks
+        for i in range(0, len(keys), 500):
+            chunk = keys[i:i+500]
+            placeholders = ','.join('?' * len(chunk))
+            for key, value, expires_at, accessed_at in conn.execute(
+                    f"SELECT key, value, expires_at, accessed_at FROM {self.table} WHERE key IN ({placeholders})", chunk):
+                rows[key] = (value, expires_at, accessed_at)
+
+        for key in keys:
+            row = rows.get(key)
+            if row is None:
+                self.misses += 1
+                continue
+            value, expires_at, accessed_at = row
+            if expires_at <= now:
+                expired.append(key)
+                self.expirations += 1
+                self.misses += 1
+                continue
+            found[key] = json.loads(value)
+            self.hits += 1
+            if now - accessed_at > self.TOUCH_INTERVAL:
+                touch.append(key)
+
+        if expired or touch:
+            with conn:
+                conn.executemany(f"DELETE FROM {self.table} WHERE key = ? AND expires_at <= ?",
+                                 [(key, now) for key in expired])
+                conn.executemany(f"UPDATE {self.table} SET accessed_at = ? WHERE key = ?",
+                                 [(now, key) for key in touch])
+        return found
+
+    def set_many(self, mapping, ttl=None):
+        if not mapping:
+            return
+        now = time.time()
+        expires_at = now + (self.ttl if ttl is None else ttl)
+        rows = [(key, json.dumps(value, default=json_default), expires_at, now) for key, value in mapping.items()]
+        conn = self._conn()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.executemany(f"INSERT OR REPLACE INTO {self.table} (key, value, expires_at, accessed_at) "
+                             "VALUES (?, ?, ?, ?)", rows)
+            size = conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+            if size > self.max_entries:
+                # Expired rows go first, then the least recently used
+                conn.execute(f"DELETE FROM {self.table} WHERE expires_at <= ?", (now,))
+                size = conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+                excess = size - self.max_entries
+                if excess > 0:
+                    conn.execute(f"DELETE FROM {self.table} WHERE key IN "
+                                 f"(SELECT key FROM {self.table} ORDER BY accessed_at LIMIT ?)", (excess,))
+                    self.evictions += excess
+
+    def delete(self, key):
+        conn = self._conn()
+        with conn:
+            conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+
+    def clear(self):
+        conn = self._conn()
+        with conn:
+            conn.execute(f"DELETE FROM {self.table}")
+
+    def __len__(self):
+        return self._conn().execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+
+def create_cache(name, backend='memory', path=None, max_entries=10000, ttl=3600):
+    """
+    Creates a named cache. backend is 'memory' (per process) or 'sqlite'
+    (shared by all workers on the host through the file at path).
+    """
+    if backend == 'sqlite':
+        if not path:
+            raise ValueError(f"Cache '{name}' uses the sqlite backend but no path was given.")
+        cache = SQLiteCache(name, path, max_entries=max_entries, ttl=ttl)
+    elif backend == 'memory':
+        cache = TTLCache(name, max_entries=max_entries, ttl=ttl)
+    else:
+        raise ValueError(f"Unknown cache backend '{backend}' for cache '{name}'.")
+    _registry[name] = cache
+    logging.info(f"Created {backend} cache '{name}' (max {max_entries} entries, TTL {ttl}s).")
+    return cache
+
+
+def all_cache_stats():
+    """Returns stats() for every cache created through create_cache()."""
+    return [cache.stats() for cache in _registry.values()]
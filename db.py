@@ -0,0 +1,28 @@
+import os
+import sqlite3
+import threading
+
+
+class ThreadLocalSQLite:
+    """
+    Hands out one SQLite connection per thread (and per process, so connections
+    are never shared across a fork). Connections run in autocommit mode with WAL
+    journaling, so several workers can read while one writes.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def connection(self):
+        """Returns this thread's connection, opening it on first use."""
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid():
+            local.conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            local.conn.execute('PRAGMA journal_mode=WAL')
+            local.conn.execute('PRAGMA synchronous=NORMAL')
+            local.pid = os.getpid()
+        return local.conn
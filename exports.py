@@ -0,0 +1,128 @@
+import csv
+import importlib.util
+import io
+import json
+
+# Columns of every export, in order
+EXPORT_COLUMNS = ['track_id', 'name', 'artists', 'artist_id', 'artist_name', 'album_name', 'popularity',
+                  'added_at', 'artist_genres', 'artist_followers']
+
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv; charset=utf-8',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+
+def export_row_chunks(record_chunks, lookup_artists):
+    """
+    Joins chunks of liked-songs or playlist track records with artist details.
+    lookup_artists(artist_ids) must return {artist_id: details or None}; it is
+    called once per chunk, so only one chunk's rows are in memory at a time.
+    Yields lists of row dicts with EXPORT_COLUMNS.
+    """
+    for records in record_chunks:
+        artists = lookup_artists({r['artist_id'] for r in records if r.get('artist_id')})
+        rows = []
+        for record in records:
+            details = artists.get(record.get('artist_id')) or {}
+            rows.append({
+                'track_id': record.get('track_id') or record.get('id'), # Playlist records use 'id'
+                'name': record.get('name'),
+                'artists': record.get('artists') or [],
+                'artist_id': record.get('artist_id'),
+                'artist_name': record.get('artist_name'),
+                'album_name': record.get('album_name'),
+                'popularity': record.get('popularity'),
+                'added_at': record.get('added_at'),
+                'artist_genres': details.get('genres') or [],
+                'artist_followers': details.get('followers'),
+            })
+        yield rows
+
+
+def ndjson_stream(row_chunks):
+    """Yields one encoded block of JSON lines per chunk."""
+    for rows in row_chunks:
+        yield ''.join(json.dumps(row, separators=(',', ':'), ensure_ascii=False) + '\n' for row in rows).encode('utf-8')
+
+
+def csv_stream(row_chunks):
+    """Yields the header, then one encoded block of CSV lines per chunk. Lists are joined with '; '."""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_COLUMNS)
+    writer.writeheader()
+    for rows in row_chunks:
+        for row in rows:
+            writer.writerow({**row, 'artists': '; '.join(row['artists']),
+                             'artist_genres': '; '.join(row['artist_genres'])})
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell(): # Header only: there were no rows
+        yield buffer.getvalue().encode('utf-8')
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file object that hands its bytes to a generator instead of keeping them."""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def parquet_stream(row_chunks):
+    """
+    Yields a Parquet file with one row group per chunk, sent as soon as each
+    row group is written. Requires pyarrow (raises ImportError otherwise).
+    """
+    import pyarrow as pa # Optional dependency, only needed for Parquet exports
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([
+        ('track_id', pa.string()), ('name', pa.string()), ('artists', pa.list_(pa.string())),
+        ('artist_id', pa.string()), ('artist_name', pa.string()), ('album_name', pa.string()),
+        ('popularity', pa.int32()), ('added_at', pa.string()), ('artist_genres', pa.list_(pa.string())),
+        ('artist_followers', pa.int64()),
+    ])
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema, compression='snappy')
+    try:
+        for rows in row_chunks:
+            writer.write_table(pa.Table.from_pylist(rows, schema=schema))
+            yield sink.drain()
+    finally:
+        writer.close() # Writes the footer
+    yield sink.drain()
+
+
+def parquet_available():
+    """Whether the optional pyarrow package is installed (checked without importing it, so pages can ask cheaply)."""
+    return importlib.util.find_spec('pyarrow') is not None
+
+
+def export_stream(export_format, row_chunks):
+    """Returns the byte generator for export_format ('ndjson', 'csv' or 'parquet')."""
+    if export_format == 'ndjson':
+        return ndjson_stream(row_chunks)
+    if export_format == 'csv':
+        return csv_stream(row_chunks)
+    if export_format == 'parquet':
+        return parquet_stream(row_chunks)
+    raise ValueError(f"Unknown export format '{export_format}'.")
@@ -0,0 +1,131 @@
+from array import array
+from itertools import chain, islice
+from record_store import intern
+
+
+class GenreIndex:
+    """
+    Genre -> artists -> tracks for one user's library. Tracks, artists and
+    genres are numbered in the order they are first seen and every relation is
+    an array('i') of those codes, so the index stays compact and lookups cost
+    O(result). Artists are indexed by the primary artist of each track, like
+    the analyses. Records can be added incrementally; version is the library
+    version the index reflects. IDs and genre names are interned, so every
+    user's index shares one copy of each. missing_details counts the artists
+    indexed without details (so without genres); an artist keeps the genres
+    it was first indexed with, so such an index must be rebuilt to gain them.
+    """
+
+    def __init__(self, version=None):
+        self.version = version
+        self.track_ids = []               # track code -> track id
+        self.track_codes = {}             # track id -> track code
+        self.artist_ids = []              # artist code -> artist id
+        self.artist_codes = {}            # artist id -> artist code
+        self.artist_tracks = []           # artist code -> array of track codes
+        self.artist_genres = []           # artist code -> array of genre codes
+        self.genre_names = []             # genre code -> genre name
+        self.genre_codes = {}             # genre name -> genre code
+        self.genre_artists = []           # genre code -> array of artist codes (ascending)
+        self.genre_track_counts = array('i') # genre code -> tracks by its artists
+        self.missing_details = 0          # artists indexed without details
+
+    def __len__(self):
+        return len(self.track_ids)
+
+    def add_records(self, records, artist_details):
+        """
+        Indexes track records ('track_id' or 'id', and 'artist_id').
+        artist_details maps artist IDs to details with 'genres' (or None);
+        artists without details are indexed without genres. Already indexed
+        tracks are skipped.
+        """
+        for record in records:
+            track_id = record.get('track_id') or record.get('id')
+            artist_id = record.get('artist_id')
+            if not track_id or not artist_id or track_id in self.track_codes:
+                continue
+            artist_code = self._artist_code(artist_id, artist_details.get(artist_id))
+            track_code = len(self.track_ids)
+            track_id = intern(track_id)
+            self.track_ids.append(track_id)
+            self.track_codes[track_id] = track_code
+            self.artist_tracks[artist_code].append(track_code)
+            for genre_code in self.artist_genres[artist_code]:
+                self.genre_track_counts[genre_code] += 1
+
+    def _artist_code(self, artist_id, details):
+        code = self.artist_codes.get(artist_id)
+        if code is not None:
+            return code
+        code = len(self.artist_ids)
+        artist_id = intern(artist_id)
+        self.artist_ids.append(artist_id)
+        self.artist_codes[artist_id] = code
+        self.artist_tracks.append(array('i'))
+        if details is None:
+            self.missing_details += 1
+        genres = array('i', (self._genre_code(g) for g in dict.fromkeys((details or {}).get('genres') or [])))
+        self.artist_genres.append(genres)
+        for genre_code in genres:
+            self.genre_artists[genre_code].append(code) # New codes are the largest, so arrays stay sorted
+        return code
+
+    def _genre_code(self, genre):
+        code = self.genre_codes.get(genre)
+        if code is None:
+            code = len(self.genre_names)
+            genre = intern(genre)
+            self.genre_names.append(genre)
+            self.genre_codes[genre] = code
+            self.genre_artists.append(array('i'))
+            self.genre_track_counts.append(0)
+        return code
+
+    # --- Queries ---
+
+    def genres(self):
+        """Returns [{'genre', 'artists', 'tracks'}] for every genre, most tracks first."""
+        order = sorted(range(len(self.genre_names)), key=lambda g: (-self.genre_track_counts[g], self.genre_names[g]))
+        return [{'genre': self.genre_names[g], 'artists': len(self.genre_artists[g]),
+                 'tracks': self.genre_track_counts[g]} for g in order]
+
+    def tracks_in_genre(self, genre, offset=0, limit=50):
+        """
+        Returns (total, track_ids) for the tracks whose primary artist has the
+        genre, grouped by artist; only the requested page is materialized.
+        """
+        code = self.genre_codes.get(genre)
+        if code is None:
+            return 0, []
+        tracks = chain.from_iterable(self.artist_tracks[a] for a in self.genre_artists[code])
+        page = islice(tracks, offset, offset + limit)
+        return self.genre_track_counts[code], [self.track_ids[t] for t in page]
+
+    def artists_in_genres(self, genres):
+        """
+        Returns [(artist_id, track_count)] for the artists tagged with every
+        genre in genres, by most tracks. Intersects starting from the smallest genre.
+        """
+        codes = [self.genre_codes.get(g) for g in dict.fromkeys(genres)]
+        if not codes or None in codes:
+            return []
+        codes.sort(key=lambda g: len(self.genre_artists[g]))
+        matches = self.genre_artists[codes[0]]
+        for code in codes[1:]:
+            others = set(self.genre_artists[code])
+            matches = [a for a in matches if a in others]
+        result = [(self.artist_ids[a], len(self.artist_tracks[a])) for a in matches]
+        result.sort(key=lambda item: -item[1])
+        return result
+
+
+def build_genre_index(record_chunks, lookup_artists, version=None):
+    """
+    Builds a GenreIndex from chunks of records. lookup_artists(artist_ids) must
+    return {artist_id: details or None}; it is called once per chunk.
+    """
+    index = GenreIndex(version)
+    for records in record_chunks:
+        index.add_records(records, lookup_artists({r['artist_id'] for r in records if r.get('artist_id')}))
+    return index
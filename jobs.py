@@ -0,0 +1,131 @@
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import metrics
+
+
+class Job:
+    """
+    A long-running analysis executed on the job pool. The job function receives
+    the Job and reports progress through incr()/set() and stage() so the status
+    endpoint can show pages fetched, artists resolved and per-stage timings.
+    """
+
+    def __init__(self, key):
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.status = 'queued' # queued -> running -> done | failed
+        self.progress = {}
+        self.stages = []
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+        self._lock = threading.Lock()
+
+    def incr(self, name, amount=1):
+        """Adds amount to a progress counter (e.g. 'pages_fetched')."""
+        with self._lock:
+            self.progress[name] = self.progress.get(name, 0) + amount
+
+    def set(self, name, value):
+        with self._lock:
+            self.progress[name] = value
+
+    @contextmanager
+    def stage(self, name):
+        """Times a stage of the job; the current stage is reported while it runs."""
+        start = time.perf_counter()
+        self.set('stage', name)
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            metrics.observe('stage_duration_seconds', seconds, stage=name)
+            with self._lock:
+                self.stages.append({'name': name, 'seconds': round(seconds, 3)})
+
+    @property
+    def finished(self):
+        return self.status in ('done', 'failed')
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                'id': self.id,
+                'status': self.status,
+                'progress': dict(self.progress),
+                'stages': list(self.stages),
+                'error': self.error,
+                'elapsed': round((self.finished_at or time.time()) - self.created_at, 3),
+            }
+
+
+class JobManager:
+    """
+    Runs jobs on a bounded thread pool. Submitting a key that already has an
+    unfinished job returns that job instead of starting a second one. Finished
+    jobs are kept for `retention` seconds so clients can read their final status.
+    Jobs live in the worker process that started them.
+    """
+
+    def __init__(self, max_workers=4, retention=600):
+        self.max_workers = max_workers
+        self.retention = retention
+        self._jobs = {}   # job id -> Job
+        self._active = {} # key -> Job still queued or running
+        self._lock = threading.Lock()
+        self._executor = None
+        self._executor_pid = None
+
+    def _get_executor(self):
+        # Created lazily (and again after a fork) since threads do not survive forking
+        if self._executor is None or self._executor_pid != os.getpid():
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='job')
+            self._executor_pid = os.getpid()
+        return self._executor
+
+    def submit(self, key, fn, *args, **kwargs):
+        """Starts fn(job, *args, **kwargs) in the background (deduplicated by key)."""
+        with self._lock:
+            self._prune()
+            job = self._active.get(key)
+            if job is not None:
+                return job
+            job = Job(key)
+            self._jobs[job.id] = job
+            self._active[key] = job
+            self._get_executor().submit(self._run, job, fn, args, kwargs)
+        logging.info(f"Started background job {job.id} for {key}.")
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _run(self, job, fn, args, kwargs):
+        job.status = 'running'
+        try:
+            fn(job, *args, **kwargs)
+            job.status = 'done'
+        except Exception as e:
+            logging.exception(f"Background job {job.id} for {job.key} failed:")
+            job.error = getattr(e, 'msg', None) or str(e) or "An unexpected error occurred."
+            job.status = 'failed'
+        finally:
+            job.finished_at = time.time()
+            kind = job.key.split(':', 1)[0]
+            metrics.inc('jobs_total', kind=kind, status=job.status)
+            metrics.observe('job_duration_seconds', job.finished_at - job.created_at, kind=kind)
+            with self._lock:
+                if self._active.get(job.key) is job:
+                    del self._active[job.key]
+            logging.info(f"Background job {job.id} for {job.key} {job.status} in {job.finished_at - job.created_at:.2f}s.")
+
+    def _prune(self):
+        cutoff = time.time() - self.retention
+        for job_id in [jid for jid, job in self._jobs.items() if job.finished_at and job.finished_at < cutoff]:
+            del self._jobs[job_id]
@@ -0,0 +1,286 @@
+import json
+import logging
+import time
+import uuid
+from collections import namedtuple
+from db import ThreadLocalSQLite
+from spotify_fetch import fetch_pages, DEFAULT_MAX_WORKERS
+
+SAVED_TRACKS_PAGE_SIZE = 50
+
+# Outcome of sync_library(): mode is 'full', 'incremental' or 'unchanged'
+LibrarySync = namedtuple('LibrarySync', ['mode', 'total', 'added', 'api_calls', 'failed_offsets', 'version'])
+
+
+def saved_item_to_record(item):
+    """
+    Converts a saved-track API item into the compact record stored per track.
+    Returns None for items without a usable track.
+    """
+    track = item.get('track') if item else None
+    if not track or not track.get('id'):
+        return None
+    primary_artist = track['artists'][0] if track.get('artists') else None
+    album = track.get('album') or {}
+    return {
+        'track_id': track['id'],
+        'added_at': item.get('added_at'),
+        'name': track.get('name', 'N/A'),
+        'artist_name': primary_artist['name'] if primary_artist else 'N/A',
+        'artists': [a.get('name', 'N/A') for a in track.get('artists', [])],
+        'artist_id': primary_artist['id'] if primary_artist and primary_artist.get('id') else None,
+        'popularity': track.get('popularity', 0),
+        'album_name': album.get('name', 'N/A'),
+        'album_image_url': album['images'][0].get('url') if album.get('images') else None, # Largest image
+    }
+
+
+class LibraryStore:
+    """
+    Persisted per-user snapshot of the saved-tracks library (SQLite).
+    Rows keep the API's newest-first order through a per-user sequence number
+    that grows as tracks are added. 'version' increments whenever the stored
+    library changes.
+    """
+
+    def __init__(self, path):
+        self._db = ThreadLocalSQLite(path)
+        conn = self._db.connection()
+        with conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS library_meta ("
+                         "user_id TEXT PRIMARY KEY, total INTEGER NOT NULL, max_seq INTEGER NOT NULL, "
+                         "synced_at REAL NOT NULL, full_synced_at REAL NOT NULL, version INTEGER NOT NULL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS library_tracks ("
+                         "user_id TEXT NOT NULL, track_id TEXT NOT NULL, added_at TEXT, seq INTEGER NOT NULL, "
+                         "record TEXT NOT NULL, PRIMARY KEY (user_id, track_id))")
+            conn.execute("CREATE INDEX IF NOT EXISTS library_tracks_seq ON library_tracks (user_id, seq)")
+
+    def get_meta(self, user_id):
+        """Returns the user's snapshot metadata as a dict, or None if never synced."""
+        row = self._db.connection().execute(
+            "SELECT total, max_seq, synced_at, full_synced_at, version FROM library_meta WHERE user_id = ?",
+            (user_id,)).fetchone()
+        if row is None:
+            return None
+        return dict(zip(['total', 'max_seq', 'synced_at', 'full_synced_at', 'version'], row))
+
+    def count(self, user_id):
+        return self._db.connection().execute(
+            "SELECT COUNT(*) FROM library_tracks WHERE user_id = ?", (user_id,)).fetchone()[0]
+
+    def known_added_at(self, user_id, track_ids):
+        """Returns {track_id: added_at} for the given IDs already in the snapshot."""
+        track_ids = list(track_ids)
+        known = {}
+        conn = self._db.connection()
+        for i in range(0, len(track_ids), 500):
+            chunk = track_ids[i:i+500]
+            placeholders = ','.join('?' * len(chunk))
+            known.update(conn.execute(
+                f"SELECT track_id, added_at FROM library_tracks WHERE user_id = ? AND track_id IN ({placeholders})",
+                [user_id, *chunk]).fetchall())
+        return known
+
+    def iter_record_chunks(self, user_id, chunk_size=1000):
+        """Yields the stored records newest-first as lists of at most chunk_size."""
+        cursor = self._db.connection().execute(
+            "SELECT record FROM library_tracks WHERE user_id = ? ORDER BY seq DESC", (user_id,))
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield [json.loads(record) for (record,) in rows]
+
+    def iter_records(self, user_id, chunk_size=1000):
+        """Yields the stored records newest-first, reading chunk_size rows at a time."""
+        for chunk in self.iter_record_chunks(user_id, chunk_size):
+            yield from chunk
+
+    def get_records(self, user_id, track_ids):
+        """Returns the stored records of track_ids (in that order; unknown IDs are skipped)."""
+        track_ids = list(track_ids)
+        found = {}
+        conn = self._db.connection()
+        for i in range(0, len(track_ids), 500):
+            chunk = track_ids[i:i+500]
+            placeholders = ','.join('?' * len(chunk))
+            for track_id, record in conn.execute(
+                    f"SELECT track_id, record FROM library_tracks WHERE user_id = ? AND track_id IN ({placeholders})",
+                    [user_id, *chunk]):
+                found[track_id] = json.loads(record)
+        return [found[t] for t in track_ids if t in found]
+
+    def load_records(self, user_id):
+        return list(self.iter_records(user_id))
+
+    def begin_replace(self, user_id):
+        """
+        Starts a full replacement of the user's snapshot. Records are written
+        under a private staging key with write_staged() while pages arrive, and
+        swapped in atomically by finish_replace(), so readers never see a
+        half-written library. Returns the staging key.
+        """
+        return f"~staging:{user_id}:{uuid.uuid4().hex}"
+
+    def write_staged(self, staging_key, seq_records):
+        """Writes (seq, record) pairs under staging_key; higher seq means newer."""
+        rows = [(staging_key, r['track_id'], r['added_at'], seq, json.dumps(r)) for seq, r in seq_records]
+        conn = self._db.connection()
+        with conn:
+            conn.executemany("INSERT OR REPLACE INTO library_tracks (user_id, track_id, added_at, seq, record) "
+                             "VALUES (?, ?, ?, ?, ?)", rows)
+
+    def finish_replace(self, user_id, staging_key, total, complete=True):
+        """
+        Swaps the staged records in as the user's snapshot. An incomplete
+        snapshot (pages failed) is marked so the next sync is full again.
+        """
+        now = time.time()
+        conn = self._db.connection()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute("SELECT version FROM library_meta WHERE user_id = ?", (user_id,)).fetchone()
+            version = (row[0] if row else 0) + 1
+            conn.execute("DELETE FROM library_tracks WHERE user_id = ?", (user_id,))
+            conn.execute("UPDATE library_tracks SET user_id = ? WHERE user_id = ?", (user_id, staging_key))
+            conn.execute("INSERT OR REPLACE INTO library_meta (user_id, total, max_seq, synced_at, full_synced_at, version) "
+                         "VALUES (?, ?, ?, ?, ?, ?)", (user_id, total, total, now, now if complete else 0, version))
+        return version
+
+    def abort_replace(self, staging_key):
+        """Drops the records staged under staging_key; the user's snapshot is left as it was."""
+        conn = self._db.connection()
+        with conn:
+            conn.execute("DELETE FROM library_tracks WHERE user_id = ?", (staging_key,))
+
+    def replace_all(self, user_id, records, total, complete=True):
+        """Replaces the user's snapshot with records (given newest-first)."""
+        staging_key = self.begin_replace(user_id)
+        try:
+            self.write_staged(staging_key, [(len(records) - i, r) for i, r in enumerate(records)])
+        except Exception:
+            self.abort_replace(staging_key)
+            raise
+        return self.finish_replace(user_id, staging_key, total, complete=complete)
+
+    def prepend(self, user_id, records, total):
+        """
+        Adds newly saved records (given newest-first) on top of the snapshot.
+        A re-saved track replaces its older row.
+        """
+        meta = self.get_meta(user_id)
+        now = time.time()
+        conn = self._db.connection()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            version = meta['version']
+            if records:
+                max_seq = meta['max_seq'] + len(records)
+                rows = [(user_id, r['track_id'], r['added_at'], max_seq - i, json.dumps(r)) for i, r in enumerate(records)]
+                conn.executemany("INSERT OR REPLACE INTO library_tracks (user_id, track_id, added_at, seq, record) "
+                                 "VALUES (?, ?, ?, ?, ?)", rows)
+                version += 1
+            else:
+                max_seq = meta['max_seq']
+            conn.execute("UPDATE library_meta SET total = ?, max_seq = ?, synced_at = ?, version = ? WHERE user_id = ?",
+                         (total, max_seq, now, version, user_id))
+        return version
+
+
+def _records_from_items(items):
+    return [r for r in (saved_item_to_record(item) for item in items) if r]
+
+
+def sync_library(sp, store, user_id, max_workers=DEFAULT_MAX_WORKERS,
+                 full_resync_interval=7 * 24 * 3600, max_incremental_pages=20, progress=None, on_page=None):
+    """
+    Brings the user's stored library up to date with as few API calls as possible.
+    Saved tracks come newest-first by added_at, so after the first sync only the
+    pages down to the first already-known track are fetched. Removals are caught
+    by comparing the API's 'total' with the merged count, which forces a full
+    (concurrent) refetch; so does an expired full_resync_interval.
+    progress (a jobs.Job) is passed on to the page fetcher for full syncs, and
+    on_page(offset, items) sees each page of a full sync as it arrives.
+    """
+    page_size = SAVED_TRACKS_PAGE_SIZE
+    api_calls = [0]
+
+    def fetch_page(offset):
+        api_calls[0] += 1
+        return sp.current_user_saved_tracks(limit=page_size, offset=offset)
+
+    first_page = fetch_page(0)
+    total = first_page.get('total') or 0
+    meta = store.get_meta(user_id)
+
+    def full_sync(reason):
+        logging.info(f"Full library sync for user {user_id}: {reason}")
+        staging_key = store.begin_replace(user_id)
+        added = [0]
+        first_served = []
+
+        def fetch_cached_first(offset):
+            # Reuse the first page we already have instead of requesting it again
+            if offset == 0 and not first_served:
+                first_served.append(True)
+                return first_page
+            return fetch_page(offset)
+
+        def store_page(offset, items):
+            # Each page is converted and written as it arrives, then dropped;
+            # seq counts down from 'total' so the snapshot keeps API order
+            seq_records = [(total - offset - i, record) for i, record in
+                           enumerate(saved_item_to_record(item) for item in items) if record]
+            store.write_staged(staging_key, seq_records)
+            added[0] += len(seq_records)
+            if on_page:
+                on_page(offset, items)
+
+        try:
+            total_synced, failed_offsets = fetch_pages(fetch_cached_first, page_size, store_page,
+                                                       max_workers=max_workers, progress=progress)
+        except Exception:
+            # Staged rows would otherwise stay in library_tracks forever
+            store.abort_replace(staging_key)
+            raise
+        version = store.finish_replace(user_id, staging_key, total_synced, complete=not failed_offsets)
+        return LibrarySync('full', total_synced, added[0], api_calls[0], failed_offsets, version)
+
+    if meta is None:
+        return full_sync("no stored snapshot")
+    if time.time() - meta['full_synced_at'] > full_resync_interval:
+        return full_sync("periodic full resync")
+
+    # Walk pages newest-first until we reach a track we already have
+    new_records = []
+    page = first_page
+    offset = 0
+    found_known = False
+    while True:
+        records = _records_from_items(page.get('items', []) or [])
+        known = store.known_added_at(user_id, [r['track_id'] for r in records])
+        for record in records:
+            if known.get(record['track_id']) == record['added_at']:
+                found_known = True
+                break
+            new_records.append(record)
+        if found_known or not page.get('next'):
+            break
+        if api_calls[0] >= max_incremental_pages:
+            return full_sync("too many new tracks for an incremental sync")
+        offset += page_size
+        page = fetch_page(offset)
+
+    if not found_known and meta['total']:
+        return full_sync("no overlap with the stored snapshot")
+
+    # Re-saved tracks replace their old row rather than adding one
+    already_stored = store.known_added_at(user_id, [r['track_id'] for r in new_records])
+    expected_count = meta['total'] + sum(1 for r in new_records if r['track_id'] not in already_stored)
+    if expected_count != total:
+        return full_sync(f"count mismatch (stored {expected_count}, API reports {total}), tracks were removed")
+
+    version = store.prepend(user_id, new_records, total)
+    mode = 'incremental' if new_records else 'unchanged'
+    logging.info(f"Library sync for user {user_id}: {mode}, {len(new_records)} new tracks, {api_calls[0]} API call(s).")
+    return LibrarySync(mode, total, len(new_records), api_calls[0], [], version)
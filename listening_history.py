@@ -0,0 +1,251 @@
+import logging
+import time
+from collections import Counter, namedtuple
+from datetime import datetime
+from db import ThreadLocalSQLite
+
+# Spotify's page size cap for recently played; the endpoint only reaches this far back
+RECENTLY_PLAYED_LIMIT = 50
+DAY_MS = 24 * 3600 * 1000
+
+# Outcome of poll_recently_played()
+HistoryPoll = namedtuple('HistoryPoll', ['new_plays', 'api_calls', 'after'])
+
+
+def parse_played_at(value):
+    """Converts a played_at timestamp ('2024-01-31T21:04:05.123Z') to epoch milliseconds."""
+    return int(datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp() * 1000)
+
+
+def play_item_to_record(item):
+    """
+    Converts a recently-played item into the compact play record stored in the
+    log. Returns None for items without a usable track or timestamp.
+    """
+    track = item.get('track') if item else None
+    if not track or not track.get('id') or not item.get('played_at'):
+        return None
+    primary_artist = track['artists'][0] if track.get('artists') else None
+    return {
+        'played_at': parse_played_at(item['played_at']),
+        'track_id': track['id'],
+        'duration_ms': track.get('duration_ms') or 0,
+        'name': track.get('name', 'N/A'),
+        'artist_id': primary_artist['id'] if primary_artist and primary_artist.get('id') else None,
+        'artist_name': primary_artist['name'] if primary_artist else 'N/A',
+    }
+
+
+class PlayLog:
+    """
+    Append-only per-user log of played tracks (SQLite), with rolling aggregates
+    updated in the same transaction as each appended batch: totals, plays and
+    listening time per day, per track and per primary artist, and streaks of
+    consecutive days with plays. Readers use the aggregates and never scan the
+    log. Days are UTC, and listening time is estimated from track lengths
+    (Spotify does not report how much of a track was played).
+    """
+
+    def __init__(self, path):
+        self._db = ThreadLocalSQLite(path)
+        conn = self._db.connection()
+        with conn:
+            # One row per play: the key is (user, timestamp), details live in play_tracks
+            conn.execute("CREATE TABLE IF NOT EXISTS plays ("
+                         "user_id TEXT NOT NULL, played_at INTEGER NOT NULL, track_id TEXT NOT NULL, "
+                         "PRIMARY KEY (user_id, played_at)) WITHOUT ROWID")
+            conn.execute("CREATE TABLE IF NOT EXISTS play_tracks ("
+                         "track_id TEXT PRIMARY KEY, name TEXT, artist_id TEXT, artist_name TEXT, "
+                         "duration_ms INTEGER NOT NULL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS play_stats ("
+                         "user_id TEXT PRIMARY KEY, after INTEGER, plays INTEGER NOT NULL, listened_ms INTEGER NOT NULL, "
+                         "active_days INTEGER NOT NULL, first_day INTEGER, last_day INTEGER, "
+                         "current_streak INTEGER NOT NULL, longest_streak INTEGER NOT NULL, polled_at REAL NOT NULL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS play_days ("
+                         "user_id TEXT NOT NULL, day INTEGER NOT NULL, plays INTEGER NOT NULL, listened_ms INTEGER NOT NULL, "
+                         "PRIMARY KEY (user_id, day)) WITHOUT ROWID")
+            conn.execute("CREATE TABLE IF NOT EXISTS play_track_totals ("
+                         "user_id TEXT NOT NULL, track_id TEXT NOT NULL, plays INTEGER NOT NULL, listened_ms INTEGER NOT NULL, "
+                         "PRIMARY KEY (user_id, track_id)) WITHOUT ROWID")
+            conn.execute("CREATE TABLE IF NOT EXISTS play_artist_totals ("
+                         "user_id TEXT NOT NULL, artist_id TEXT NOT NULL, artist_name TEXT, plays INTEGER NOT NULL, "
+                         "listened_ms INTEGER NOT NULL, PRIMARY KEY (user_id, artist_id)) WITHOUT ROWID")
+
+    def get_stats(self, user_id):
+        """
+        Returns the user's aggregate row as a dict, or None if never polled.
+        'after' is the polling cursor: the newest logged play (epoch ms).
+        """
+        row = self._db.connection().execute(
+            "SELECT after, plays, listened_ms, active_days, first_day, last_day, current_streak, longest_streak, "
+            "polled_at FROM play_stats WHERE user_id = ?", (user_id,)).fetchone()
+        if row is None:
+            return None
+        return dict(zip(['after', 'plays', 'listened_ms', 'active_days', 'first_day', 'last_day',
+                         'current_streak', 'longest_streak', 'polled_at'], row))
+
+    def append(self, user_id, records):
+        """
+        Appends play records (any order) and folds them into the aggregates.
+        Plays at or before the stored cursor are skipped, so overlapping or
+        concurrent polls never count a play twice. Returns the number appended.
+        """
+        now = time.time()
+        conn = self._db.connection()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            stats = self.get_stats(user_id) or {'after': None, 'plays': 0, 'listened_ms': 0, 'active_days': 0,
+                                                'first_day': None, 'last_day': None, 'current_streak': 0,
+                                                'longest_streak': 0}
+            after = stats['after'] or 0
+            new = sorted((r for r in records if r['played_at'] > after), key=lambda r: r['played_at'])
+            # The timestamp is the key, so a repeated timestamp is one play, and
+            # plays already in the log (e.g. after a cursor reset) are not counted again
+            new = list({r['played_at']: r for r in new}.values())
+            if new:
+                logged = {played_at for (played_at,) in conn.execute(
+                    "SELECT played_at FROM plays WHERE user_id = ? AND played_at BETWEEN ? AND ?",
+                    (user_id, new[0]['played_at'], new[-1]['played_at']))}
+                new = [r for r in new if r['played_at'] not in logged]
+
+            if new:
+                conn.executemany("INSERT INTO plays (user_id, played_at, track_id) VALUES (?, ?, ?)",
+                                 [(user_id, r['played_at'], r['track_id']) for r in new])
+                conn.executemany("INSERT OR REPLACE INTO play_tracks (track_id, name, artist_id, artist_name, duration_ms) "
+                                 "VALUES (?, ?, ?, ?, ?)",
+                                 list({r['track_id']: (r['track_id'], r['name'], r['artist_id'], r['artist_name'],
+                                                       r['duration_ms']) for r in new}.values()))
+
+                day_plays, day_ms = Counter(), Counter()
+                track_plays, track_ms = Counter(), Counter()
+                artist_plays, artist_ms, artist_names = Counter(), Counter(), {}
+                for r in new:
+                    day = r['played_at'] // DAY_MS
+                    day_plays[day] += 1
+                    day_ms[day] += r['duration_ms']
+                    track_plays[r['track_id']] += 1
+                    track_ms[r['track_id']] += r['duration_ms']
+                    if r['artist_id']:
+                        artist_plays[r['artist_id']] += 1
+                        artist_ms[r['artist_id']] += r['duration_ms']
+                        artist_names[r['artist_id']] = r['artist_name']
+
+                conn.executemany("INSERT INTO play_days (user_id, day, plays, listened_ms) VALUES (?, ?, ?, ?) "
+                                 "ON CONFLICT (user_id, day) DO UPDATE SET plays = plays + excluded.plays, "
+                                 "listened_ms = listened_ms + excluded.listened_ms",
+                                 [(user_id, day, count, day_ms[day]) for day, count in day_plays.items()])
+                conn.executemany("INSERT INTO play_track_totals (user_id, track_id, plays, listened_ms) VALUES (?, ?, ?, ?) "
+                                 "ON CONFLICT (user_id, track_id) DO UPDATE SET plays = plays + excluded.plays, "
+                                 "listened_ms = listened_ms + excluded.listened_ms",
+                                 [(user_id, tid, count, track_ms[tid]) for tid, count in track_plays.items()])
+                conn.executemany("INSERT INTO play_artist_totals (user_id, artist_id, artist_name, plays, listened_ms) "
+                                 "VALUES (?, ?, ?, ?, ?) ON CONFLICT (user_id, artist_id) DO UPDATE SET "
+                                 "artist_name = excluded.artist_name, plays = plays + excluded.plays, "
+                                 "listened_ms = listened_ms + excluded.listened_ms",
+                                 [(user_id, aid, artist_names[aid], count, artist_ms[aid]) for aid, count in artist_plays.items()])
+
+                # New plays are newer than the cursor, so their days extend the streak from last_day on
+                for day in sorted(day_plays):
+                    if stats['last_day'] is not None and day <= stats['last_day']:
+                        continue
+                    consecutive = stats['last_day'] is not None and day == stats['last_day'] + 1
+                    stats['current_streak'] = stats['current_streak'] + 1 if consecutive else 1
+                    stats['longest_streak'] = max(stats['longest_streak'], stats['current_streak'])
+                    stats['active_days'] += 1
+                    stats['last_day'] = day
+                    if stats['first_day'] is None:
+                        stats['first_day'] = day
+                stats['plays'] += len(new)
+                stats['listened_ms'] += sum(r['duration_ms'] for r in new)
+
+            if records:
+                stats['after'] = max(after, max(r['played_at'] for r in records))
+            conn.execute("INSERT OR REPLACE INTO play_stats (user_id, after, plays, listened_ms, active_days, first_day, "
+                         "last_day, current_streak, longest_streak, polled_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                         (user_id, stats['after'], stats['plays'], stats['listened_ms'], stats['active_days'],
+                          stats['first_day'], stats['last_day'], stats['current_streak'], stats['longest_streak'], now))
+        return len(new)
+
+    # --- Reads (aggregates only) ---
+
+    def summary(self, user_id, now=None):
+        """
+        Returns the headline numbers for the history page, or None if never
+        polled. The current streak counts only if it reaches today or yesterday.
+        """
+        stats = self.get_stats(user_id)
+        if stats is None:
+            return None
+        today = int((now or time.time()) * 1000) // DAY_MS
+        current_streak = stats['current_streak'] if stats['last_day'] is not None and stats['last_day'] >= today - 1 else 0
+        return {
+            'plays': stats['plays'],
+            'hours_listened': round(stats['listened_ms'] / 3_600_000, 1),
+            'active_days': stats['active_days'],
+            'current_streak': current_streak,
+            'longest_streak': stats['longest_streak'],
+            'first_day': _day_label(stats['first_day']),
+            'last_played_at': stats['after'],
+            'polled_at': stats['polled_at'],
+        }
+
+    def daily(self, user_id, days=90, now=None):
+        """Returns [{'day', 'plays', 'minutes'}] for the last `days` UTC days, oldest first (days without plays are 0)."""
+        today = int((now or time.time()) * 1000) // DAY_MS
+        first = today - days + 1
+        rows = {day: (plays, ms) for day, plays, ms in self._db.connection().execute(
+            "SELECT day, plays, listened_ms FROM play_days WHERE user_id = ? AND day >= ?", (user_id, first))}
+        return [{'day': _day_label(day), 'plays': rows.get(day, (0, 0))[0], 'minutes': round(rows.get(day, (0, 0))[1] / 60_000)}
+                for day in range(first, today + 1)]
+
+    def top_tracks(self, user_id, limit=10):
+        rows = self._db.connection().execute(
+            "SELECT t.track_id, p.name, p.artist_name, t.plays, t.listened_ms FROM play_track_totals t "
+            "JOIN play_tracks p ON p.track_id = t.track_id WHERE t.user_id = ? "
+            "ORDER BY t.plays DESC, t.listened_ms DESC LIMIT ?", (user_id, limit)).fetchall()
+        return [{'id': tid, 'name': name, 'artist_name': artist_name, 'plays': plays, 'minutes': round(ms / 60_000)}
+                for tid, name, artist_name, plays, ms in rows]
+
+    def top_artists(self, user_id, limit=10):
+        rows = self._db.connection().execute(
+            "SELECT artist_id, artist_name, plays, listened_ms FROM play_artist_totals WHERE user_id = ? "
+            "ORDER BY plays DESC, listened_ms DESC LIMIT ?", (user_id, limit)).fetchall()
+        return [{'id': aid, 'name': name, 'plays': plays, 'minutes': round(ms / 60_000)} for aid, name, plays, ms in rows]
+
+    def recent_plays(self, user_id, limit=20):
+        """Returns the newest logged plays (a range read of the log's primary key)."""
+        rows = self._db.connection().execute(
+            "SELECT l.played_at, p.name, p.artist_name FROM plays l JOIN play_tracks p ON p.track_id = l.track_id "
+            "WHERE l.user_id = ? ORDER BY l.played_at DESC LIMIT ?", (user_id, limit)).fetchall()
+        return [{'played_at': time.strftime('%Y-%m-%d %H:%M', time.gmtime(played_at / 1000)), 'name': name,
+                 'artist_name': artist_name} for played_at, name, artist_name in rows]
+
+
+def _day_label(day):
+    return time.strftime('%Y-%m-%d', time.gmtime(day * 86400)) if day is not None else None
+
+
+def poll_recently_played(sp, log, user_id, max_pages=5):
+    """
+    Appends the user's plays since the stored cursor to the log. The first
+    poll takes the latest page; later ones page forward with the 'after'
+    cursor until no newer plays are returned or max_pages is reached. Spotify only keeps the latest
+    RECENTLY_PLAYED_LIMIT plays, so plays older than that at poll time are lost.
+    """
+    stats = log.get_stats(user_id)
+    after = stats['after'] if stats and stats['after'] else None
+    first_poll = after is None
+    records = []
+    api_calls = 0
+    while api_calls < max_pages:
+        api_calls += 1
+        page = sp.current_user_recently_played(limit=RECENTLY_PLAYED_LIMIT, after=after)
+        batch = [r for r in (play_item_to_record(item) for item in page.get('items', []) or []) if r]
+        records.extend(batch)
+        next_after = (page.get('cursors') or {}).get('after')
+        if first_poll or not batch or not page.get('next') or not next_after or int(next_after) <= (after or 0):
+            break
+        after = int(next_after)
+    new_plays = log.append(user_id, records)
+    logging.info(f"Listening history for user {user_id}: {new_plays} new play(s), {api_calls} API call(s).")
+    return HistoryPoll(new_plays, api_calls, log.get_stats(user_id)['after'])
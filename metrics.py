@@ -0,0 +1,220 @@
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from cache import all_cache_stats
+from flask import g, has_request_context, request, before_render_template, template_rendered
+
+# Upper bounds (seconds) of the latency histogram buckets
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# Every metric we export: name -> (type, help)
+METRICS = {
+    'http_requests_total': ('counter', 'HTTP requests handled, by endpoint, method and status.'),
+    'http_request_duration_seconds': ('histogram', 'Time spent handling HTTP requests, by endpoint.'),
+    'stage_duration_seconds': ('histogram', 'Time spent in instrumented stages (paging, artist batches, analytics, index builds, rendering).'),
+    'spotify_requests_total': ('counter', 'Requests sent to the Spotify Web API, by endpoint and status.'),
+    'spotify_request_duration_seconds': ('histogram', 'Latency of Spotify Web API requests, by endpoint.'),
+    'spotify_retries_total': ('counter', 'Spotify requests re-sent, by reason (429 or 5xx).'),
+    'spotify_response_bytes_total': ('counter', 'Response body bytes received from the Spotify Web API.'),
+    'jobs_total': ('counter', 'Finished background jobs, by kind and status.'),
+    'job_duration_seconds': ('histogram', 'Wall time of background jobs from submission to completion, by kind.'),
+    'cache_hits_total': ('counter', 'Cache hits, by cache.'),
+    'cache_misses_total': ('counter', 'Cache misses (including expired entries), by cache.'),
+    'cache_evictions_total': ('counter', 'Entries evicted to respect the size cap, by cache.'),
+    'cache_entries': ('gauge', 'Entries currently stored, by cache.'),
+    'artist_catalog_artists_total': ('counter', 'Artists looked up in the catalog, by source (cache, fetched, shared with a concurrent lookup).'),
+    'artist_catalog_requests_total': ('counter', 'Artist batch requests made by the catalog, by client (app or user).'),
+    'artist_catalog_pending': ('gauge', 'Artists queued for background warming.'),
+    'record_store_records': ('gauge', 'Interned records shared by cached playlists and top items, by kind.'),
+    'rendered_pages_total': ('counter', 'Page responses by page and result: rendered, served from the page cache, or not modified (304).'),
+    'export_rows_total': ('counter', 'Rows streamed by library and playlist exports, by format.'),
+    'startup_seconds': ('gauge', 'One-off startup costs: importing the app, and deferred imports on first use.'),
+    'sessions_expired_total': ('counter', 'Expired sessions removed by the sweeper, by backend.'),
+    'history_plays_total': ('counter', 'Plays appended to listening-history logs from recently played.'),
+}
+
+
+class Registry:
+    """
+    Thread-safe in-process store of counters and histograms, rendered in the
+    Prometheus text format. Collectors add samples computed at scrape time
+    (e.g. cache sizes). Values are per process.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self._counters = defaultdict(float)  # (name, labels) -> value
+        self._histograms = {}                # (name, labels) -> [bucket counts..., sum, count]
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] += amount
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            series = self._histograms.get(key)
+            if series is None:
+                series = self._histograms[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def register_collector(self, collect):
+        """collect() must return (name, labels_dict, value) samples for METRICS names."""
+        self._collectors.append(collect)
+
+    def render(self):
+        samples = defaultdict(list) # name -> [(labels, value)]
+        with self._lock:
+            for (name, labels), value in self._counters.items():
+                samples[name].append((labels, value))
+            histograms = {key: list(series) for key, series in self._histograms.items()}
+        for collect in self._collectors:
+            for name, labels, value in collect():
+                samples[name].append((tuple(sorted(labels.items())), value))
+        for (name, labels), series in histograms.items():
+            for bound, count in zip(self.buckets, series):
+                samples[name + '_bucket'].append((labels + (('le', _format_value(bound)),), count))
+            samples[name + '_bucket'].append((labels + (('le', '+Inf'),), series[-1]))
+            samples[name + '_sum'].append((labels, series[-2]))
+            samples[name + '_count'].append((labels, series[-1]))
+
+        lines = []
+        for name, (metric_type, help_text) in METRICS.items():
+            names = [name + suffix for suffix in ('_bucket', '_sum', '_count')] if metric_type == 'histogram' else [name]
+            if not any(samples.get(n) for n in names):
+                continue
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for n in names:
+                for labels, value in sorted(samples.get(n, []), key=lambda sample: sample[0]):
+                    lines.append(f"{n}{_format_labels(labels)} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in labels)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(labels, escaped)) + '}'
+
+
+def _format_value(value):
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+registry = Registry()
+
+def _collect_cache_stats():
+    for stats in all_cache_stats():
+        labels = {'cache': stats['name']}
+        yield 'cache_hits_total', labels, stats['hits']
+        yield 'cache_misses_total', labels, stats['misses']
+        yield 'cache_evictions_total', labels, stats['evictions']
+        yield 'cache_entries', labels, stats['size']
+
+registry.register_collector(_collect_cache_stats)
+
+# phase -> seconds, reported as the startup_seconds gauge
+startup_timings = {}
+
+def record_startup(phase, seconds):
+    startup_timings[phase] = seconds
+
+def _collect_startup_timings():
+    for phase, seconds in list(startup_timings.items()):
+        yield 'startup_seconds', {'phase': phase}, seconds
+
+registry.register_collector(_collect_startup_timings)
+
+def inc(name, amount=1, **labels):
+    registry.inc(name, amount, **labels)
+
+def observe(name, value, **labels):
+    registry.observe(name, value, **labels)
+
+def register_collector(collect):
+    registry.register_collector(collect)
+
+def render():
+    return registry.render()
+
+
+def record_timing(name, seconds):
+    """Adds a duration to the current request's Server-Timing breakdown (no-op outside requests)."""
+    if has_request_context():
+        g.setdefault('stage_timings', []).append((name, seconds))
+
+
+@contextmanager
+def span(stage):
+    """Times a stage: observed in stage_duration_seconds and reported in Server-Timing."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        observe('stage_duration_seconds', seconds, stage=stage)
+        record_timing(stage, seconds)
+
+
+def server_timing_header(timings, total):
+    """Builds a Server-Timing value; repeated stages (e.g. artist batches) are summed."""
+    durations = {}
+    counts = defaultdict(int)
+    for name, seconds in timings:
+        durations[name] = durations.get(name, 0) + seconds
+        counts[name] += 1
+    parts = []
+    for name, seconds in durations.items():
+        part = f"{name};dur={seconds * 1000:.1f}"
+        if counts[name] > 1:
+            part += f';desc="{counts[name]}x"'
+        parts.append(part)
+    parts.append(f"total;dur={total * 1000:.1f}")
+    return ', '.join(parts)
+
+
+def init_app(app):
+    """
+    Times every request and template render. If app.config['SERVER_TIMING'] is
+    set, responses carry a Server-Timing header with the request's stages.
+    """
+
+    @app.before_request
+    def start_request_timer():
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def finish_request_timer(response):
+        started = g.pop('request_started', None)
+        if started is None:
+            return response
+        total = time.perf_counter() - started
+        endpoint = request.endpoint or 'unmatched'
+        inc('http_requests_total', endpoint=endpoint, method=request.method, status=str(response.status_code))
+        observe('http_request_duration_seconds', total, endpoint=endpoint)
+        if app.config.get('SERVER_TIMING'):
+            response.headers['Server-Timing'] = server_timing_header(g.get('stage_timings', []), total)
+        return response
+
+    def start_render(sender, template, context, **extra):
+        g.render_started = time.perf_counter()
+
+    def finish_render(sender, template, context, **extra):
+        started = g.pop('render_started', None)
+        if started is not None:
+            seconds = time.perf_counter() - started
+            observe('stage_duration_seconds', seconds, stage='render')
+            record_timing('render', seconds)
+
+    # Signals hold weak references by default; these closures must stay connected
+    before_render_template.connect(start_render, app, weak=False)
+    template_rendered.connect(finish_render, app, weak=False)
@@ -0,0 +1,54 @@
+import numpy as np
+import pandas as pd
+
+
+def membership(collections):
+    """
+    Returns (items, codes, columns) for a list of item collections: items are
+    the distinct items, and each (codes[j], columns[j]) pair says item
+    items[codes[j]] is in collection columns[j]. Pairs are unique, so an item
+    repeated within a collection counts once; None items are dropped.
+    """
+    lengths = [len(c) for c in collections]
+    flat = np.empty(sum(lengths), dtype=object)
+    flat[:] = [item for c in collections for item in c]
+    codes, items = pd.factorize(flat)
+    columns = np.repeat(np.arange(len(collections)), lengths)
+    known = codes >= 0
+    keys = np.unique(codes[known].astype(np.int64) * len(collections) + columns[known])
+    return items, keys // len(collections), keys % len(collections)
+
+
+def overlap_matrix(collections):
+    """
+    Pairwise overlap of collections (e.g. the track IDs of each playlist):
+    'shared'[a][b] counts the items in both a and b, the diagonal being each
+    collection's size, and 'jaccard'[a][b] is shared / union (0 when both are
+    empty). Only items in two or more collections can overlap, so the
+    incidence matrix multiplied with itself is built for those rows alone.
+    """
+    n = len(collections)
+    items, codes, columns = membership(collections)
+    sizes = np.bincount(columns, minlength=n)
+    spread = np.bincount(codes, minlength=len(items))
+
+    overlapping = np.flatnonzero(spread >= 2)
+    rows = np.full(len(items), -1)
+    rows[overlapping] = np.arange(len(overlapping))
+    in_overlap = rows[codes] >= 0
+    incidence = np.zeros((len(overlapping), n), dtype=np.float32) # Exact for counts below 2**24
+    incidence[rows[codes[in_overlap]], columns[in_overlap]] = 1
+    shared = np.rint(incidence.T @ incidence).astype(np.int64)
+    np.fill_diagonal(shared, sizes)
+
+    union = sizes[:, None] + sizes[None, :] - shared
+    jaccard = np.divide(shared, union, out=np.zeros((n, n)), where=union > 0)
+    return {'shared': shared.tolist(), 'jaccard': np.round(jaccard, 3).tolist()}
+
+
+def most_shared(collections, top_n=10):
+    """Returns [(item, collections containing it)] for the top_n items in two or more collections."""
+    items, codes, _ = membership(collections)
+    spread = np.bincount(codes, minlength=len(items))
+    order = np.argsort(-spread, kind='stable')[:top_n]
+    return [(items[i], int(spread[i])) for i in order if spread[i] >= 2]
@@ -0,0 +1,226 @@
+import sys
+import threading
+import weakref
+from collections.abc import Mapping
+
+
+def intern(value):
+    """Interns a string (one shared copy per process); other values pass through."""
+    return sys.intern(value) if type(value) is str else value
+
+
+class _Record:
+    """Immutable slotted record: fields are set once, in __init__."""
+    __slots__ = ()
+
+    def __init__(self, *values):
+        for name, value in zip(self.__slots__, values):
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} records are immutable; the store replaces them instead")
+
+
+class Artist(_Record, Mapping):
+    """
+    An interned artist. Track artists only carry id and name; artists from
+    top-artist lists also carry genres, popularity and images. Reads like the
+    dict records it replaces (artist['name'] or artist.name).
+    """
+    __slots__ = ('id', 'name', 'genres', 'popularity', 'image_url', 'thumb_url', '__weakref__')
+    FIELDS = ('id', 'name', 'genres', 'popularity', 'image_url', 'thumb_url')
+
+    def __init__(self, artist_id, name, genres=(), popularity=None, image_url=None, thumb_url=None):
+        super().__init__(artist_id, name, genres, popularity, image_url, thumb_url)
+
+    def __getitem__(self, key):
+        if key not in self.FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __iter__(self):
+        return iter(self.FIELDS)
+
+    def __len__(self):
+        return len(self.FIELDS)
+
+    def to_json(self):
+        return dict(self, genres=list(self.genres))
+
+
+class Album(_Record):
+    __slots__ = ('name', 'image_url', 'thumb_url', '__weakref__')
+
+    def __init__(self, name, image_url, thumb_url):
+        super().__init__(name, image_url, thumb_url) # image_url: largest image, thumb_url: smallest
+
+
+class Track(_Record, Mapping):
+    """
+    An interned track: its artists and album are references to the shared
+    Artist and Album records. Reads like the playlist track records it
+    replaces ('artists' is the list of artist names, 'artist_id' and
+    'artist_name' are the primary artist's), plus the album's 'image_url'
+    and 'thumb_url'.
+    """
+    __slots__ = ('id', 'name', 'popularity', 'artist_refs', 'album', '__weakref__')
+    FIELDS = ('id', 'name', 'artist_name', 'artists', 'artist_id', 'album_name', 'album_image_url', 'popularity',
+              'image_url', 'thumb_url')
+
+    def __init__(self, track_id, name, popularity, artist_refs, album):
+        super().__init__(track_id, name, popularity, artist_refs, album) # artist_refs: tuple of Artist, primary first
+
+    @property
+    def artists(self):
+        return [artist.name for artist in self.artist_refs]
+
+    @property
+    def artist_id(self):
+        return self.artist_refs[0].id if self.artist_refs else None
+
+    @property
+    def artist_name(self):
+        return self.artist_refs[0].name if self.artist_refs else 'N/A'
+
+    @property
+    def album_name(self):
+        return self.album.name
+
+    @property
+    def album_image_url(self):
+        return self.album.thumb_url
+
+    @property
+    def image_url(self):
+        return self.album.image_url
+
+    @property
+    def thumb_url(self):
+        return self.album.thumb_url
+
+    def __getitem__(self, key):
+        if key not in self.FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __iter__(self):
+        return iter(self.FIELDS)
+
+    def __len__(self):
+        return len(self.FIELDS)
+
+    def to_json(self):
+        return dict(self)
+
+
+class TrackList(tuple):
+    """A collection of interned tracks (e.g. a playlist), in order."""
+    __slots__ = ()
+
+    def columns(self):
+        """Returns the track table columns (see analytics.TRACK_COLUMNS); the strings are the shared ones."""
+        return {
+            'id': [t.id for t in self],
+            'name': [t.name for t in self],
+            'artist_name': [t.artist_name for t in self],
+            'artists': [t.artists for t in self],
+            'artist_id': [t.artist_id for t in self],
+            'popularity': [t.popularity for t in self],
+            'album_name': [t.album.name for t in self],
+            'album_image_url': [t.album.thumb_url for t in self],
+        }
+
+
+class RecordStore:
+    """
+    Process-wide interned track, artist and album records shared by every
+    view and user: a track in a hundred cached playlists (or top-track
+    lists) is one Track, its artists and album one record each, and every ID,
+    name and URL one string. Records are held through weak references, so
+    they are freed as soon as no cached collection uses them. Records are
+    immutable snapshots: when a re-added record brings changed fields
+    (popularity, artist details), a new record replaces it for later adds,
+    and collections built earlier keep the one they were built (and hashed)
+    with.
+    """
+
+    def __init__(self):
+        self._tracks = weakref.WeakValueDictionary()  # Track ID -> Track
+        self._artists = weakref.WeakValueDictionary() # Artist ID (or ('', name) without one) -> Artist
+        self._albums = weakref.WeakValueDictionary()  # (name, smallest image URL) -> Album
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._tracks)
+
+    def stats(self):
+        return {'tracks': len(self._tracks), 'artists': len(self._artists), 'albums': len(self._albums)}
+
+    def add_tracks(self, records):
+        """
+        Interns track records and returns them as a TrackList. Takes playlist
+        or liked-songs records (see spotify_fetch.playlist_track_to_record)
+        and top-track records, whose 'artists' are {'id', 'name'} dicts.
+        """
+        with self._lock:
+            return TrackList([self._track(record) for record in records])
+
+    def add_artists(self, records):
+        """Interns top-artist records (see spotify_fetch.top_artist_to_record). Returns a tuple of Artist."""
+        with self._lock:
+            artists = []
+            for record in records:
+                artist = self._artist(record.get('id'), record.get('name', 'N/A'))
+                details = (tuple(intern(genre) for genre in record.get('genres') or ()), record.get('popularity'),
+                           intern(record.get('image_url')), intern(record.get('thumb_url')))
+                if details != (artist.genres, artist.popularity, artist.image_url, artist.thumb_url):
+                    artist = Artist(artist.id, artist.name, *details)
+                    self._artists[artist.id or ('', artist.name)] = artist
+                artists.append(artist)
+            return tuple(artists)
+
+    def _track(self, record):
+        track_id = record.get('id') or record.get('track_id')
+        track = self._tracks.get(track_id)
+        if track is None:
+            track = Track(intern(track_id), intern(record.get('name', 'N/A')), record.get('popularity') or 0,
+                          self._track_artists(record), self._album(record))
+            self._tracks[track.id] = track
+            return track
+        popularity = track.popularity if record.get('popularity') is None else record['popularity']
+        album = track.album
+        if album.image_url is None and record.get('image_url'):
+            album = self._album(record)
+        if popularity != track.popularity or album is not track.album:
+            track = Track(track.id, track.name, popularity, track.artist_refs, album)
+            self._tracks[track.id] = track
+        return track
+
+    def _track_artists(self, record):
+        artists = record.get('artists') or []
+        if artists and isinstance(artists[0], Mapping): # Top-track records: [{'id', 'name'}, ...]
+            return tuple(self._artist(a.get('id'), a.get('name', 'N/A')) for a in artists)
+        # Playlist/library records: artist names, and the primary artist's ID
+        refs = [self._artist(record.get('artist_id') if i == 0 else None, name) for i, name in enumerate(artists)]
+        if not refs and (record.get('artist_id') or record.get('artist_name')):
+            refs.append(self._artist(record.get('artist_id'), record.get('artist_name') or 'N/A'))
+        return tuple(refs)
+
+    def _artist(self, artist_id, name):
+        key = artist_id or ('', name)
+        artist = self._artists.get(key)
+        if artist is None:
+            artist = Artist(intern(artist_id), intern(name))
+            self._artists[key] = artist
+        return artist
+
+    def _album(self, record):
+        name = record.get('album_name', 'N/A')
+        thumb_url = record.get('thumb_url') or record.get('album_image_url')
+        album = self._albums.get((name, thumb_url))
+        if album is None or (album.image_url is None and record.get('image_url')):
+            # Playlist records only carry the smallest image; a record with the largest one replaces it
+            image_url = record.get('image_url') or (album.image_url if album else None)
+            album = Album(intern(name), intern(image_url), intern(thumb_url))
+            self._albums[(album.name, album.thumb_url)] = album
+        return album
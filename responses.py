@@ -0,0 +1,70 @@
+import gzip
+import hashlib
+import json
+from flask import request, Response
+from cache import json_default
+import metrics
+
+# Smaller bodies are not worth the CPU (and the gzip header overhead)
+GZIP_MIN_BYTES = 1024
+
+
+def json_response(payload, status=200):
+    """
+    Returns payload as compact JSON. Successful responses carry a strong ETag
+    over the body, so a client that sends it back in If-None-Match gets an
+    empty 304, and are gzip-compressed when the client accepts it.
+    """
+    with metrics.span('serialize'):
+        body = json.dumps(payload, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+    response = Response(body, status=status, mimetype='application/json')
+    if status != 200:
+        return response
+
+    etag = hashlib.sha1(body).hexdigest()
+    if len(body) >= GZIP_MIN_BYTES and 'gzip' in request.headers.get('Accept-Encoding', ''):
+        with metrics.span('gzip'):
+            response.set_data(gzip.compress(body, compresslevel=6))
+        response.headers['Content-Encoding'] = 'gzip'
+        etag += '-gzip' # Each encoding is a different representation
+    response.headers['Vary'] = 'Accept-Encoding'
+    # Per-user data: only the browser may keep it, and must revalidate (cheap with the ETag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    response.set_etag(etag)
+    return response.make_conditional(request)
+
+
+def content_hash(value):
+    """
+    Hashes JSON-like data (objects with a to_json() method, such as interned
+    records, hash as its result). Stable across processes, so every worker
+    derives the same version from the same data.
+    """
+    body = json.dumps(value, sort_keys=True, separators=(',', ':'), ensure_ascii=False, default=json_default)
+    return hashlib.sha1(body.encode('utf-8')).hexdigest()
+
+
+def cached_page(cache, key, dependencies, render):
+    """
+    Returns the HTML page render() produces, rendering it only when what it
+    shows has changed: dependencies (content hashes of the data, and any
+    other values the page shows) are hashed into a version, and a body cached
+    under key for the same version is served as is. Pages carry a strong ETag
+    over the body, so a browser revalidating an unchanged page gets an empty
+    304.
+    """
+    version = content_hash(dependencies)
+    entry = cache.get(key, None)
+    outcome = 'cached'
+    if entry is None or entry['version'] != version:
+        body = render()
+        entry = {'version': version, 'etag': hashlib.sha1(body.encode('utf-8')).hexdigest(), 'body': body}
+        cache.set(key, entry)
+        outcome = 'rendered'
+    response = Response(entry['body'], mimetype='text/html')
+    response.headers['Cache-Control'] = 'private, no-cache'
+    response.set_etag(entry['etag'])
+    response = response.make_conditional(request)
+    metrics.inc('rendered_pages_total', page=request.endpoint,
+                result='not_modified' if response.status_code == 304 else outcome)
+    return response
@@ -0,0 +1,290 @@
+import heapq
+import json
+import logging
+import os
+import re
+import secrets
+import threading
+import time
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+from db import ThreadLocalSQLite
+import metrics
+
+SESSION_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{43}$') # secrets.token_urlsafe(32)
+
+
+class StoredSession(CallbackDict, SessionMixin):
+    """Server-side session: the cookie only carries the random session id."""
+
+    def __init__(self, initial=None, sid=None, new=False, expires_at=0):
+        def on_update(self):
+            self.modified = True
+            self.accessed = True
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.expires_at = expires_at
+        self.modified = False
+        self.accessed = False
+        self.rotate = False
+
+    def __getitem__(self, key):
+        self.accessed = True
+        return super().__getitem__(key)
+
+    def get(self, key, default=None):
+        self.accessed = True
+        return super().get(key, default)
+
+    def setdefault(self, key, default=None):
+        self.accessed = True
+        return super().setdefault(key, default)
+
+    def clear(self):
+        # Login and logout clear the session; both get a fresh id (no session fixation)
+        self.rotate = True
+        super().clear()
+
+
+# --- Backends ---
+
+class SQLiteSessionStore:
+    """Sessions in one SQLite table with an index on expiry, shared by all workers on the host."""
+    backend = 'sqlite'
+
+    def __init__(self, path):
+        self._db = ThreadLocalSQLite(path)
+        conn = self._db.connection()
+        with conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS sessions ("
+                         "sid TEXT PRIMARY KEY, data TEXT NOT NULL, expires_at REAL NOT NULL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS sessions_expires ON sessions (expires_at)")
+
+    def load(self, sid):
+        """Returns (data, expires_at), or None if the session is missing or expired."""
+        row = self._db.connection().execute(
+            "SELECT data, expires_at FROM sessions WHERE sid = ? AND expires_at > ?", (sid, time.time())).fetchone()
+        return (json.loads(row[0]), row[1]) if row else None
+
+    def save(self, sid, data, expires_at):
+        with self._db.connection() as conn:
+            conn.execute("INSERT OR REPLACE INTO sessions (sid, data, expires_at) VALUES (?, ?, ?)",
+                         (sid, json.dumps(data), expires_at))
+
+    def touch(self, sid, expires_at):
+        with self._db.connection() as conn:
+            conn.execute("UPDATE sessions SET expires_at = ? WHERE sid = ?", (expires_at, sid))
+
+    def delete(self, sid):
+        with self._db.connection() as conn:
+            conn.execute("DELETE FROM sessions WHERE sid = ?", (sid,))
+
+    def sweep(self, batch_size=1000):
+        """Deletes expired sessions in small batches (short write locks). Returns how many."""
+        conn = self._db.connection()
+        removed = 0
+        while True:
+            with conn:
+                deleted = conn.execute("DELETE FROM sessions WHERE sid IN (SELECT sid FROM sessions "
+                                       "WHERE expires_at <= ? LIMIT ?)", (time.time(), batch_size)).rowcount
+            removed += deleted
+            if deleted < batch_size:
+                return removed
+
+
+class MemorySessionStore:
+    """Sessions in a dict with an expiry heap; per process, so only for a single worker."""
+    backend = 'memory'
+
+    def __init__(self):
+        self._sessions = {} # sid -> (data, expires_at)
+        self._expiry = []   # (expires_at, sid); stale entries are skipped when swept
+        self._lock = threading.Lock()
+
+    def load(self, sid):
+        with self._lock:
+            entry = self._sessions.get(sid)
+        if entry is None or entry[1] <= time.time():
+            return None
+        return json.loads(entry[0]), entry[1]
+
+    def save(self, sid, data, expires_at):
+        # Stored serialized, like the other backends, so callers never share mutable state
+        with self._lock:
+            self._sessions[sid] = (json.dumps(data), expires_at)
+            heapq.heappush(self._expiry, (expires_at, sid))
+
+    def touch(self, sid, expires_at):
+        with self._lock:
+            entry = self._sessions.get(sid)
+            if entry is not None:
+                self._sessions[sid] = (entry[0], expires_at)
+                heapq.heappush(self._expiry, (expires_at, sid))
+
+    def delete(self, sid):
+        with self._lock:
+            self._sessions.pop(sid, None)
+
+    def sweep(self):
+        now = time.time()
+        removed = 0
+        with self._lock:
+            while self._expiry and self._expiry[0][0] <= now:
+                expires_at, sid = heapq.heappop(self._expiry)
+                entry = self._sessions.get(sid)
+                if entry is not None and entry[1] <= now:
+                    del self._sessions[sid]
+                    removed += 1
+        return removed
+
+
+class RedisSessionStore:
+    """Sessions as Redis keys with a TTL, for several hosts; Redis expires them itself."""
+    backend = 'redis'
+
+    def __init__(self, url, prefix='session:'):
+        import redis # Optional dependency, only needed for this backend
+        self._redis = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def load(self, sid):
+        pipe = self._redis.pipeline()
+        pipe.get(self.prefix + sid)
+        pipe.pttl(self.prefix + sid)
+        data, ttl_ms = pipe.execute()
+        if data is None:
+            return None
+        return json.loads(data), time.time() + max(ttl_ms, 0) / 1000
+
+    def save(self, sid, data, expires_at):
+        self._redis.set(self.prefix + sid, json.dumps(data), px=max(1, int((expires_at - time.time()) * 1000)))
+
+    def touch(self, sid, expires_at):
+        self._redis.pexpire(self.prefix + sid, max(1, int((expires_at - time.time()) * 1000)))
+
+    def delete(self, sid):
+        self._redis.delete(self.prefix + sid)
+
+    def sweep(self):
+        return 0
+
+
+def create_store(backend, path=None, redis_url=None):
+    if backend == 'sqlite':
+        if not path:
+            raise ValueError("The sqlite session backend needs a path.")
+        return SQLiteSessionStore(path)
+    if backend == 'memory':
+        return MemorySessionStore()
+    if backend == 'redis':
+        return RedisSessionStore(redis_url)
+    raise ValueError(f"Unknown session backend '{backend}'.")
+
+
+# --- Flask integration ---
+
+class StoredSessionInterface(SessionInterface):
+    """
+    Keeps sessions in a store with a sliding idle timeout. Only the keys in
+    persist_keys are stored, so sessions stay small. The expiry is pushed
+    forward at most every touch_interval seconds, so plain page views do not
+    write to the store. A sweeper thread removes expired sessions.
+    """
+
+    def __init__(self, store, persist_keys, idle_timeout=7 * 24 * 3600, sweep_interval=300, touch_interval=3600):
+        self.store = store
+        self.persist_keys = frozenset(persist_keys)
+        self.idle_timeout = idle_timeout
+        self.sweep_interval = sweep_interval
+        self.touch_interval = min(touch_interval, idle_timeout // 2)
+        self._sweeper_pid = None
+        self._warned_keys = set()
+        self._lock = threading.Lock()
+
+    def _ensure_sweeper(self):
+        # Started lazily, and again in each forked worker
+        if self._sweeper_pid == os.getpid() or not self.sweep_interval:
+            return
+        with self._lock:
+            if self._sweeper_pid == os.getpid():
+                return
+            self._sweeper_pid = os.getpid()
+            threading.Thread(target=self._sweep_forever, name='session-sweeper', daemon=True).start()
+
+    def _sweep_forever(self):
+        while True:
+            time.sleep(self.sweep_interval)
+            try:
+                removed = self.store.sweep()
+                if removed:
+                    metrics.inc('sessions_expired_total', removed, backend=self.store.backend)
+                    logging.info(f"Removed {removed} expired sessions.")
+            except Exception as e:
+                logging.warning(f"Session sweep failed: {e}")
+
+    def open_session(self, app, request):
+        self._ensure_sweeper()
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid and SESSION_ID_PATTERN.match(sid):
+            with metrics.span('session_load'):
+                stored = self.store.load(sid)
+            if stored is not None:
+                data, expires_at = stored
+                return StoredSession(data, sid=sid, expires_at=expires_at)
+        # Never adopt an unknown id from the client
+        return StoredSession(sid=secrets.token_urlsafe(32), new=True)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        secure = self.get_cookie_secure(app)
+        samesite = self.get_cookie_samesite(app)
+        httponly = self.get_cookie_httponly(app)
+        if session.accessed:
+            response.vary.add('Cookie')
+
+        if session.rotate and not session.new:
+            self.store.delete(session.sid)
+            session.sid = secrets.token_urlsafe(32)
+            session.new = True
+
+        if not session:
+            if session.rotate or (session.modified and not session.new):
+                response.delete_cookie(name, domain=domain, path=path, secure=secure,
+                                       samesite=samesite, httponly=httponly)
+            return
+
+        now = time.time()
+        expires_at = now + self.idle_timeout
+        if session.modified or session.new:
+            data = {key: value for key, value in session.items() if key in self.persist_keys}
+            self._warn_dropped_keys(session)
+            with metrics.span('session_save'):
+                self.store.save(session.sid, data, expires_at)
+        elif session.expires_at - now < self.idle_timeout - self.touch_interval:
+            with metrics.span('session_save'):
+                self.store.touch(session.sid, expires_at)
+
+        if session.new or self.should_set_cookie(app, session):
+            response.set_cookie(name, session.sid, expires=self.get_expiration_time(app, session),
+                                domain=domain, path=path, secure=secure, samesite=samesite, httponly=httponly)
+
+    def _warn_dropped_keys(self, session):
+        dropped = set(session.keys()) - self.persist_keys - self._warned_keys
+        if dropped:
+            self._warned_keys |= dropped
+            logging.warning(f"Session keys {sorted(dropped)} are not persisted; keep large data out of the session.")
+
+
+def init_app(app, persist_keys):
+    """Installs the server-side session backend chosen by app.config['SESSION_BACKEND']."""
+    store = create_store(app.config['SESSION_BACKEND'],
+                         path=app.config.get('SESSION_SQLITE_PATH'),
+                         redis_url=app.config.get('SESSION_REDIS_URL'))
+    app.session_interface = StoredSessionInterface(store, persist_keys,
+                                                   idle_timeout=app.config['SESSION_IDLE_TIMEOUT'],
+                                                   sweep_interval=app.config['SESSION_SWEEP_INTERVAL'])
+    logging.info(f"Using the {store.backend} session backend.")
+    return app.session_interface
@@ -0,0 +1,52 @@
+import time
+from db import ThreadLocalSQLite
+
+
+class SignatureStore:
+    """
+    MinHash signatures of playlist versions (SQLite), keyed by (playlist_id,
+    snapshot_id) and shared by all users: a playlist is only refetched for
+    near-duplicate search once its snapshot changes. Signatures are opaque
+    bytes here (see similarity.py); scheme names how they were built, and
+    rows of another scheme are treated as missing.
+    """
+
+    def __init__(self, path):
+        self._db = ThreadLocalSQLite(path)
+        conn = self._db.connection()
+        with conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS playlist_signatures ("
+                         "playlist_id TEXT NOT NULL, snapshot_id TEXT NOT NULL, scheme TEXT NOT NULL, "
+                         "tracks INTEGER NOT NULL, artists INTEGER NOT NULL, "
+                         "track_signature BLOB NOT NULL, artist_signature BLOB NOT NULL, updated_at REAL NOT NULL, "
+                         "PRIMARY KEY (playlist_id, snapshot_id)) WITHOUT ROWID")
+
+    def put(self, playlist_id, snapshot_id, scheme, tracks, artists, track_signature, artist_signature):
+        """Stores the signatures of a playlist version, replacing those of its older versions."""
+        conn = self._db.connection()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute("DELETE FROM playlist_signatures WHERE playlist_id = ? AND snapshot_id != ?",
+                         (playlist_id, snapshot_id))
+            conn.execute("INSERT OR REPLACE INTO playlist_signatures (playlist_id, snapshot_id, scheme, tracks, "
+                         "artists, track_signature, artist_signature, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                         (playlist_id, snapshot_id, scheme, tracks, artists, track_signature, artist_signature,
+                          time.time()))
+
+    def get_many(self, versions, scheme):
+        """
+        Returns {(playlist_id, snapshot_id): row} for the stored versions among
+        versions, where row is a dict with 'tracks', 'artists',
+        'track_signature' and 'artist_signature'.
+        """
+        versions = list(versions)
+        found = {}
+        conn = self._db.connection()
+        for start in range(0, len(versions), 400): # Two variables per version, below SQLite's limit
+            chunk = versions[start:start + 400]
+            where = ' OR '.join(['(playlist_id = ? AND snapshot_id = ?)'] * len(chunk))
+            params = [value for version in chunk for value in version]
+            for row in conn.execute("SELECT playlist_id, snapshot_id, tracks, artists, track_signature, artist_signature "
+                                    f"FROM playlist_signatures WHERE scheme = ? AND ({where})", [scheme] + params):
+                found[(row[0], row[1])] = dict(zip(['tracks', 'artists', 'track_signature', 'artist_signature'], row[2:]))
+        return found
@@ -0,0 +1,104 @@
+import hashlib
+from collections import defaultdict
+from itertools import combinations
+import numpy as np
+
+# Signature layout: NUM_PERM 32-bit minimums, split into BANDS bands of ROWS rows for LSH.
+# Two sets share a band (and become candidates) with probability 1 - (1 - J**ROWS)**BANDS,
+# e.g. 0.9998 at Jaccard 0.7 and 0.003 at 0.1.
+NUM_PERM = 128
+BANDS = 32
+ROWS = NUM_PERM // BANDS
+SEED = 20240601
+# Stored signatures are only comparable with ones built the same way
+SCHEME = f'minhash-{NUM_PERM}-{SEED}'
+
+_rng = np.random.default_rng(SEED)
+_MULTIPLIERS = _rng.integers(1, 2 ** 63, size=NUM_PERM, dtype=np.uint64) * np.uint64(2) + np.uint64(1) # Odd
+_OFFSETS = _rng.integers(0, 2 ** 63, size=NUM_PERM, dtype=np.uint64)
+_EMPTY = np.full(NUM_PERM, np.iinfo(np.uint32).max, dtype=np.uint32)
+
+
+def hash_items(items):
+    """Hashes string IDs to uint64, stably across processes (unlike hash())."""
+    digests = b''.join(hashlib.blake2b(item.encode(), digest_size=8).digest() for item in items)
+    return np.frombuffer(digests, dtype='<u8')
+
+
+def minhash(items, chunk_size=4096):
+    """
+    Returns the MinHash signature (NUM_PERM uint32) of a set of string IDs.
+    Each permutation is a multiply-shift hash of the item hashes (uint64
+    arithmetic wraps); items are processed in chunks to bound memory.
+    """
+    hashes = hash_items(sorted(set(items)))
+    signature = _EMPTY.copy()
+    for start in range(0, len(hashes), chunk_size):
+        chunk = hashes[start:start + chunk_size, None]
+        permuted = ((chunk * _MULTIPLIERS + _OFFSETS) >> np.uint64(32)).astype(np.uint32)
+        np.minimum(signature, permuted.min(axis=0), out=signature)
+    return signature
+
+
+def to_bytes(signature):
+    return signature.astype('<u4').tobytes()
+
+
+def from_bytes(data):
+    return np.frombuffer(data, dtype='<u4')
+
+
+def estimate_jaccard(a, b):
+    """Estimated Jaccard similarity of the sets behind two signatures (share of equal minimums)."""
+    return float(np.count_nonzero(a == b)) / NUM_PERM
+
+
+class LSHIndex:
+    """
+    Banded locality-sensitive hashing over MinHash signatures: each band of
+    ROWS minimums is a bucket key, and keys sharing any bucket are candidate
+    near-duplicates. Lookups touch one bucket per band, however many
+    signatures are indexed.
+    """
+
+    def __init__(self):
+        self._buckets = [defaultdict(list) for _ in range(BANDS)]
+        self._signatures = {}
+
+    def __len__(self):
+        return len(self._signatures)
+
+    def add(self, key, signature):
+        self._signatures[key] = signature
+        for band, bucket in enumerate(self._band_keys(signature)):
+            self._buckets[band][bucket].append(key)
+
+    def query(self, signature, threshold=0.0):
+        """Returns [(key, estimated Jaccard)] of indexed candidates at or above threshold, most similar first."""
+        candidates = {key for band, bucket in enumerate(self._band_keys(signature))
+                      for key in self._buckets[band].get(bucket, ())}
+        return self._ranked(((key, estimate_jaccard(signature, self._signatures[key])) for key in candidates),
+                            threshold)
+
+    def candidate_pairs(self):
+        """Returns the set of (key, key) pairs sharing at least one bucket, each pair ordered as added."""
+        order = {key: i for i, key in enumerate(self._signatures)}
+        pairs = set()
+        for buckets in self._buckets:
+            for keys in buckets.values():
+                if len(keys) > 1:
+                    pairs.update(combinations(sorted(keys, key=order.get), 2))
+        return pairs
+
+    def near_duplicates(self, threshold):
+        """Returns [((key, key), estimated Jaccard)] of candidate pairs at or above threshold, most similar first."""
+        return self._ranked((((a, b), estimate_jaccard(self._signatures[a], self._signatures[b]))
+                             for a, b in self.candidate_pairs()), threshold)
+
+    @staticmethod
+    def _band_keys(signature):
+        return [signature[band * ROWS:(band + 1) * ROWS].tobytes() for band in range(BANDS)]
+
+    @staticmethod
+    def _ranked(scored, threshold):
+        return sorted((item for item in scored if item[1] >= threshold), key=lambda item: -item[1])
@@ -0,0 +1,198 @@
+import logging
+import os
+import random
+import re
+import threading
+import time
+import requests
+import spotipy
+import metrics
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Defaults for the process-wide HTTP layer; override with configure()
+DEFAULT_SETTINGS = {
+    'rate': 10.0,       # Sustained requests per second across all threads
+    'burst': 20,        # Requests allowed back to back before the rate applies
+    'pool_size': 32,    # Keep-alive connections kept per host
+    'max_retries': 4,   # Retries of a 429/5xx response before giving up
+    'max_wait': 60,     # Longest Retry-After we are willing to sleep through (seconds)
+    'api_prefix': None, # Web API base URL override, e.g. a local stand-in for benchmarks
+}
+
+# Server errors worth retrying with backoff (429 is handled separately via Retry-After)
+RETRY_STATUSES = (500, 502, 503, 504)
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: acquire() blocks until a request may be sent so
+    that all threads together stay under `rate` requests per second, with
+    bursts of up to `capacity`.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # Take the token now (possibly going negative) so waiting threads queue up fairly
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0
+        if wait > 0:
+            time.sleep(wait)
+
+
+class SpotifyHTTPSession(requests.Session):
+    """
+    requests.Session shared by every Spotipy client in the process. Keeps a
+    pool of keep-alive connections, paces requests with a shared token bucket
+    and, on 429, pauses all threads for the server's Retry-After (plus jitter)
+    before retrying instead of failing. 5xx responses are retried with
+    jittered exponential backoff. Authorization is sent per request by
+    Spotipy, so one session serves every user.
+    """
+
+    def __init__(self, rate=DEFAULT_SETTINGS['rate'], burst=DEFAULT_SETTINGS['burst'],
+                 pool_size=DEFAULT_SETTINGS['pool_size'], max_retries=DEFAULT_SETTINGS['max_retries'],
+                 max_wait=DEFAULT_SETTINGS['max_wait']):
+        super().__init__()
+        self.limiter = TokenBucket(rate, burst)
+        self.max_retries = max_retries
+        self.max_wait = max_wait
+        self.throttled = 0 # 429 responses received
+        self.retries = 0   # Requests re-sent after a 429/5xx
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+        # Connection errors are retried by urllib3; status codes are handled in request()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size,
+                              max_retries=Retry(total=2, read=False, status=0, backoff_factor=0.3,
+                                                respect_retry_after_header=False, raise_on_status=False))
+        self.mount('https://', adapter)
+        self.mount('http://', adapter)
+
+    def request(self, method, url, *args, **kwargs):
+        attempt = 0
+        while True:
+            self._wait_for_pause()
+            self.limiter.acquire()
+            start = time.perf_counter()
+            response = super().request(method, url, *args, **kwargs)
+            self._record(url, response, time.perf_counter() - start)
+            if response.status_code != 429 and response.status_code not in RETRY_STATUSES:
+                return response
+            if attempt >= self.max_retries:
+                logging.error(f"Giving up on {method} {url} after {attempt} retries (HTTP {response.status_code}).")
+                return response
+
+            if response.status_code == 429:
+                self.throttled += 1
+                delay = _retry_after_seconds(response)
+                if delay is None:
+                    delay = 2 ** attempt
+                if delay > self.max_wait:
+                    logging.error(f"Spotify asked to wait {delay}s before retrying {url}; not waiting.")
+                    return response
+                # Rate limits apply to the whole app, so every thread pauses, not just this one
+                self._pause(delay * (1 + random.uniform(0, 0.25)))
+                logging.warning(f"Rate limited by Spotify (429); retrying {url} in ~{delay}s "
+                                f"(attempt {attempt + 1}/{self.max_retries}).")
+            else:
+                delay = min(self.max_wait, 0.5 * 2 ** attempt) * random.uniform(0.5, 1.5)
+                logging.warning(f"Spotify returned HTTP {response.status_code} for {url}; retrying in {delay:.1f}s "
+                                f"(attempt {attempt + 1}/{self.max_retries}).")
+                time.sleep(delay)
+            response.close()
+            attempt += 1
+            self.retries += 1
+            metrics.inc('spotify_retries_total', reason='429' if response.status_code == 429 else '5xx')
+
+    def _record(self, url, response, seconds):
+        endpoint = _endpoint_label(url)
+        metrics.inc('spotify_requests_total', endpoint=endpoint, status=str(response.status_code))
+        metrics.inc('spotify_response_bytes_total', len(response.content), endpoint=endpoint)
+        metrics.observe('spotify_request_duration_seconds', seconds, endpoint=endpoint)
+        metrics.record_timing('spotify', seconds)
+
+    def _pause(self, seconds):
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def _wait_for_pause(self):
+        while True:
+            with self._lock:
+                wait = self._paused_until - time.monotonic()
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+    def close(self):
+        # Spotipy closes its session when a client is garbage collected; the
+        # shared pool must outlive the per-request clients, so this is a no-op.
+        pass
+
+    def shutdown(self):
+        """Actually closes the pooled connections."""
+        super().close()
+
+
+def _endpoint_label(url):
+    """Reduces an API URL to its path words ('/v1/playlists/<id>/tracks' -> 'playlists/tracks')."""
+    path = requests.utils.urlparse(url).path
+    words = [part for part in path.split('/') if _PATH_WORD.match(part)]
+    return '/'.join(words) or '/'
+
+_PATH_WORD = re.compile(r'^[a-z_-]+$')
+
+
+def _retry_after_seconds(response):
+    """Parses the Retry-After header (seconds); returns None if absent or invalid."""
+    value = response.headers.get('Retry-After')
+    try:
+        return max(0, int(value))
+    except (TypeError, ValueError):
+        return None
+
+
+_settings = dict(DEFAULT_SETTINGS)
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+
+
+def configure(**settings):
+    """Sets rate/burst/pool_size/max_retries/max_wait (and api_prefix) for the shared session."""
+    global _session
+    unknown = set(settings) - set(DEFAULT_SETTINGS)
+    if unknown:
+        raise ValueError(f"Unknown Spotify HTTP settings: {', '.join(sorted(unknown))}")
+    with _session_lock:
+        _settings.update(settings)
+        _session = None # Rebuilt with the new settings on next use
+
+
+def get_http_session():
+    """Returns the process-wide SpotifyHTTPSession (recreated after a fork)."""
+    global _session, _session_pid
+    with _session_lock:
+        if _session is None or _session_pid != os.getpid():
+            _session = SpotifyHTTPSession(**{k: v for k, v in _settings.items() if k != 'api_prefix'})
+            _session_pid = os.getpid()
+            logging.info(f"Created shared Spotify HTTP session ({_settings['rate']} req/s, burst {_settings['burst']}, "
+                         f"pool {_settings['pool_size']}).")
+        return _session
+
+
+def make_client(**kwargs):
+    """Creates a spotipy.Spotify (user token or client credentials) on the shared session."""
+    client = spotipy.Spotify(requests_session=get_http_session(), **kwargs)
+    if _settings['api_prefix']:
+        client.prefix = _settings['api_prefix']
+    return client
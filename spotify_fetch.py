@@ -0,0 +1,204 @@
+import logging
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# Result of a paginated fetch: items in API order, the reported total and the
+# offsets of any pages that still failed after retrying.
+PagedFetch = namedtuple('PagedFetch', ['items', 'total', 'failed_offsets'])
+
+DEFAULT_MAX_WORKERS = 8
+DEFAULT_PAGE_RETRIES = 1
+
+
+def _fetch_page_with_retries(fetch_page, offset, max_retries):
+    """Calls fetch_page(offset), retrying up to max_retries times on error."""
+    attempt = 0
+    while True:
+        try:
+            return fetch_page(offset)
+        except Exception as e:
+            if attempt >= max_retries:
+                raise
+            attempt += 1
+            logging.warning(f"Retrying page at offset {offset} (attempt {attempt}/{max_retries}) after error: {e}")
+
+
+def fetch_remaining_pages(fetch_page, total, page_size, start_offset, on_page,
+                          max_workers=DEFAULT_MAX_WORKERS, max_retries=DEFAULT_PAGE_RETRIES):
+    """
+    Fetches every page from start_offset up to total with a bounded worker pool.
+    fetch_page(offset) must return the list of items for that page. Each page is
+    handed to on_page(offset, items) in the calling thread as soon as it arrives
+    (not necessarily in order) and is not kept afterwards.
+    Returns the sorted offsets of pages that failed after retrying.
+    """
+    offsets = list(range(start_offset, total, page_size))
+    failed_offsets = []
+    if not offsets:
+        return failed_offsets
+
+    workers = max(1, min(max_workers, len(offsets)))
+    logging.info(f"Fetching {len(offsets)} remaining pages with {workers} workers...")
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(_fetch_page_with_retries, fetch_page, offset, max_retries): offset
+                   for offset in offsets}
+        for future in as_completed(futures):
+            # Drop our reference so the page can be freed once it is consumed
+            offset = futures.pop(future)
+            try:
+                items = future.result()
+            except Exception as e:
+                # Keep the pages that did arrive; the caller decides what a gap means
+                logging.error(f"Giving up on page at offset {offset}: {e}")
+                failed_offsets.append(offset)
+                continue
+            on_page(offset, items)
+
+    failed_offsets.sort()
+    return failed_offsets
+
+
+def fetch_pages(fetch_page, page_size, on_page, max_workers=DEFAULT_MAX_WORKERS, max_retries=DEFAULT_PAGE_RETRIES,
+                progress=None):
+    """
+    Streams a paginated endpoint page by page: the first page is requested
+    directly to learn 'total', then the remaining offsets are fetched
+    concurrently. fetch_page(offset) must return the raw API response (a dict
+    with 'items' and 'total'); on_page(offset, items) receives every page.
+    Errors on the first page are raised to the caller. If given, progress (a
+    jobs.Job) gets 'pages_total' and 'pages_fetched' updates.
+    Returns (total, failed_offsets).
+    """
+    if progress:
+        # Count pages for the job status as they are consumed
+        consume_page = on_page
+        def on_page(offset, items):
+            consume_page(offset, items)
+            progress.incr('pages_fetched')
+
+    first_page = fetch_page(0)
+    first_items = first_page.get('items', []) or []
+    total = first_page.get('total') or len(first_items)
+    if progress:
+        progress.set('pages_total', max(1, -(-total // page_size)))
+    on_page(0, first_items)
+
+    if len(first_items) < page_size or total <= len(first_items):
+        return total, []
+
+    failed_offsets = fetch_remaining_pages(
+        lambda offset: fetch_page(offset).get('items', []) or [],
+        total, page_size, page_size, on_page, max_workers=max_workers, max_retries=max_retries)
+    return total, failed_offsets
+
+
+def fetch_all_pages(fetch_page, page_size, max_workers=DEFAULT_MAX_WORKERS, max_retries=DEFAULT_PAGE_RETRIES,
+                    progress=None, on_page=None):
+    """
+    Like fetch_pages(), but collects every item and returns a PagedFetch with
+    the items reassembled in API order. on_page(offset, items), if given, still
+    sees each page as it arrives.
+    """
+    pages = {}
+    def collect(offset, items):
+        pages[offset] = items
+        if on_page:
+            on_page(offset, items)
+    total, failed_offsets = fetch_pages(fetch_page, page_size, collect, max_workers=max_workers,
+                                        max_retries=max_retries, progress=progress)
+
+    items = []
+    for offset in sorted(pages):
+        items.extend(pages[offset])
+    return PagedFetch(items, total, failed_offsets)
+
+
+def fetch_saved_tracks(sp, max_workers=DEFAULT_MAX_WORKERS, page_size=50):
+    """Fetches the current user's whole saved-tracks library (newest first)."""
+    return fetch_all_pages(
+        lambda offset: sp.current_user_saved_tracks(limit=page_size, offset=offset),
+        page_size, max_workers=max_workers)
+
+
+def fetch_user_playlists(sp, max_workers=DEFAULT_MAX_WORKERS, page_size=50):
+    """Fetches the simplified playlist objects (with snapshot_id) of every playlist the current user has."""
+    return fetch_all_pages(
+        lambda offset: sp.current_user_playlists(limit=page_size, offset=offset),
+        page_size, max_workers=max_workers)
+
+
+# Projection for playlist metadata (skips the embedded first page of tracks)
+PLAYLIST_METADATA_FIELDS = 'name, owner(display_name), description, images, external_urls, snapshot_id'
+
+# Projection used for playlist items; 'total' is required to plan the concurrent fetch
+PLAYLIST_ITEM_FIELDS = 'items(track(id, name, popularity, artists(id, name), album(name, images))), total, next'
+
+
+def fetch_playlist_tracks(sp, playlist_id, fields=PLAYLIST_ITEM_FIELDS, max_workers=DEFAULT_MAX_WORKERS, page_size=100,
+                          progress=None, on_page=None):
+    """
+    Fetches all tracks of a playlist in playlist order (max page size is 100).
+    Local files and unavailable (null) tracks are dropped.
+    Returns a PagedFetch whose items are the track objects. on_page(offset,
+    items) receives the raw playlist items of each page as it arrives.
+    """
+    result = fetch_all_pages(
+        lambda offset: sp.playlist_items(playlist_id, limit=page_size, offset=offset, fields=fields),
+        page_size, max_workers=max_workers, progress=progress, on_page=on_page)
+    # Filter out None tracks or tracks without ID (can happen with local files)
+    tracks = [item['track'] for item in result.items if item and item.get('track') and item['track'].get('id')]
+    return PagedFetch(tracks, result.total, result.failed_offsets)
+
+
+def primary_artist_ids(items):
+    """Returns the primary artist IDs of a page of saved-track or playlist items."""
+    ids = []
+    for item in items:
+        track = item.get('track') if item else None
+        artists = (track or {}).get('artists') or []
+        if artists and artists[0].get('id'):
+            ids.append(artists[0]['id'])
+    return ids
+
+
+def playlist_track_to_record(track):
+    """Converts a playlist track object into the compact record used for analysis."""
+    artists = track.get('artists') or []
+    album = track.get('album') or {}
+    return {
+        'id': track['id'],
+        'name': track.get('name', 'N/A'),
+        'artist_name': artists[0]['name'] if artists else 'N/A', # Simplified primary artist
+        'artists': [a.get('name', 'N/A') for a in artists],
+        'artist_id': artists[0]['id'] if artists and artists[0].get('id') else None,
+        'album_name': album.get('name', 'N/A'),
+        'album_image_url': album['images'][-1].get('url') if album.get('images') else None, # Smallest image
+        'popularity': track.get('popularity', 0)
+    }
+
+
+def top_artist_to_record(artist):
+    """Converts a top-artist object into the fields the dashboard shows."""
+    images = artist.get('images') or []
+    return {
+        'id': artist.get('id'),
+        'name': artist.get('name', 'N/A'),
+        'genres': artist.get('genres', []),
+        'popularity': artist.get('popularity'),
+        'image_url': images[0].get('url') if images else None, # Largest image
+        'thumb_url': images[-1].get('url') if images else None, # Smallest image
+    }
+
+
+def top_track_to_record(track):
+    """Converts a top-track object into the fields the dashboard shows."""
+    album = track.get('album') or {}
+    images = album.get('images') or []
+    return {
+        'id': track.get('id'),
+        'name': track.get('name', 'N/A'),
+        'artists': [{'id': a.get('id'), 'name': a.get('name', 'N/A')} for a in track.get('artists', [])],
+        'album_name': album.get('name', 'N/A'),
+        'image_url': images[0].get('url') if images else None, # Largest image
+        'thumb_url': images[-1].get('url') if images else None, # Smallest image
+    }
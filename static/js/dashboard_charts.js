@@ -5,44 +5,47 @@ console.log("dashboard_charts.js script started"); // Log: Script execution begi
 document.addEventListener('DOMContentLoaded', function() {
     console.log("DOM Content Loaded event fired"); // Log: DOM is ready
 
-    // Check if the main data object exists (it's created in the HTML script tag)
-    if (typeof dashboardVizData !== 'undefined' && dashboardVizData) {
-        // Log the received data structure for verification
-        console.log("dashboardVizData found:", JSON.stringify(dashboardVizData, null, 2)); // Pretty print JSON for readability
+    // The chart data comes from the JSON API; its URL is set on the charts container
+    const chartsContainer = document.getElementById('dashboard-charts');
+    if (!chartsContainer || !chartsContainer.dataset.apiUrl) {
+        console.warn("No dashboard charts container on this page. Cannot render charts.");
+        return;
+    }
 
-        try {
+    fetch(chartsContainer.dataset.apiUrl)
+        .then(response => {
+            if (!response.ok) {
+                throw new Error(`HTTP error! status: ${response.status}`);
+            }
+            return response.json();
+        })
+        .then(data => {
+            console.log("Dashboard chart data loaded:", data);
             // Call the main function to render all charts
-            renderDashboardCharts(dashboardVizData);
+            renderDashboardCharts(data);
             console.log("renderDashboardCharts function finished successfully."); // Log: Chart rendering attempted
-        } catch (error) {
-            // Catch any unexpected errors during the chart rendering process
-            console.error("Error calling renderDashboardCharts:", error);
-        }
-    } else {
-        // Log a warning if the data object is missing
-        console.warn("dashboardVizData is undefined, null, or empty. Cannot render charts.");
-
-        // Optionally display a message in the chart divs if data is missing
-        const chartDivIds = ['top_artists_chart', 'top_tracks_chart', 'top_genres_chart'];
-        chartDivIds.forEach(divId => {
-            const element = document.getElementById(divId);
-            // Add message only if the element exists and doesn't already have specific content
-            if (element && element.innerHTML.trim() === '') {
-                 element.innerHTML = '<p>Could not load chart data. Data object missing.</p>';
-            }
+        })
+        .catch(error => {
+            console.error("Error loading dashboard chart data:", error);
+            // Display a message in the chart divs if data is missing
+            const chartDivIds = ['top_artists_chart', 'top_tracks_chart', 'top_genres_chart'];
+            chartDivIds.forEach(divId => {
+                const element = document.getElementById(divId);
+                // Add message only if the element exists and doesn't already have specific content
+                if (element && element.innerHTML.trim() === '') {
+                     element.innerHTML = '<p>Could not load chart data.</p>';
+                }
+            });
         });
-    }
 });
 
 /**
  * Renders the Top Artists, Top Tracks, and Top Genres charts using Plotly.
- * @param {object} data - The visualization data object passed from the backend.
+ * @param {object} data - The chart data from /api/v1/dashboard/<time_range>.
  * Expected structure:
  * {
- * artists_chart: [ { name: 'Artist Name', track_count: N, ... }, ... ],
- * tracks_chart: [ { name: 'Track Name', artists: ['Artist'], rank: N, ... }, ... ],
- * genres_chart: [ ['Genre Name', count], ... ],
- * // artists_raw and tracks_raw are also present but not used directly here
+ * time_range: 'medium_term',
+ * genres_chart: [ ['Genre Name', count], ... ]
  * }
  */
 function renderDashboardCharts(data) {
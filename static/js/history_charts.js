@@ -0,0 +1,65 @@
+// static/js/history_charts.js
+
+document.addEventListener('DOMContentLoaded', function() {
+    // The daily series comes from the JSON API; its URL is set on the charts container
+    const chartsContainer = document.getElementById('history-charts');
+    if (!chartsContainer || !chartsContainer.dataset.apiUrl) {
+        return;
+    }
+
+    fetch(chartsContainer.dataset.apiUrl)
+        .then(response => {
+            if (!response.ok) {
+                throw new Error(`HTTP error! status: ${response.status}`);
+            }
+            return response.json();
+        })
+        .then(data => renderHistoryCharts(data))
+        .catch(error => {
+            console.error("Error loading listening history chart data:", error);
+            document.getElementById('history_daily_chart').innerHTML = '<p>Could not load your listening history.</p>';
+        });
+});
+
+/**
+ * Renders the charts of the Listening History page.
+ * @param {object} data - The history from /api/v1/history.
+ * Expected structure:
+ * {
+ * summary: { plays, hours_listened, current_streak, longest_streak, ... },
+ * daily: [ { day: 'YYYY-MM-DD', plays: N, minutes: N }, ... ]
+ * }
+ */
+function renderHistoryCharts(data) {
+    // --- Plays per Day ---
+    try {
+        const daily = data.daily || [];
+        const days = daily.map(d => d.day);
+        const playsTrace = {
+            x: days,
+            y: daily.map(d => d.plays),
+            name: 'Plays',
+            type: 'bar',
+            marker: { color: '#1DB954' }
+        };
+        const minutesTrace = {
+            x: days,
+            y: daily.map(d => d.minutes),
+            name: 'Minutes',
+            yaxis: 'y2',
+            type: 'scatter', mode: 'lines', line: { color: '#0d6efd' }
+        };
+        const layout = {
+            yaxis: { title: 'Plays', automargin: true },
+            yaxis2: { title: 'Minutes', overlaying: 'y', side: 'right', automargin: true },
+            xaxis: { automargin: true },
+            legend: { orientation: 'h' },
+            margin: { l: 60, r: 60, b: 60, t: 30 },
+            hoverlabel: { bgcolor: "#FFF", font: { color: "#000" } }
+        };
+        Plotly.newPlot('history_daily_chart', [playsTrace, minutesTrace], layout, {responsive: true});
+    } catch (e) {
+        console.error("Error rendering plays per day chart:", e);
+        document.getElementById('history_daily_chart').innerHTML = '<p>Error displaying the plays per day chart.</p>';
+    }
+}
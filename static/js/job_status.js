@@ -0,0 +1,61 @@
+document.addEventListener('DOMContentLoaded', function() {
+    const statusBox = document.getElementById('job-status');
+    if (!statusBox) {
+        return;
+    }
+    const statusUrl = statusBox.dataset.statusUrl;
+    const doneUrl = statusBox.dataset.doneUrl;
+    const statusText = statusBox.querySelector('.job-status-text');
+    const detailText = statusBox.querySelector('.job-status-detail');
+
+    // Builds the "pages fetched / artists resolved" line from the job's progress counters
+    function describeProgress(progress) {
+        const parts = [];
+        if (progress.playlists_total) {
+            parts.push(`Playlists fetched: ${progress.playlists_fetched || 0} / ${progress.playlists_total}`);
+        }
+        if (progress.pages_total) {
+            parts.push(`Pages fetched: ${progress.pages_fetched || 0} / ${progress.pages_total}`);
+        }
+        if (progress.artists_total) {
+            parts.push(`Artists resolved: ${progress.artists_resolved || 0} / ${progress.artists_total}`);
+        }
+        if (progress.stage) {
+            parts.push(`Stage: ${progress.stage}`);
+        }
+        return parts.join(' · ');
+    }
+
+    function pollJob() {
+        fetch(statusUrl)
+            .then(response => {
+                if (response.status === 404) {
+                    // Job is gone (finished long ago or handled by another worker): just reload
+                    return { status: 'done' };
+                }
+                if (!response.ok) {
+                    throw new Error(`HTTP error! status: ${response.status}`);
+                }
+                return response.json();
+            })
+            .then(job => {
+                console.log("Job status:", job);
+                if (job.status === 'done') {
+                    window.location.href = doneUrl;
+                } else if (job.status === 'failed') {
+                    statusBox.classList.add('error-message');
+                    statusText.textContent = `Error: ${job.error || 'The analysis failed.'}`;
+                    detailText.textContent = '';
+                } else {
+                    detailText.textContent = describeProgress(job.progress || {});
+                    setTimeout(pollJob, 1000);
+                }
+            })
+            .catch(error => {
+                console.error('Error polling job status:', error);
+                setTimeout(pollJob, 3000); // Back off a little and keep trying
+            });
+    }
+
+    pollJob();
+});
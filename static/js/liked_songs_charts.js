@@ -5,35 +5,63 @@ console.log("liked_songs_charts.js script started");
 document.addEventListener('DOMContentLoaded', function() {
     console.log("Liked Songs Page: DOM Content Loaded");
 
-    // Check if the data object specific to this page exists
-    if (typeof likedSongsVizData !== 'undefined' && likedSongsVizData) {
-        console.log("likedSongsVizData found:", JSON.stringify(likedSongsVizData, null, 2));
-        try {
-            renderLikedSongsCharts(likedSongsVizData);
+    // The chart data comes from the JSON API; its URL is set on the charts container
+    const chartsContainer = document.getElementById('liked-charts');
+    if (!chartsContainer || !chartsContainer.dataset.apiUrl) {
+        console.warn("No liked songs charts on this page. Cannot render charts.");
+        return;
+    }
+
+    fetch(chartsContainer.dataset.apiUrl)
+        .then(response => {
+            if (!response.ok) {
+                throw new Error(`HTTP error! status: ${response.status}`);
+            }
+            return response.json();
+        })
+        .then(data => {
+            console.log("Liked songs chart data loaded:", data);
+            renderLikedSongsCharts(data);
             console.log("renderLikedSongsCharts function finished.");
-        } catch (error) {
-            console.error("Error calling renderLikedSongsCharts:", error);
-        }
-    } else {
-        console.warn("likedSongsVizData is undefined or null. Cannot render charts.");
-        // Optional: display message in chart divs if needed
-         const likedChartDivs = ['liked_top_artists_chart', 'liked_top_genres_chart'];
-         likedChartDivs.forEach(divId => {
-             const element = document.getElementById(divId);
-             if (element && element.innerHTML.trim() === '') {
-                  element.innerHTML = '<p>Could not load chart data for liked songs.</p>';
-             }
-         });
+        })
+        .catch(error => {
+            console.error("Error loading liked songs chart data:", error);
+            const likedChartDivs = ['liked_top_artists_chart', 'liked_top_genres_chart'];
+            likedChartDivs.forEach(divId => {
+                const element = document.getElementById(divId);
+                if (element && element.innerHTML.trim() === '') {
+                     element.innerHTML = '<p>Could not load chart data for liked songs.</p>';
+                }
+            });
+        });
+
+    // The saves timeline has its own endpoint, so the main charts do not wait for it
+    const timelineContainer = document.getElementById('liked-timeline');
+    if (timelineContainer && timelineContainer.dataset.apiUrl) {
+        fetch(timelineContainer.dataset.apiUrl)
+            .then(response => {
+                if (!response.ok) {
+                    throw new Error(`HTTP error! status: ${response.status}`);
+                }
+                return response.json();
+            })
+            .then(data => renderTimelineCharts(data))
+            .catch(error => {
+                console.error("Error loading liked songs timeline:", error);
+                document.getElementById('liked_saves_per_month_chart').innerHTML = '<p>Could not load the timeline of your saves.</p>';
+            });
     }
 });
 
 /**
  * Renders charts specific to the Liked Songs page.
- * @param {object} data - The visualization data object for liked songs.
+ * @param {object} data - The chart data from /api/v1/liked_songs.
  * Expected structure:
  * {
  * top_artists: [ { artist: 'Artist Name', count: N }, ... ],
- * top_genres: [ { genre: 'Genre Name', count: N }, ... ]
+ * top_genres: [ { genre: 'Genre Name', count: N }, ... ],
+ * top_followed_artists: [ { name: 'Artist Name', followers: N }, ... ],
+ * bottom_followed_artists: [ { name: 'Artist Name', followers: N }, ... ]
  * }
  */
 function renderLikedSongsCharts(data) {
@@ -150,6 +178,12 @@ function renderLikedSongsCharts(data) {
 
             console.log("Plotting liked genres chart...");
             Plotly.newPlot('liked_top_genres_chart', [genreTrace], genreLayout, {responsive: true});
+            // Clicking a bar lists the liked tracks in that genre (served from the precomputed genre index)
+            document.getElementById('liked_top_genres_chart').on('plotly_click', event => {
+                if (event.points && event.points.length > 0) {
+                    showGenreTracks(event.points[0].x);
+                }
+            });
             console.log("Liked genres chart plotted.");
         } else {
              console.log("No liked genres data to plot.");
@@ -159,4 +193,119 @@ function renderLikedSongsCharts(data) {
          console.error("Error rendering liked genres chart:", error);
          document.getElementById('liked_top_genres_chart').innerHTML = '<p>Error displaying liked genres chart.</p>';
     }
-}
\ No newline at end of file
+}
+
+/**
+ * Lists the liked tracks of a genre below the genres chart.
+ * @param {string} genre - The clicked genre.
+ */
+function showGenreTracks(genre) {
+    const chartsContainer = document.getElementById('liked-charts');
+    const target = document.getElementById('liked_genre_tracks');
+    if (!chartsContainer || !chartsContainer.dataset.genreTracksUrl || !target) {
+        return;
+    }
+    const url = `${chartsContainer.dataset.genreTracksUrl}?genre=${encodeURIComponent(genre)}&limit=50`;
+    fetch(url)
+        .then(response => {
+            if (!response.ok) {
+                throw new Error(`HTTP error! status: ${response.status}`);
+            }
+            return response.json();
+        })
+        .then(data => {
+            target.replaceChildren();
+            const heading = document.createElement('h3');
+            heading.textContent = `${data.genre}: ${data.total} track(s)` +
+                (data.total > data.tracks.length ? ` (first ${data.tracks.length} shown)` : '');
+            const list = document.createElement('ol');
+            data.tracks.forEach(track => {
+                const item = document.createElement('li');
+                item.textContent = `${track.name} by ${track.artist_name}`;
+                list.appendChild(item);
+            });
+            target.append(heading, list);
+        })
+        .catch(error => {
+            console.error(`Error loading tracks for genre ${genre}:`, error);
+            target.textContent = 'Could not load the tracks of this genre.';
+        });
+}
+
+/**
+ * Renders the saves timeline of the Liked Songs page.
+ * @param {object} data - The timeline from /api/v1/liked_songs/timeline.
+ * Expected structure:
+ * {
+ * months: [ { month: 'YYYY-MM', count: N }, ... ],
+ * weeks: [ { week: 'YYYY-MM-DD' (Monday), count: N }, ... ],
+ * years: [ { year: YYYY, count: N, top_artists: [ { artist, count } ], top_genres: [ { genre, count } ], drift: 0..1 or null }, ... ]
+ * }
+ */
+function renderTimelineCharts(data) {
+    const savesLayout = {
+        yaxis: { title: 'Songs Saved', automargin: true },
+        xaxis: { automargin: true },
+        margin: { l: 60, r: 30, b: 60, t: 30 },
+        hoverlabel: { bgcolor: "#FFF", font: { color: "#000" } }
+    };
+
+    // --- Saves per Month / Week ---
+    const periodCharts = [
+        { divId: 'liked_saves_per_month_chart', periods: data.months || [], key: 'month', color: '#1DB954' },
+        { divId: 'liked_saves_per_week_chart', periods: data.weeks || [], key: 'week', color: '#0d6efd' }
+    ];
+    periodCharts.forEach(chart => {
+        try {
+            if (chart.periods.length > 0) {
+                const trace = {
+                    x: chart.periods.map(p => p[chart.key]),
+                    y: chart.periods.map(p => p.count),
+                    type: 'bar',
+                    marker: { color: chart.color }
+                };
+                Plotly.newPlot(chart.divId, [trace], savesLayout, {responsive: true});
+            } else { document.getElementById(chart.divId).innerHTML = '<p>No dated saves.</p>'; }
+        } catch (e) { console.error(`Error rendering ${chart.divId}:`, e); }
+    });
+
+    // --- Taste Drift by Year ---
+    const years = data.years || [];
+    try {
+        const drifting = years.filter(y => y.drift !== null);
+        if (drifting.length > 0) {
+            const trace = {
+                x: drifting.map(y => String(y.year)),
+                y: drifting.map(y => y.drift),
+                type: 'scatter', mode: 'lines+markers', marker: { color: '#FFC107' }
+            };
+            const layout = {
+                yaxis: { title: 'Drift from Previous Year', range: [0, 1], automargin: true },
+                xaxis: { type: 'category', automargin: true },
+                margin: { l: 60, r: 30, b: 50, t: 30 }
+            };
+            Plotly.newPlot('liked_taste_drift_chart', [trace], layout, {responsive: true});
+        } else { document.getElementById('liked_taste_drift_chart').innerHTML = '<p>Not enough years with genre data yet.</p>'; }
+    } catch (e) { console.error("Error rendering taste drift chart:", e); }
+
+    // --- Years Table (newest first) ---
+    const tableBody = document.getElementById('liked_years_table_body');
+    tableBody.replaceChildren();
+    years.slice().reverse().forEach(y => {
+        const row = document.createElement('tr');
+        [
+            String(y.year),
+            y.count.toLocaleString(),
+            y.top_artists.map(a => `${a.artist} (${a.count})`).join(', '),
+            y.top_genres.map(g => g.genre).join(', ')
+        ].forEach(text => {
+            const cell = document.createElement('td');
+            cell.textContent = text;
+            row.appendChild(cell);
+        });
+        tableBody.appendChild(row);
+    });
+    if (years.length === 0) {
+        tableBody.innerHTML = '<tr><td colspan="4">No dated saves.</td></tr>';
+    }
+}
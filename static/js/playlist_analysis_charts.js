@@ -5,38 +5,48 @@ console.log("playlist_analysis_charts.js script started");
 document.addEventListener('DOMContentLoaded', function() {
     console.log("Playlist Analysis Page: DOM Content Loaded");
 
-    // Check if the data object specific to this page exists
-    // Note the variable name matches the one embedded in playlist_analysis.html
-    if (typeof playlistAnalysisVizData !== 'undefined' && playlistAnalysisVizData) {
-        console.log("playlistAnalysisVizData found:", JSON.stringify(playlistAnalysisVizData, null, 2));
-        try {
-            renderPlaylistAnalysisCharts(playlistAnalysisVizData);
-            console.log("renderPlaylistAnalysisCharts function finished.");
-        } catch (error) {
-            console.error("Error calling renderPlaylistAnalysisCharts:", error);
-        }
-    } else {
-        console.warn("playlistAnalysisVizData is undefined or null. Cannot render charts.");
-         const playlistChartDivs = ['playlist_top_artists_chart', 'playlist_top_genres_chart'];
-         playlistChartDivs.forEach(divId => {
-             const element = document.getElementById(divId);
-             // Add message only if div exists and is empty (and no error message already shown)
-             if (element && element.innerHTML.trim() === '' && !document.querySelector('.error-message')) {
-                  element.innerHTML = '<p>Chart data not available for this playlist.</p>';
-             }
-         });
+    // The chart data comes from the JSON API; its URL is set on the charts container
+    const chartsContainer = document.getElementById('playlist-charts');
+    if (!chartsContainer || !chartsContainer.dataset.apiUrl) {
+        console.warn("No playlist charts on this page. Cannot render charts.");
+        return;
     }
+
+    fetch(chartsContainer.dataset.apiUrl)
+        .then(response => {
+            if (!response.ok) {
+                throw new Error(`HTTP error! status: ${response.status}`);
+            }
+            return response.json();
+        })
+        .then(data => {
+            console.log("Playlist chart data loaded:", data);
+            renderPlaylistAnalysisCharts(data);
+            console.log("renderPlaylistAnalysisCharts function finished.");
+        })
+        .catch(error => {
+            console.error("Error loading playlist chart data:", error);
+            const playlistChartDivs = ['playlist_top_artists_chart', 'playlist_top_genres_chart'];
+            playlistChartDivs.forEach(divId => {
+                const element = document.getElementById(divId);
+                // Add message only if div exists and is empty (and no error message already shown)
+                if (element && element.innerHTML.trim() === '' && !document.querySelector('.error-message')) {
+                     element.innerHTML = '<p>Chart data not available for this playlist.</p>';
+                }
+            });
+        });
 });
 
 
 /**
  * Renders charts specific to the Playlist Analysis page.
- * @param {object} data - The visualization data object for the analyzed playlist.
+ * @param {object} data - The chart data from /api/v1/playlists/<playlist_id>.
  * Expected structure:
  * {
  * top_artists: [ { artist: 'Artist Name', count: N }, ... ],
  * top_genres: [ { genre: 'Genre Name', count: N }, ... ],
- * // total_tracks, unique_artists, unique_genres also present but not used here
+ * top_followed_artists: [ { name: 'Artist Name', followers: N }, ... ],
+ * bottom_followed_artists: [ { name: 'Artist Name', followers: N }, ... ]
  * }
  */
 function renderPlaylistAnalysisCharts(data) {
@@ -0,0 +1,64 @@
+// static/js/playlist_compare_charts.js
+
+document.addEventListener('DOMContentLoaded', function() {
+    // The comparison comes from the JSON API; its URL is set on the charts container
+    const chartsContainer = document.getElementById('compare-charts');
+    if (!chartsContainer || !chartsContainer.dataset.apiUrl) {
+        return;
+    }
+
+    fetch(chartsContainer.dataset.apiUrl)
+        .then(response => {
+            if (!response.ok) {
+                throw new Error(`HTTP error! status: ${response.status}`);
+            }
+            return response.json();
+        })
+        .then(data => renderCompareCharts(data))
+        .catch(error => {
+            console.error("Error loading playlist comparison data:", error);
+            ['compare_tracks_chart', 'compare_artists_chart', 'compare_genres_chart'].forEach(divId => {
+                document.getElementById(divId).innerHTML = '<p>Chart data not available for this comparison.</p>';
+            });
+        });
+});
+
+/**
+ * Renders the overlap heatmaps of the Compare Playlists page.
+ * @param {object} data - The comparison from /api/v1/playlist_batches/<batch_id>.
+ * Expected structure:
+ * {
+ * playlists: [ { id, name, ... }, ... ],
+ * overlap: { tracks: { shared: [[N, ...], ...], jaccard: [[0.5, ...], ...] }, artists: {...}, genres: {...} }
+ * }
+ */
+function renderCompareCharts(data) {
+    const names = (data.playlists || []).map(p => p.name);
+    const charts = { tracks: 'compare_tracks_chart', artists: 'compare_artists_chart', genres: 'compare_genres_chart' };
+
+    Object.entries(charts).forEach(([kind, divId]) => {
+        try {
+            const overlap = (data.overlap || {})[kind];
+            if (!overlap || names.length === 0) {
+                document.getElementById(divId).innerHTML = '<p>No data</p>';
+                return;
+            }
+            const trace = {
+                z: overlap.jaccard,
+                x: names,
+                y: names,
+                customdata: overlap.shared,
+                hovertemplate: `%{y} & %{x}<br>%{customdata} shared ${kind}<br>Overlap: %{z:.0%}<extra></extra>`,
+                type: 'heatmap',
+                zmin: 0, zmax: 1,
+                colorscale: [[0, '#f8f9fa'], [1, '#1DB954']] // Spotify green
+            };
+            const layout = {
+                xaxis: { automargin: true, tickangle: -30 },
+                yaxis: { automargin: true, autorange: 'reversed' },
+                margin: { l: 150, r: 30, b: 120, t: 30 }
+            };
+            Plotly.newPlot(divId, [trace], layout, {responsive: true});
+        } catch (e) { console.error(`Error rendering ${kind} overlap chart:`, e); }
+    });
+}
@@ -0,0 +1,140 @@
+from collections import Counter
+import numpy as np
+import pandas as pd
+from analytics import top_k_indices
+from record_store import intern
+
+# Spotify's added_at format, e.g. '2023-11-14T20:13:20Z'
+ADDED_AT_FORMAT = '%Y-%m-%dT%H:%M:%S%z'
+
+
+def added_at_periods(values):
+    """
+    Parses added_at strings in one vectorized pass (no per-row datetime calls)
+    and buckets them. Returns (valid, years, months, weeks): valid marks the
+    parseable values, and the int64 arrays cover only those. Months count from
+    1970-01, weeks (starting on Monday) from the week of 1970-01-01.
+    """
+    stamps = pd.to_datetime(pd.Series(values, dtype=object), format=ADDED_AT_FORMAT, utc=True, errors='coerce')
+    valid = stamps.notna().to_numpy()
+    stamps = stamps.dt.tz_localize(None).to_numpy()[valid]
+    days = stamps.astype('datetime64[D]').astype(np.int64)
+    months = stamps.astype('datetime64[M]').astype(np.int64)
+    years = stamps.astype('datetime64[Y]').astype(np.int64) + 1970
+    weeks = (days + 3) // 7 # 1970-01-01 was a Thursday
+    return valid, years, months, weeks
+
+
+def _count_into(counter, codes):
+    values, counts = np.unique(codes, return_counts=True)
+    for value, count in zip(values.tolist(), counts.tolist()):
+        counter[value] += count
+
+
+class SavesTimeline:
+    """
+    When the tracks of a liked-songs library were saved, kept as running
+    counts per month, per week and per (year, primary artist). add() folds in
+    a chunk of records, so new saves only cost their own parse; result()
+    turns the buckets into the timeline charts using the artist table for
+    genres. version is the library version the buckets reflect.
+    """
+
+    def __init__(self, version=None):
+        self.version = version
+        self.total = 0                # Records added, dated or not
+        self.undated = 0              # Records without a parseable added_at
+        self.month_counts = Counter() # Month code -> saves
+        self.week_counts = Counter()  # Week code -> saves
+        self.year_counts = Counter()  # Year -> saves
+        self.year_artists = {}        # Year -> Counter(primary artist ID -> saves)
+        self.artist_names = {}        # Primary artist ID -> name
+
+    def add(self, records):
+        """Folds a chunk of track records ('added_at', 'artist_id', 'artist_name') into the buckets."""
+        if not records:
+            return
+        valid, years, months, weeks = added_at_periods([r.get('added_at') for r in records])
+        self.total += len(records)
+        self.undated += len(records) - int(np.count_nonzero(valid))
+        _count_into(self.month_counts, months)
+        _count_into(self.week_counts, weeks)
+        _count_into(self.year_counts, years)
+
+        # Count (year, artist) pairs as one integer key per dated track
+        artist_codes, artist_ids = pd.factorize(np.array([r.get('artist_id') for r in records], dtype=object))
+        dated_codes = artist_codes[valid]
+        has_artist = dated_codes >= 0
+        if has_artist.any():
+            first_year = int(years.min())
+            keys, counts = np.unique((years[has_artist] - first_year) * len(artist_ids) + dated_codes[has_artist],
+                                     return_counts=True)
+            for key, count in zip(keys.tolist(), counts.tolist()):
+                year, code = divmod(key, len(artist_ids))
+                self.year_artists.setdefault(first_year + year, Counter())[intern(artist_ids[code])] += count
+
+        # Names of artists seen for the first time, from their first record in the chunk
+        codes, first_rows = np.unique(artist_codes, return_index=True)
+        for code, row in zip(codes.tolist(), first_rows.tolist()):
+            if code >= 0 and artist_ids[code] not in self.artist_names:
+                self.artist_names[intern(artist_ids[code])] = intern(records[row].get('artist_name'))
+
+    def result(self, artists, top_n=5, recent_weeks=104):
+        """
+        Returns the timeline for the liked-songs page:
+        'months' and 'weeks' list saves per period, contiguous (empty periods
+        are 0), with weeks limited to the last recent_weeks; 'years' gives each
+        year's saves, top artists and top genres (weighted by tracks) and its
+        taste 'drift': the cosine distance between its genre mix and the
+        previous year's (0 = same mix, 1 = no genres in common, None if either
+        year has no genres).
+        """
+        timeline = {'months': [], 'weeks': [], 'years': [], 'undated': self.undated}
+        if not self.month_counts:
+            return timeline
+
+        months = np.arange(min(self.month_counts), max(self.month_counts) + 1)
+        labels = np.datetime_as_string(months.astype('datetime64[M]'), unit='M')
+        timeline['months'] = [{'month': label, 'count': self.month_counts.get(m, 0)}
+                              for label, m in zip(labels.tolist(), months.tolist())]
+
+        last_week = max(self.week_counts)
+        weeks = np.arange(max(min(self.week_counts), last_week - recent_weeks + 1), last_week + 1)
+        labels = np.datetime_as_string((weeks * 7 - 3).astype('datetime64[D]'), unit='D') # Monday of each week
+        timeline['weeks'] = [{'week': label, 'count': self.week_counts.get(w, 0)}
+                             for label, w in zip(labels.tolist(), weeks.tolist())]
+
+        years = sorted(self.year_counts)
+        genre_names, year_genres = self._year_genre_matrix(years, artists)
+        norms = np.linalg.norm(year_genres, axis=1)
+        for i, year in enumerate(years):
+            artist_counts = self.year_artists.get(year, Counter())
+            genre_counts = year_genres[i]
+            top_genres = [g for g in top_k_indices(genre_counts, top_n) if genre_counts[g] > 0]
+            drift = None
+            if i > 0 and norms[i] > 0 and norms[i - 1] > 0:
+                similarity = year_genres[i] @ year_genres[i - 1] / (norms[i] * norms[i - 1])
+                drift = round(float(1 - similarity), 3)
+            timeline['years'].append({
+                'year': year,
+                'count': self.year_counts[year],
+                'top_artists': [{'artist': self.artist_names.get(aid) or 'N/A', 'count': count}
+                                for aid, count in artist_counts.most_common(top_n)],
+                'top_genres': [{'genre': genre_names[g], 'count': int(genre_counts[g])} for g in top_genres],
+                'drift': drift,
+            })
+        return timeline
+
+    def _year_genre_matrix(self, years, artists):
+        """Returns (genre_names, years x genres matrix of saves), each artist's saves counting for its genres."""
+        pairs = pd.DataFrame([(year, aid, count) for year, counts in self.year_artists.items()
+                              for aid, count in counts.items()], columns=['year', 'artist_id', 'count'])
+        artist_genres = artists[['id', 'genres']].explode('genres').dropna(subset=['genres'])
+        merged = pairs.merge(artist_genres, left_on='artist_id', right_on='id')
+        if merged.empty:
+            return [], np.zeros((len(years), 0))
+        genre_codes, genre_names = pd.factorize(merged['genres'])
+        year_rows = pd.Index(years).get_indexer(merged['year'])
+        matrix = np.zeros((len(years), len(genre_names)))
+        np.add.at(matrix, (year_rows, genre_codes), merged['count'].to_numpy(dtype=float))
+        return list(genre_names), matrix
@@ -0,0 +1,114 @@
+import hashlib
+import logging
+import threading
+import time
+
+
+class _Flight:
+    """One in-progress refresh that other requests can wait on."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class TokenRefresher:
+    """
+    Keeps access tokens fresh with at most one refresh per grant at a time.
+
+    Tokens within `margin` seconds of expiry are refreshed on the request path:
+    the first request refreshes and concurrent requests for the same refresh
+    token wait for its result instead of calling the token endpoint again.
+    Tokens within `proactive_margin` seconds of expiry are refreshed on a
+    background thread while the request continues with the still-valid token,
+    so page requests normally never wait on a refresh.
+
+    Refreshed tokens are stored in `cache` under a hash of the refresh token.
+    Later requests (and other workers, with a shared cache backend) pick them
+    up from there; the caller writes them back to its session.
+    """
+
+    def __init__(self, refresh_fn, cache, margin=60, proactive_margin=300, wait_timeout=15):
+        self.refresh_fn = refresh_fn # refresh_token -> new token_info
+        self.cache = cache
+        self.margin = margin
+        self.proactive_margin = proactive_margin
+        self.wait_timeout = wait_timeout
+        self._flights = {} # grant key -> _Flight
+        self._lock = threading.Lock()
+
+    def _key(self, refresh_token):
+        return hashlib.sha256(refresh_token.encode('utf-8')).hexdigest()
+
+    def get_valid_token(self, token_info):
+        """
+        Returns token_info, or a newer token for the same grant if one exists
+        or had to be fetched. Raises if a required refresh fails.
+        """
+        refresh_token = token_info.get('refresh_token')
+        if not refresh_token:
+            return token_info
+        now = time.time()
+        if token_info.get('expires_at', 0) - now > self.proactive_margin:
+            return token_info
+
+        key = self._key(refresh_token)
+        # Already refreshed by another request, a background refresh or another worker
+        newer = self.cache.get(key, None)
+        if newer and newer.get('expires_at', 0) > token_info.get('expires_at', 0):
+            token_info = newer
+            if token_info['expires_at'] - now > self.proactive_margin:
+                return token_info
+
+        if token_info.get('expires_at', 0) - now < self.margin:
+            logging.info("Token expired, refreshing (single-flight).")
+            return self._refresh(key, refresh_token)
+
+        self._refresh_in_background(key, refresh_token)
+        return token_info
+
+    def _refresh(self, key, refresh_token):
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+
+        if not leader:
+            # Someone else is already refreshing this grant; use their result
+            if not flight.done.wait(self.wait_timeout):
+                raise TimeoutError("Timed out waiting for a concurrent token refresh.")
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            token_info = self.refresh_fn(refresh_token)
+            ttl = max(1, int(token_info.get('expires_at', 0) - time.time()))
+            self.cache.set(key, token_info, ttl=ttl)
+            flight.result = token_info
+            logging.info("Token refreshed successfully.")
+            return token_info
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    def _refresh_in_background(self, key, refresh_token):
+        with self._lock:
+            if key in self._flights:
+                return
+
+        def refresh_quietly():
+            try:
+                self._refresh(key, refresh_token)
+            except Exception as e:
+                # The request path retries once the token is actually about to expire
+                logging.warning(f"Background token refresh failed: {e}")
+
+        logging.info("Token expires soon, refreshing in the background.")
+        threading.Thread(target=refresh_quietly, name='token-refresh', daemon=True).start()